@@ -1,16 +1,21 @@
 import os
+import logging
 import sqlite3
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
-import requests
 import uuid
-import xlsxwriter
 import io
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
+import metrics
+import static_assets
+import compression
+import json_provider
+import fragment_cache
+import session_store
+import thumbnails
+import log_config
 
 # 导入各个子系统的路由模块
 from routes.purchase_routes import register_purchase_routes
@@ -26,40 +31,37 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 UPLOAD_FOLDER = os.path.join(STATIC_DIR, 'uploads')
 DB_FILE = os.path.join(DATA_DIR, 'restaurant.db')
 
-# 确保所需目录存在
-for directory in [DATA_DIR, STATIC_DIR, TEMPLATES_DIR, UPLOAD_FOLDER]:
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-# 确保合同上传目录存在
 CONTRACTS_UPLOAD_DIR = os.path.join(UPLOAD_FOLDER, 'contracts')
-if not os.path.exists(CONTRACTS_UPLOAD_DIR):
-    os.makedirs(CONTRACTS_UPLOAD_DIR)
-
-# 确保静态资源目录存在
 IMAGES_DIR = os.path.join(STATIC_DIR, 'images')
-if not os.path.exists(IMAGES_DIR):
-    os.makedirs(IMAGES_DIR)
+
+def ensure_directories():
+    """确保所需目录存在"""
+    for directory in [DATA_DIR, STATIC_DIR, TEMPLATES_DIR, UPLOAD_FOLDER, CONTRACTS_UPLOAD_DIR, IMAGES_DIR]:
+        os.makedirs(directory, exist_ok=True)
 
 # 创建默认图片（如果不存在）
+# 默认图片及其占位颜色
+DEFAULT_IMAGES = {
+    'purchase.jpg': (70, 130, 180),
+    'inventory.jpg': (60, 179, 113),
+    'sales.jpg': (205, 92, 92),
+    'special.jpg': (218, 165, 32),
+    'default-logo.png': (128, 128, 128),
+}
+DEFAULT_IMAGE_SIZE = (640, 400)
+
 def create_default_images():
-    # 需要的图片文件列表
-    required_images = [
-        'purchase.jpg',
-        'inventory.jpg',
-        'sales.jpg',
-        'special.jpg',
-        'default-logo.png'
-    ]
-    
-    for img_name in required_images:
+    from PIL import Image
+
+    for img_name, color in DEFAULT_IMAGES.items():
         img_path = os.path.join(IMAGES_DIR, img_name)
         
-        # 如果图片不存在，创建一个空文件
-        if not os.path.exists(img_path):
-            with open(img_path, 'w') as f:
-                f.write('')
-            print(f"创建了空白图片文件: {img_path}")
+        # 图片不存在或是早期版本留下的空文件时，生成纯色占位图
+        if not os.path.exists(img_path) or not os.path.getsize(img_path):
+            Image.new('RGB', DEFAULT_IMAGE_SIZE, color).save(img_path)
+            logger.info("创建了占位图片: %s", img_path)
+    # 为默认图片补生成缩略图（已是最新的跳过）
+    thumbnails.backfill(['images'], STATIC_DIR)
 
 # 数据库连接函数
 def get_db_connection():
@@ -75,7 +77,7 @@ def get_db_connection():
         conn.create_function('local_now', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         return conn
     except Exception as e:
-        print(f"Error connecting to database: {str(e)}")
+        logger.exception("Error connecting to database: %s", e)
         raise
 
 # 添加 nl2br 过滤器
@@ -85,6 +87,10 @@ def nl2br(value):
         return ''
     return value.replace('\n', '<br>')
 
+# 日志经队列由后台线程输出，级别与格式见 log_config
+log_config.configure_logging()
+logger = logging.getLogger('app')
+
 # 配置Flask应用
 app = Flask(__name__,
            static_folder=STATIC_DIR,
@@ -93,17 +99,34 @@ app.secret_key = 'restaurant_management_system_secret_key'
 
 # 添加 nl2br 过滤器到模板环境
 app.jinja_env.filters['nl2br'] = nl2br
+# 模板片段缓存：{% cache 名称, cache_version %}...{% endcache %}
+fragment_cache.init_app(app)
 
 # 会话配置
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
-app.config['SESSION_TYPE'] = 'filesystem'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200MB max-limit
+# 会话只在内容变化时写回；SESSION_TYPE=sqlite 时存到服务端（见 session_store.py）
+session_store.init_app(app)
+
+# 请求耗时与定时任务指标，Prometheus 从 /metrics 抓取
+metrics.init_app(app, 'main')
+# 静态资源使用构建生成的指纹文件名、预压缩版本和长缓存（python -m static_assets build）
+assets = static_assets.StaticAssets(app)
+# 文本响应按 Accept-Encoding 压缩（级别见 compression.py 的环境变量）
+compression.init_app(app)
+# jsonify 使用 orjson 编码（未安装时回退到标准库），大列表流式输出
+json_provider.init_app(app)
+# 响应式缩略图（模板中使用 responsive_image）
+thumbnails.init_app(app)
 app.config['DB_FILE'] = DB_FILE
 
 # 确保每个请求前session中都有username和角色信息
 @app.before_request
 def ensure_username():
+    # 静态资源、API 和指标接口不读写会话
+    if session_store.is_sessionless():
+        return
     if 'username' not in session:
         # 设置默认管理员用户和其他必要会话信息
         session['username'] = 'admin'
@@ -116,8 +139,6 @@ def ensure_username():
             'system_manage'
         ]
         session['logged_in'] = True  # 添加登录状态标记
-        # 确保每次请求都刷新会话时间
-        session.modified = True
 
 # 主页
 @app.route('/')
@@ -131,24 +152,18 @@ def logout():
     flash('您已退出登录', 'success')
     return redirect(url_for('home'))
 
-# 静态文件服务
-@app.route('/static/<path:filename>')
-def serve_static(filename):
-    # 移除路径中可能存在的 'static/' 前缀
-    if filename.startswith('static/'):
-        filename = filename[7:]
-    return send_from_directory(STATIC_DIR, filename)
-
-# 注册各个子系统的路由
-register_purchase_routes(app)
-register_inventory_routes(app)
-register_sales_routes(app)
-register_special_routes(app)
-
-# 创建定时任务调度器
-scheduler = BackgroundScheduler()
-scheduler.start()
+def create_app():
+    """应用工厂：创建目录、默认图片并注册各子系统路由；导入本模块不产生文件或数据库操作"""
+    ensure_directories()
+    create_default_images()
+    # 注册各个子系统的路由
+    register_purchase_routes(app)
+    register_inventory_routes(app)
+    register_sales_routes(app)
+    register_special_routes(app)
+    return app
 
+@metrics.track_job('auto_generate_receipts')
 def auto_generate_receipts():
     """自动为已完成的订单生成小票"""
     conn = get_db_connection()
@@ -216,23 +231,32 @@ def auto_generate_receipts():
                     item['notes']
                 ))
             
-            print(f"已为订单 {order['order_number']} 自动生成小票 {receipt_number}")
+            logger.debug("已为订单 %s 自动生成小票 %s", order['order_number'], receipt_number)
         
         conn.commit()
+        metrics.RECEIPTS_GENERATED.labels('auto').inc(len(orders))
     except Exception as e:
-        print(f"自动生成小票时出错: {str(e)}")
+        logger.exception("自动生成小票时出错: %s", e)
         conn.rollback()
+        raise
     finally:
         conn.close()
 
-# 添加定时任务，每5分钟检查一次
-scheduler.add_job(
-    auto_generate_receipts,
-    trigger=IntervalTrigger(minutes=5),
-    id='auto_generate_receipts',
-    name='自动生成小票',
-    replace_existing=True
-)
+def start_scheduler():
+    """启动定时任务；多进程部署时只由选举出的主节点调用（见 gunicorn.conf.py）"""
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.interval import IntervalTrigger
+    scheduler = BackgroundScheduler()
+    # 添加定时任务，每5分钟检查一次
+    scheduler.add_job(
+        auto_generate_receipts,
+        trigger=IntervalTrigger(minutes=5),
+        id='auto_generate_receipts',
+        name='自动生成小票',
+        replace_existing=True
+    )
+    scheduler.start()
+    return scheduler
 
 # 添加错误处理器
 @app.errorhandler(413)
@@ -247,8 +271,8 @@ if __name__ == '__main__':
         with open(os.path.join('routes', '__init__.py'), 'w') as f:
             f.write('# 这是一个Python包')
     
-    # 创建默认图片
-    create_default_images()
+    create_app()
+    start_scheduler()
     
     # 启动Flask应用
     app.run(debug=True, port=5000) 
\ No newline at end of file
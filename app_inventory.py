@@ -1,17 +1,42 @@
 import os
+import logging
+import itertools
 import sqlite3
 from datetime import datetime
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 from werkzeug.security import check_password_hash
 import random
 import time
+from replenishment import ReplenishmentEngine
+import db_backup
+import sql_profiler
+import metrics
+import static_assets
+import compression
+import json_provider
+import session_store
+import log_config
+from migrations import Migration, MigrationRunner, delete_in_batches
+
+# 日志经队列由后台线程输出，级别与格式见 log_config
+log_config.configure_logging()
+logger = logging.getLogger('app_inventory')
 
 app = Flask(__name__)
 app.secret_key = 'restaurant_management_system_secret_key'
 
-# 确保数据目录存在
-if not os.path.exists('data'):
-    os.makedirs('data')
+# 每个请求的 SQL 次数与耗时（响应头 X-SQL-Query-Count / X-SQL-Query-Time，明细见 /debug/queries）
+profiler = sql_profiler.SQLProfiler(app)
+# 请求耗时、SQL 耗时等指标，Prometheus 从 /metrics 抓取
+metrics.init_app(app, 'inventory')
+# 静态资源使用构建生成的指纹文件名、预压缩版本和长缓存（python -m static_assets build）
+assets = static_assets.StaticAssets(app)
+# 文本响应按 Accept-Encoding 压缩（级别见 compression.py 的环境变量）
+compression.init_app(app)
+# jsonify 使用 orjson 编码（未安装时回退到标准库），大列表流式输出
+json_provider.init_app(app)
+# 会话只在内容变化时写回；SESSION_TYPE=sqlite 时存到服务端（见 session_store.py）
+session_store.init_app(app)
 
 # 数据库文件路径
 DB_PATH = os.path.join('data', 'restaurant.db')
@@ -19,7 +44,7 @@ DB_PATH = os.path.join('data', 'restaurant.db')
 def get_db_connection():
     """连接数据库"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sql_profiler.connect(DB_PATH)
         conn.row_factory = sqlite3.Row
         # 设置编码
         conn.text_factory = str
@@ -27,7 +52,7 @@ def get_db_connection():
         conn.execute('PRAGMA foreign_keys = ON')
         return conn
     except Exception as e:
-        print(f"Error connecting to database: {str(e)}")
+        logger.exception("Error connecting to database: %s", e)
         raise
 
 def disable_foreign_keys(conn):
@@ -72,13 +97,13 @@ def init_db():
                 UNIQUE(inbound_no, item_name)
             )
             ''')
-            print("Created inbound_records table.")
+            logger.info("Created inbound_records table.")
         else:
             # 检查是否需要添加storage_location列
             columns = cursor.execute('PRAGMA table_info(inbound_records)').fetchall()
             if not any(col[1] == 'storage_location' for col in columns):
                 cursor.execute('ALTER TABLE inbound_records ADD COLUMN storage_location TEXT')
-                print("Added storage_location column to inbound_records table.")
+                logger.info("Added storage_location column to inbound_records table.")
 
         # 检查出库记录表是否存在
         outbound_exists = cursor.execute('''
@@ -106,7 +131,7 @@ def init_db():
                     FOREIGN KEY (inbound_no, item_name) REFERENCES inbound_records(inbound_no, item_name)
                 )
             ''')
-            print("Created new outbound_records table.")
+            logger.info("Created new outbound_records table.")
         else:
             # 检查是否需要更新表结构
             columns = cursor.execute('PRAGMA table_info(outbound_records)').fetchall()
@@ -123,7 +148,7 @@ def init_db():
             for col_name, col_type in required_columns.items():
                 if not any(col[1] == col_name for col in columns):
                     cursor.execute(f'ALTER TABLE outbound_records ADD COLUMN {col_name} {col_type}')
-                    print(f"Added {col_name} column to outbound_records table.")
+                    logger.info("Added %s column to outbound_records table.", col_name)
             
             # 确保status列有默认值
             cursor.execute('''
@@ -162,23 +187,16 @@ def init_db():
 
         # 提交事务
         conn.commit()
-        print("数据库初始化完成")
+        logger.info("数据库初始化完成")
         
     except Exception as e:
         # 如果出现错误，回滚事务
         conn.rollback()
-        print(f"数据库初始化出错: {str(e)}")
+        logger.exception("数据库初始化出错: %s", e)
         raise
     finally:
         conn.close()
 
-# 初始化数据库
-try:
-    init_db()
-    print("数据库初始化成功")
-except Exception as e:
-    print(f"数据库初始化失败: {str(e)}")
-
 # 首页路由
 @app.route('/')
 def index():
@@ -222,16 +240,6 @@ def get_transfer_stats():
         today = datetime.now().strftime('%Y-%m-%d')
         current_month = datetime.now().strftime('%Y-%m')
         
-        print(f"开始获取物资流转统计，今天日期: {today}, 本月: {current_month}")
-        
-        # 获取所有入库记录的时间
-        all_inbound_times = conn.execute('SELECT inbound_time FROM inbound_records').fetchall()
-        print(f"所有入库记录的时间: {[row['inbound_time'] for row in all_inbound_times]}")
-        
-        # 获取所有出库记录的时间
-        all_outbound_times = conn.execute('SELECT outbound_time FROM outbound_records').fetchall()
-        print(f"所有出库记录的时间: {[row['outbound_time'] for row in all_outbound_times]}")
-        
         # 获取今日入库数量
         today_inbound_query = '''
             SELECT COUNT(*) as count
@@ -270,7 +278,7 @@ def get_transfer_stats():
         monthly_inbound = conn.execute(monthly_inbound_query, (current_month,)).fetchone()['count']
         monthly_outbound = conn.execute(monthly_outbound_query, (current_month,)).fetchone()['count']
         
-        print(f"统计结果: 今日入库={today_inbound}, 今日出库={today_outbound}, 本月入库={monthly_inbound}, 本月出库={monthly_outbound}")
+        logger.debug("统计结果: 今日入库=%s, 今日出库=%s, 本月入库=%s, 本月出库=%s", today_inbound, today_outbound, monthly_inbound, monthly_outbound)
         
         return jsonify({
             'today_transfers': today_inbound + today_outbound,
@@ -282,7 +290,7 @@ def get_transfer_stats():
         })
         
     except Exception as e:
-        print(f"Error getting transfer stats: {str(e)}")
+        logger.exception("Error getting transfer stats: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -307,7 +315,7 @@ def reset_purchase_status():
         return jsonify({'success': True, 'message': '采购单状态已重置'})
     except Exception as e:
         conn.rollback()
-        print(f"Error in reset_purchase_status: {str(e)}")
+        logger.exception("Error in reset_purchase_status: %s", e)
         return jsonify({'success': False, 'message': f'重置状态失败：{str(e)}'}), 500
     finally:
         conn.close()
@@ -361,7 +369,7 @@ def get_pending_purchases():
         
         return jsonify(result)
     except Exception as e:
-        print(f"Error in get_pending_purchases: {str(e)}")
+        logger.exception("Error in get_pending_purchases: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -405,7 +413,7 @@ def get_inbound_stats():
         
         return jsonify(stats)
     except Exception as e:
-        print(f"Error in get_inbound_stats: {str(e)}")
+        logger.exception("Error in get_inbound_stats: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -457,7 +465,7 @@ def get_purchase_info(purchase_no):
             'products': products
         })
     except Exception as e:
-        print(f"Error in get_purchase_info: {str(e)}")
+        logger.exception("Error in get_purchase_info: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -478,7 +486,7 @@ def create_inbound_api():
         # 插入入库记录
         for product in data['products']:
             inbound_no = f"{base_inbound_no}"  # 所有商品使用相同的入库单号
-            print(f"Inserting inbound record: {inbound_no}, {product['name']}")
+            logger.debug("Inserting inbound record: %s, %s", inbound_no, product['name'])
             conn.execute('''
                 INSERT INTO inbound_records (
                     inbound_no, purchase_no, item_name, quantity, unit,
@@ -498,7 +506,7 @@ def create_inbound_api():
         
         # 如果质检合格，更新采购单状态为"已入库"
         if data['qualityCheck'] == '1':
-            print(f"Updating purchase order status: {data['purchaseNo']}")
+            logger.debug("Updating purchase order status: %s", data['purchaseNo'])
             conn.execute('''
                 UPDATE purchase_orders
                 SET status = '已入库'
@@ -506,90 +514,57 @@ def create_inbound_api():
             ''', (data['purchaseNo'],))
         
         conn.commit()
-        print(f"Successfully created inbound record: {base_inbound_no}")
+        logger.debug("Successfully created inbound record: %s", base_inbound_no)
         return jsonify({'success': True, 'message': '入库单创建成功'})
     except Exception as e:
         conn.rollback()
-        print(f"Error in create_inbound_api: {str(e)}")
+        logger.exception("Error in create_inbound_api: %s", e)
         return jsonify({'success': False, 'message': f'创建入库单失败：{str(e)}'}), 400
     finally:
         conn.close()
 
+def inbound_list_item(row):
+    return {
+        'inbound_no': row['inbound_no'],
+        'purchase_no': row['purchase_no'],
+        'supplier_name': row['supplier_name'],
+        'items': row['items'],
+        'inbound_time': row['inbound_time'],
+        'inspector': row['inspector']
+    }
+
 # 获取不同状态的入库单列表
 @app.route('/api/inventory/inbound_list/<status>')
 def get_inbound_list(status):
+    if status == 'pending':
+        # 获取待入库的采购单
+        return get_pending_purchases()
+    
     conn = get_db_connection()
     try:
-        if status == 'pending':
-            # 获取待入库的采购单
-            return get_pending_purchases()
-        elif status == 'completed':
-            # 获取已完成的入库单
-            records = conn.execute('''
-                SELECT 
-                    ir.inbound_no,
-                    ir.purchase_no,
-                    s.name as supplier_name,
-                    ir.inbound_time,
-                    ir.inspector,
-                    GROUP_CONCAT(ir.item_name || '(' || ir.quantity || ir.unit || ')') as items
-                FROM inbound_records ir
-                JOIN purchase_orders po ON ir.purchase_no = po.order_id
-                JOIN suppliers s ON po.supplier_id = s.code
-                WHERE ir.quality_check = 1
-                GROUP BY ir.inbound_no
-                ORDER BY ir.inbound_time DESC
-            ''').fetchall()
-            
-            # 处理数据
-            result = []
-            for row in records:
-                result.append({
-                    'inbound_no': row['inbound_no'],
-                    'purchase_no': row['purchase_no'],
-                    'supplier_name': row['supplier_name'],
-                    'items': row['items'],
-                    'inbound_time': row['inbound_time'],
-                    'inspector': row['inspector']
-                })
-            
-            return jsonify(result)
-        else:  # rejected
-            # 获取质检不合格的入库单
-            records = conn.execute('''
-                SELECT 
-                    ir.inbound_no,
-                    ir.purchase_no,
-                    s.name as supplier_name,
-                    ir.inbound_time,
-                    ir.inspector,
-                    GROUP_CONCAT(ir.item_name || '(' || ir.quantity || ir.unit || ')') as items
-                FROM inbound_records ir
-                JOIN purchase_orders po ON ir.purchase_no = po.order_id
-                JOIN suppliers s ON po.supplier_id = s.code
-                WHERE ir.quality_check = 0
-                GROUP BY ir.inbound_no
-                ORDER BY ir.inbound_time DESC
-            ''').fetchall()
-            
-            # 处理数据
-            result = []
-            for row in records:
-                result.append({
-                    'inbound_no': row['inbound_no'],
-                    'purchase_no': row['purchase_no'],
-                    'supplier_name': row['supplier_name'],
-                    'items': row['items'],
-                    'inbound_time': row['inbound_time'],
-                    'inspector': row['inspector']
-                })
-            
-            return jsonify(result)
+        # completed：已完成的入库单；其他（rejected）：质检不合格的入库单
+        quality_check = 1 if status == 'completed' else 0
+        cursor = conn.execute('''
+            SELECT 
+                ir.inbound_no,
+                ir.purchase_no,
+                s.name as supplier_name,
+                ir.inbound_time,
+                ir.inspector,
+                GROUP_CONCAT(ir.item_name || '(' || ir.quantity || ir.unit || ')') as items
+            FROM inbound_records ir
+            JOIN purchase_orders po ON ir.purchase_no = po.order_id
+            JOIN suppliers s ON po.supplier_id = s.code
+            WHERE ir.quality_check = ?
+            GROUP BY ir.inbound_no
+            ORDER BY ir.inbound_time DESC
+        ''', (quality_check,))
+        
+        return json_provider.stream_rows(cursor, conn, inbound_list_item)
     except Exception as e:
-        print(f"Error in get_inbound_list: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-    finally:
         conn.close()
+        logger.exception("Error in get_inbound_list: %s", e)
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/inventory/inbound_detail/<inbound_no>')
 def get_inbound_detail(inbound_no):
@@ -615,7 +590,7 @@ def get_inbound_detail(inbound_no):
             return jsonify({'error': '入库单不存在'}), 404
             
         # 获取入库单商品明细
-        items = conn.execute('''
+        items = json_provider.dict_cursor(conn).execute('''
             SELECT 
                 item_name,
                 quantity,
@@ -632,10 +607,10 @@ def get_inbound_detail(inbound_no):
             'inspector': basic_info['inspector'],
             'quality_check': basic_info['quality_check'],
             'remarks': basic_info['remarks'],
-            'items': [dict(item) for item in items]
+            'items': items
         })
     except Exception as e:
-        print(f"Error in get_inbound_detail: {str(e)}")
+        logger.exception("Error in get_inbound_detail: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -702,16 +677,55 @@ def get_inventory_stats():
             'monthly_outbound': monthly_outbound
         })
     except Exception as e:
-        print(f"Error in get_inventory_stats: {str(e)}")
+        logger.exception("Error in get_inventory_stats: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
+# 获取补货建议（不生成采购单）
+@app.route('/api/inventory/replenishment/suggestions')
+def get_replenishment_suggestions():
+    conn = get_db_connection()
+    try:
+        return jsonify(ReplenishmentEngine(conn).suggestions())
+    except Exception as e:
+        logger.exception("Error in get_replenishment_suggestions: %s", e)
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# 按补货建议生成草稿采购单
+@app.route('/api/inventory/replenishment/run', methods=['POST'])
+def run_replenishment():
+    conn = get_db_connection()
+    try:
+        result = ReplenishmentEngine(conn).create_draft_orders(session.get('username', '系统'))
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        logger.exception("Error in run_replenishment: %s", e)
+        return jsonify({'success': False, 'message': f'生成补货采购单失败：{str(e)}'}), 500
+    finally:
+        conn.close()
+
+@metrics.track_job('auto_replenish')
+def auto_replenish():
+    """定时任务：库存低于再订货点时自动生成草稿采购单"""
+    conn = get_db_connection()
+    try:
+        result = ReplenishmentEngine(conn).create_draft_orders()
+        if result['order_count']:
+            logger.info("自动补货生成 %s 张草稿采购单，耗时 %s 秒", result['order_count'], result['elapsed_seconds'])
+    except Exception as e:
+        logger.exception("自动补货出错: %s", e)
+        raise
+    finally:
+        conn.close()
+
 # 获取库存列表
 @app.route('/api/inventory/stock/list')
 def get_stock_list_api():
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         # 获取库存数据（按商品名称分组计算总数量）
@@ -744,9 +758,13 @@ def get_stock_list_api():
             WHERE ir.quality_check = 1
             ORDER BY lr.latest_inbound_time DESC
         ''')
-        
-        stock_list = []
-        for row in cursor.fetchall():
+    except Exception as e:
+        conn.close()
+        logger.exception("Error getting stock list: %s", e)
+        return jsonify({'error': str(e)}), 500
+    
+    def stock_list():
+        for row in json_provider.iter_cursor(cursor):
             item_name = row[3]
             total_quantity = float(row[4])
             
@@ -757,7 +775,7 @@ def get_stock_list_api():
             elif total_quantity <= 1:
                 warning_level = 'yellow'
             
-            stock_list.append({
+            yield {
                 'inbound_no': row[0],
                 'purchase_no': row[1],
                 'supplier_name': row[2],
@@ -768,16 +786,10 @@ def get_stock_list_api():
                 'storage_location': row[7],
                 'inspector': row[8],
                 'warning_level': warning_level
-            })
-        
-        return jsonify(stock_list)
+            }
     
-    except Exception as e:
-        print(f"Error getting stock list: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+    # 读完全部行并关闭连接后再发送，不在下载期间占着数据库锁
+    return json_provider.stream_items(stock_list(), conn)
 
 # 更新存放位置
 @app.route('/api/inventory/stock/update_location', methods=['POST'])
@@ -802,7 +814,7 @@ def update_storage_location():
         return jsonify({'success': True, 'message': '存放位置更新成功'})
     except Exception as e:
         conn.rollback()
-        print(f"Error in update_storage_location: {str(e)}")
+        logger.exception("Error in update_storage_location: %s", e)
         return jsonify({'success': False, 'message': f'更新存放位置失败：{str(e)}'}), 500
     finally:
         conn.close()
@@ -887,7 +899,7 @@ def get_stock_detail(inbound_no):
             } for item in items]
         })
     except Exception as e:
-        print(f"Error in get_stock_detail: {str(e)}")
+        logger.exception("Error in get_stock_detail: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -917,7 +929,7 @@ def get_outbound_stats():
                 stats[row[0]] = row[1]
         
         # 打印调试信息
-        print(f"出库统计结果: {stats}")
+        logger.debug("出库统计结果: %s", stats)
         
         # 获取本月已出库记录数量（用于首页统计）
         current_month = datetime.now().strftime('%Y-%m')
@@ -929,14 +941,14 @@ def get_outbound_stats():
         '''
         
         monthly_count = conn.execute(monthly_query, (f'{current_month}%',)).fetchone()['count']
-        print(f"本月已出库数量: {monthly_count}")
+        logger.debug("本月已出库数量: %s", monthly_count)
         
         # 扩展统计结果，添加本月数据
         stats['monthly'] = monthly_count
         
         return jsonify(stats)
     except Exception as e:
-        print(f"Error in get_outbound_stats: {str(e)}")
+        logger.exception("Error in get_outbound_stats: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -947,7 +959,7 @@ def get_outbound_list(status):
     conn = get_db_connection()
     try:
         # 记录查询日志
-        print(f"查询出库单列表，状态: {status}")
+        logger.debug("查询出库单列表，状态: %s", status)
         
         # 根据状态获取出库记录，使用GROUP BY确保每个出库单只显示一次
         query = '''
@@ -975,10 +987,10 @@ def get_outbound_list(status):
         records = conn.execute(query, (status,)).fetchall()
         
         # 打印查询结果数量和部分数据示例
-        print(f"查询到 {len(records)} 条出库记录，状态: {status}")
+        logger.debug("查询到 %s 条出库记录，状态: %s", len(records), status)
         if len(records) > 0:
             sample = records[0]
-            print(f"示例数据: 出库单号={sample['outbound_no']}, 出库时间={sample['outbound_time']}")
+            logger.debug("示例数据: 出库单号=%s, 出库时间=%s", sample['outbound_no'], sample['outbound_time'])
         
         result = []
         for row in records:
@@ -997,7 +1009,7 @@ def get_outbound_list(status):
         
         return jsonify(result)
     except Exception as e:
-        print(f"Error in get_outbound_list: {str(e)}")
+        logger.exception("Error in get_outbound_list: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -1027,7 +1039,7 @@ def get_outbound_detail(outbound_no):
             return jsonify({'error': '出库单不存在'}), 404
             
         # 获取出库单商品明细
-        items = conn.execute('''
+        items = json_provider.dict_cursor(conn).execute('''
             SELECT 
                 item_name,
                 quantity,
@@ -1046,10 +1058,10 @@ def get_outbound_detail(outbound_no):
             'approver': outbound['approver'],
             'purpose': outbound['purpose'],
             'remarks': outbound['remarks'],
-            'items': [dict(item) for item in items]
+            'items': items
         })
     except Exception as e:
-        print(f"Error in get_outbound_detail: {str(e)}")
+        logger.exception("Error in get_outbound_detail: %s", e)
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -1065,7 +1077,7 @@ def process_outbound_v2():
         if 'outbound_no' not in data or 'status' not in data:
             return jsonify({'success': False, 'message': '请求数据不完整'}), 400
         
-        print("开始处理出库，临时禁用外键约束")
+        logger.debug("开始处理出库，临时禁用外键约束")
         disable_foreign_keys(conn)  # 在整个处理过程开始时就禁用外键约束
             
         # 检查出库单是否存在且状态为待出库
@@ -1116,7 +1128,7 @@ def process_outbound_v2():
                 
                 if has_custom_items:
                     # 使用客户端提供的商品列表
-                    print(f"使用自定义商品列表处理出库: {data['items']}")
+                    logger.debug("使用自定义商品列表处理出库: %s", data['items'])
                     
                     for custom_item in data['items']:
                         item_name = custom_item['item_name']
@@ -1164,7 +1176,7 @@ def process_outbound_v2():
                             })
                 else:
                     # 使用原始商品列表
-                    print("使用原始商品列表处理出库")
+                    logger.debug("使用原始商品列表处理出库")
                     
                     for item in original_items:
                         output_items.append({
@@ -1182,14 +1194,14 @@ def process_outbound_v2():
                 
                 # 处理部分出库的情况
                 if remaining_items:
-                    print(f"部分出库处理：出库 {len(output_items)} 件商品，剩余 {len(remaining_items)} 件商品")
+                    logger.debug("部分出库处理：出库 %s 件商品，剩余 %s 件商品", len(output_items), len(remaining_items))
                     
                     # 创建一个新的出库单号用于已出库部分
                     timestamp = int(time.time())
                     random_suffix = random.randint(1000, 9999)
                     new_outbound_no = f"OUT{timestamp}{random_suffix}"
                     
-                    print(f"创建新的已出库单号: {new_outbound_no} 用于出库部分")
+                    logger.debug("创建新的已出库单号: %s 用于出库部分", new_outbound_no)
                     
                     try:
                         # 对每个部分出库的商品创建新的已出库记录
@@ -1213,7 +1225,7 @@ def process_outbound_v2():
                                 data.get('remarks', '')
                             ))
                             
-                            print(f"创建已出库记录: {item['item_name']} 数量 {item['quantity']} 到新出库单 {new_outbound_no}")
+                            logger.debug("创建已出库记录: %s 数量 %s 到新出库单 %s", item['item_name'], item['quantity'], new_outbound_no)
                             
                             # 更新原出库记录的数量为剩余数量
                             remaining_quantity = None
@@ -1229,7 +1241,7 @@ def process_outbound_v2():
                                     WHERE id = ?
                                 ''', (remaining_quantity, item['id']))
                                 
-                                print(f"更新原出库记录: ID={item['id']} {item['item_name']} 剩余数量={remaining_quantity}")
+                                logger.debug("更新原出库记录: ID=%s %s 剩余数量=%s", item['id'], item['item_name'], remaining_quantity)
                             
                             # 更新库存
                             stock_exists = conn.execute('''
@@ -1249,9 +1261,9 @@ def process_outbound_v2():
                                         WHERE inbound_no = ? AND item_name = ?
                                     ''', (new_quantity, item['inbound_no'], item['item_name']))
                                     
-                                    print(f"更新库存: {item['inbound_no']} - {item['item_name']} 减少 {item['quantity']}, 剩余 {new_quantity}")
+                                    logger.debug("更新库存: %s - %s 减少 %s, 剩余 %s", item['inbound_no'], item['item_name'], item['quantity'], new_quantity)
                     except Exception as e:
-                        print(f"创建新出库记录时出错: {str(e)}")
+                        logger.exception("创建新出库记录时出错: %s", e)
                         conn.rollback()
                         return jsonify({
                             'success': False,
@@ -1259,7 +1271,7 @@ def process_outbound_v2():
                         }), 500
                 else:
                     # 全部出库的情况
-                    print("处理全部出库")
+                    logger.debug("处理全部出库")
                     
                     try:
                         # 更新原出库单状态为已出库
@@ -1282,7 +1294,7 @@ def process_outbound_v2():
                             data['outbound_no']
                         ))
                         
-                        print(f"更新出库单状态: {data['outbound_no']} -> 已出库")
+                        logger.debug("更新出库单状态: %s -> 已出库", data['outbound_no'])
                         
                         # 更新库存
                         for item in output_items:
@@ -1303,7 +1315,7 @@ def process_outbound_v2():
                                         WHERE inbound_no = ? AND item_name = ?
                                     ''', (new_quantity, item['inbound_no'], item['item_name']))
                                     
-                                    print(f"更新库存: {item['inbound_no']} - {item['item_name']} 减少 {item['quantity']}, 剩余 {new_quantity}")
+                                    logger.debug("更新库存: %s - %s 减少 %s, 剩余 %s", item['inbound_no'], item['item_name'], item['quantity'], new_quantity)
                                 else:
                                     conn.rollback()
                                     return jsonify({
@@ -1318,7 +1330,7 @@ def process_outbound_v2():
                                 }), 400
                                 
                     except Exception as e:
-                        print(f"全部出库处理时出错: {str(e)}")
+                        logger.exception("全部出库处理时出错: %s", e)
                         conn.rollback()
                         return jsonify({
                             'success': False,
@@ -1340,7 +1352,7 @@ def process_outbound_v2():
             # 提交事务
             conn.commit()
             
-            print("处理完成，重新启用外键约束")
+            logger.debug("处理完成，重新启用外键约束")
             enable_foreign_keys(conn)  # 处理完成后重新启用外键约束
             
             return jsonify({
@@ -1351,7 +1363,7 @@ def process_outbound_v2():
         except Exception as e:
             conn.rollback()
             error_msg = str(e)
-            print(f"处理出库单内部操作失败: {error_msg}")
+            logger.exception("处理出库单内部操作失败: %s", error_msg)
             return jsonify({
                 'success': False, 
                 'message': f'处理出库单内部操作失败: {error_msg}'
@@ -1364,7 +1376,7 @@ def process_outbound_v2():
             pass
             
         error_msg = str(e)
-        print(f"Error in process_outbound_v2: {error_msg}")
+        logger.exception("Error in process_outbound_v2: %s", error_msg)
         return jsonify({
             'success': False, 
             'message': error_msg
@@ -1373,7 +1385,7 @@ def process_outbound_v2():
         try:
             # 确保在任何情况下都重新启用外键约束
             enable_foreign_keys(conn)
-            print("最终确保重新启用外键约束")
+            logger.debug("最终确保重新启用外键约束")
         except:
             pass
         conn.close()
@@ -1383,11 +1395,11 @@ def process_outbound_v2():
 def force_migrate_inventory():
     conn = get_db_connection()
     try:
-        print("开始执行从库存导入到出库系统的操作，临时禁用外键约束")
+        logger.debug("开始执行从库存导入到出库系统的操作，临时禁用外键约束")
         
         # 禁用外键约束
         conn.execute("PRAGMA foreign_keys = OFF")
-        print("外键约束已禁用")
+        logger.debug("外键约束已禁用")
         
         # 获取所有已存在的入库单号和商品名称组合
         existing_records = conn.execute('''
@@ -1405,7 +1417,7 @@ def force_migrate_inventory():
             WHERE quality_check = 1 AND quantity > 0
         ''').fetchall()
         
-        print(f"找到符合条件的库存记录数量: {len(records)}")
+        logger.debug("找到符合条件的库存记录数量: %s", len(records))
         
         # 手动为每条新记录创建出库记录
         imported_count = 0
@@ -1424,7 +1436,7 @@ def force_migrate_inventory():
             suffix = f"{i+1:03d}"
             outbound_no = f"OUT{timestamp}{suffix}"
             
-            print(f"创建出库单: {outbound_no} 对应入库单: {record['inbound_no']}")
+            logger.debug("创建出库单: %s 对应入库单: %s", outbound_no, record['inbound_no'])
             
             conn.execute('''
                 INSERT INTO outbound_records (
@@ -1441,11 +1453,11 @@ def force_migrate_inventory():
             imported_count += 1
         
         conn.commit()
-        print(f"导入完成：成功导入 {imported_count} 条记录，跳过 {skipped_count} 条已存在记录")
+        logger.info("导入完成：成功导入 %s 条记录，跳过 %s 条已存在记录", imported_count, skipped_count)
         
         # 重新启用外键约束
         conn.execute("PRAGMA foreign_keys = ON")
-        print("外键约束已重新启用")
+        logger.debug("外键约束已重新启用")
         
         return jsonify({
             'success': True,
@@ -1456,7 +1468,7 @@ def force_migrate_inventory():
         
     except Exception as e:
         conn.rollback()
-        print(f"导入过程中出错: {str(e)}")
+        logger.exception("导入过程中出错: %s", e)
         return jsonify({
             'success': False,
             'message': f'导入失败: {str(e)}'
@@ -1478,76 +1490,31 @@ def process_outbound_page(outbound_no):
 # 添加一个新的API来修复数据库外键约束
 @app.route('/api/inventory/fix_database', methods=['POST'])
 def fix_database():
-    """修复数据库外键约束问题的API"""
+    """删除引用不存在入库单的出库记录；表结构由迁移维护，这里只清理数据"""
     conn = get_db_connection()
     
     try:
-        # 开始事务
-        conn.execute('BEGIN')
-        
-        # 禁用外键约束
-        disable_foreign_keys(conn)
-        
-        # 1. 删除不合法的出库记录（找出引用不存在入库单的记录）
-        invalid_records = conn.execute('''
-            SELECT outbound_records.inbound_no, COUNT(*) as count
-            FROM outbound_records
-            LEFT JOIN inbound_records ON outbound_records.inbound_no = inbound_records.inbound_no
-            WHERE inbound_records.inbound_no IS NULL
-            GROUP BY outbound_records.inbound_no
-        ''').fetchall()
-        
-        deleted_count = 0
-        for record in invalid_records:
-            inbound_no = record['inbound_no']
-            count = record['count']
-            
-            conn.execute('''
-                DELETE FROM outbound_records 
-                WHERE inbound_no = ?
-            ''', (inbound_no,))
-            
-            deleted_count += count
-            print(f"Deleted {count} invalid outbound records with inbound_no: {inbound_no}")
+        # 分批删除，出库表很大时也不会长时间锁住出库操作
+        deleted_count = delete_in_batches(conn, 'outbound_records', '''
+            NOT EXISTS (SELECT 1 FROM inbound_records WHERE inbound_records.inbound_no = outbound_records.inbound_no)
+        ''', label='清理无效出库记录')
+        conn.commit()
         
-        # 2. 重建出库表（通过init_db函数）
         if deleted_count > 0:
-            # 重新启用外键约束
-            enable_foreign_keys(conn)
-            
-            # 提交当前事务
-            conn.commit()
-            
-            # 调用初始化函数重建表结构
-            init_db()
-            
+            logger.warning("Deleted %s invalid outbound records", deleted_count)
             return jsonify({
                 'success': True,
-                'message': f'已修复数据库：删除了 {deleted_count} 条无效的出库记录，并重建了出库记录表。'
-            })
-        else:
-            # 重新启用外键约束
-            enable_foreign_keys(conn)
-            
-            # 提交事务
-            conn.commit()
-            
-            return jsonify({
-                'success': True,
-                'message': '数据库检查完成，未发现无效的出库记录。'
+                'message': f'已修复数据库：删除了 {deleted_count} 条无效的出库记录。'
             })
+        return jsonify({
+            'success': True,
+            'message': '数据库检查完成，未发现无效的出库记录。'
+        })
     
     except Exception as e:
         conn.rollback()
-        
-        try:
-            # 确保重新启用外键约束
-            enable_foreign_keys(conn)
-        except:
-            pass
-        
         error_msg = str(e)
-        print(f"Error in fix_database: {error_msg}")
+        logger.exception("Error in fix_database: %s", error_msg)
         return jsonify({
             'success': False,
             'message': f'修复数据库失败：{error_msg}'
@@ -1620,8 +1587,13 @@ def debug_all_outbound_records():
     """调试API，获取所有出库记录并按状态分组展示"""
     conn = get_db_connection()
     try:
-        # 获取所有出库记录，并按状态分组
-        records = conn.execute('''
+        # 各状态的记录数；没有记录的常用状态也输出空列表
+        stats = {'待出库': 0, '已出库': 0, '已取消': 0}
+        for row in conn.execute('SELECT status, COUNT(*) AS count FROM outbound_records GROUP BY status'):
+            stats[row['status']] = row['count']
+        
+        # 获取所有出库记录，按状态排序后逐组输出
+        cursor = conn.execute('''
             SELECT 
                 status, 
                 outbound_no, 
@@ -1630,49 +1602,48 @@ def debug_all_outbound_records():
                 outbound_time
             FROM outbound_records
             ORDER BY status, outbound_no
-        ''').fetchall()
-        
-        # 将记录按状态分组
-        result = {
-            '待出库': [],
-            '已出库': [],
-            '已取消': []
-        }
-        
-        # 处理记录
-        for record in records:
-            status = record['status']
-            if status not in result:
-                result[status] = []
-            
-            result[status].append({
-                'outbound_no': record['outbound_no'],
-                'item_name': record['item_name'],
-                'quantity': record['quantity'],
-                'outbound_time': record['outbound_time']
-            })
-        
-        # 添加统计信息
-        stats = {}
-        for status, items in result.items():
-            stats[status] = len(items)
-            
-        return jsonify({
-            'stats': stats,
-            'records': result
-        })
+        ''')
     except Exception as e:
-        print(f"Error in debug_all_outbound_records: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-    finally:
         conn.close()
+        logger.exception("Error in debug_all_outbound_records: %s", e)
+        return jsonify({'error': str(e)}), 500
+    
+    def outbound_record(record):
+        return {
+            'outbound_no': record['outbound_no'],
+            'item_name': record['item_name'],
+            'quantity': record['quantity'],
+            'outbound_time': record['outbound_time']
+        }
+    
+    provider = app.json
+    rows = json_provider.iter_cursor(cursor)
+    if json_provider.wants_ndjson():
+        items = ({'status': record['status'], **outbound_record(record)} for record in rows)
+        return json_provider.stream_response(provider.iter_ndjson(items), conn, json_provider.NDJSON_MIMETYPE)
+    
+    def generate():
+        # 输出 {"stats": {状态: 数量}, "records": {状态: [...]}}，记录按状态分组逐组编码
+        yield b'{"stats":' + provider.dumps_bytes(stats) + b',"records":{'
+        emitted = set()
+        for status, group in itertools.groupby(rows, key=lambda record: record['status']):
+            yield (b',' if emitted else b'') + provider.dumps_bytes(status) + b':'
+            yield from provider.iter_array(map(outbound_record, group))
+            emitted.add(status)
+        for status in stats:
+            if status not in emitted:
+                yield (b',' if emitted else b'') + provider.dumps_bytes(status) + b':[]'
+                emitted.add(status)
+        yield b'}}\n'
+    
+    return json_provider.stream_response(generate(), conn)
 
 # 物资流转历史API
 @app.route('/api/inventory/transfer/history', methods=['GET'])
 def get_transfer_history():
     conn = get_db_connection()
     try:
-        print("开始获取物资流转历史")
+        logger.debug("开始获取物资流转历史")
         
         query = '''
             WITH 
@@ -1730,12 +1701,17 @@ def get_transfer_history():
             ORDER BY ii.inbound_time DESC, oi.outbound_time DESC
         '''
         
-        records = conn.execute(query).fetchall()
-        print(f"查询到 {len(records)} 条物资流转记录")
-        
-        # 处理查询结果
-        result = []
-        for row in records:
+        cursor = conn.execute(query)
+    except Exception as e:
+        conn.close()
+        logger.exception("获取物资流转历史时出错: %s", e)
+        return jsonify({
+            'error': f'获取物资流转历史失败: {str(e)}'
+        }), 500
+    
+    # 处理查询结果
+    def transfer_history():
+        for row in json_provider.iter_cursor(cursor):
             # 构建流转节点
             transfer_nodes = []
             
@@ -1785,23 +1761,67 @@ def get_transfer_history():
                     }
                 })
             
-            result.append({
+            yield {
                 'inbound_no': row['inbound_no'],
                 'item_name': row['item_name'],
                 'current_status': row['current_status'],
                 'transfer_nodes': transfer_nodes
-            })
-        
-        print("物资流转历史数据处理完成")
-        return jsonify(result)
-        
+            }
+    
+    # 读完全部行并关闭连接后再发送，不在下载期间占着数据库锁
+    return json_provider.stream_items(transfer_history(), conn)
+
+# 数据库迁移：按版本号顺序执行，已执行的记录在 schema_version 表中
+MIGRATIONS = [
+    Migration(1, '创建入库、出库基础表', lambda conn: init_db()),
+]
+
+def run_migrations():
+    return MigrationRunner(DB_PATH, 'inventory', MIGRATIONS).run()
+
+def create_app():
+    """应用工厂：准备数据目录并执行未应用的迁移；导入本模块不会访问数据库"""
+    os.makedirs('data', exist_ok=True)
+    run_migrations()
+    return app
+
+@metrics.track_job('backup_restaurant_db')
+def backup_restaurant_db():
+    """定时任务：在线备份采购、仓储、特色管理共用的 restaurant.db"""
+    try:
+        metrics.observe_backup(db_backup.backup_database(DB_PATH, 'restaurant'))
     except Exception as e:
-        print(f"获取物资流转历史时出错: {str(e)}")
-        return jsonify({
-            'error': f'获取物资流转历史失败: {str(e)}'
-        }), 500
-    finally:
-        conn.close()
+        logger.exception("restaurant.db 备份失败: %s", e)
+        raise
+
+def start_scheduler():
+    """启动定时任务；多进程部署时只由选举出的主节点调用（见 gunicorn.conf.py）"""
+    # 调度器只在主节点用到，延迟导入以加快启动
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    # 每6小时检查一次库存并生成补货草稿（草稿计入在途数量，不会重复下单）
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(
+        auto_replenish,
+        trigger=IntervalTrigger(hours=6),
+        id='auto_replenish',
+        name='自动补货',
+        replace_existing=True
+    )
+    # 每天凌晨在线备份一次，保留最近 7 份
+    scheduler.add_job(
+        backup_restaurant_db,
+        trigger=CronTrigger(hour=2),
+        id='backup_restaurant_db',
+        name='数据库备份',
+        replace_existing=True
+    )
+    scheduler.start()
+    return scheduler
 
 if __name__ == '__main__':
+    create_app()
+    start_scheduler()
     app.run(debug=True, port=5001) 
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import logging
 import sqlite3
 import hashlib
 from datetime import datetime
@@ -6,22 +7,58 @@ import time
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-import xlsxwriter
 import io
+from blob_store import BlobStore
+from bulk_import import BulkImportError, SupplierImporter, PurchaseOrderItemImporter, iter_rows
+from three_way_match import MATCHED, ThreeWayMatcher, init_match_tables
+import sql_profiler
+import metrics
+import static_assets
+import compression
+import json_provider
+import fragment_cache
+import session_store
+import log_config
+from migrations import Migration, MigrationRunner, add_columns, rebuild_table, rowid_batches, table_columns, update_in_batches
+
+# 日志经队列由后台线程输出，级别与格式见 log_config
+log_config.configure_logging()
+logger = logging.getLogger('app_purchase')
 
 app = Flask(__name__)
 app.secret_key = 'restaurant_management_system_secret_key'
 
+# 每个请求的 SQL 次数与耗时（响应头 X-SQL-Query-Count / X-SQL-Query-Time，明细见 /debug/queries）
+profiler = sql_profiler.SQLProfiler(app)
+# 请求耗时、SQL 耗时等指标，Prometheus 从 /metrics 抓取
+metrics.init_app(app, 'purchase')
+# 静态资源使用构建生成的指纹文件名、预压缩版本和长缓存（python -m static_assets build）
+assets = static_assets.StaticAssets(app)
+# 文本响应按 Accept-Encoding 压缩（级别见 compression.py 的环境变量）
+compression.init_app(app)
+# jsonify 使用 orjson 编码（未安装时回退到标准库），大列表流式输出
+json_provider.init_app(app)
+# 会话只在内容变化时写回；SESSION_TYPE=sqlite 时存到服务端（见 session_store.py）
+session_store.init_app(app)
+# 模板片段缓存：{% cache 名称, cache_version %}...{% endcache %}
+fragment_cache.init_app(app)
+
+# 合同与检验附件统一保存在内容寻址存储中，相同文件只存一份
+blob_store = BlobStore()
+# blob 内容不可变，下载时允许客户端长期缓存（一年）
+BLOB_CACHE_MAX_AGE = 365 * 24 * 3600
+
 # 确保每个请求前session中都有username
 @app.before_request
 def ensure_username():
+    # 静态资源、API 和指标接口不读写会话
+    if session_store.is_sessionless():
+        return
     if 'username' not in session:
         # 设置默认用户名和其他必要会话信息
         session['username'] = '默认用户'
         session['logged_in'] = True  # 添加登录状态标记
         flash('使用默认用户身份访问系统', 'info')  # 提示用户
-    # 确保每次请求都刷新会话时间
-    session.modified = True
 
 # 删除现有的数据库文件
 # if os.path.exists('data/restaurant.db'):
@@ -38,7 +75,7 @@ def init_db():
     db_exists = os.path.exists(db_path)
     
     # 连接数据库
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     cursor = conn.cursor()
     
     # 创建用户表
@@ -103,6 +140,44 @@ def init_db():
     )
     ''')
     
+    # 创建检验附件表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS inspection_attachments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        inspection_id TEXT NOT NULL,
+        file_name TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        file_type TEXT,
+        file_size TEXT,
+        uploader TEXT,
+        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (inspection_id) REFERENCES supplier_inspections (inspection_id)
+    )
+    ''')
+    
+    # 创建供应商合同表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS supplier_contracts (
+        contract_id TEXT PRIMARY KEY,
+        supplier_code TEXT NOT NULL,
+        contract_date DATE,
+        effective_date DATE,
+        expiry_date DATE,
+        contract_type TEXT,
+        contract_terms TEXT,
+        file_path TEXT,
+        file_type TEXT,
+        original_filename TEXT,
+        status TEXT DEFAULT '有效',
+        creator TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # 引用计数按 file_path 统计，需要索引
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inspection_attachments_file_path ON inspection_attachments (file_path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_supplier_contracts_file_path ON supplier_contracts (file_path)")
+    
     # 创建采购订单表
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS purchase_orders (
@@ -157,13 +232,9 @@ def init_db():
     )
     ''')
     
-    # 创建收据表
-    cursor.execute('''
-    DROP TABLE IF EXISTS purchase_receipts
-    ''')
-
+    # 创建收据表（旧库中已有的收据表由迁移 v6 补齐字段，不再删除重建）
     cursor.execute('''
-    CREATE TABLE purchase_receipts (
+    CREATE TABLE IF NOT EXISTS purchase_receipts (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         receipt_type TEXT NOT NULL,
         receipt_number TEXT NOT NULL,
@@ -187,10 +258,14 @@ def init_db():
     )
     ''')
     
-    # 如果是新数据库，创建默认管理员账户
-    if not db_exists:
+    # 创建三单匹配结果表
+    init_match_tables(conn)
+    
+    # 如果还没有任何用户，创建默认管理员账户（迁移记录表会先于本函数创建数据库文件，不能只看文件是否存在）
+    if cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
         cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
                       ('admin', 'admin123', 'admin'))
+        logger.info("已创建默认管理员账户 admin / admin123")
     
     # 提交事务
     conn.commit()
@@ -198,17 +273,14 @@ def init_db():
     
     return not db_exists
 
-# 初始化数据库
-init_db()
-
 def get_db_connection():
     try:
         db_path = os.path.join('data', 'restaurant.db')
-        conn = sqlite3.connect(db_path)
+        conn = sql_profiler.connect(db_path)
         conn.row_factory = sqlite3.Row
         return conn
     except Exception as e:
-        print(f"Database connection error: {str(e)}")
+        logger.exception("Database connection error: %s", e)
         raise
 
 @app.route('/')
@@ -230,7 +302,7 @@ def purchase():
 def purchase_supplier():
     # 连接数据库获取供应商列表
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row  # 使查询结果以字典形式返回
     cursor = conn.cursor()
     
@@ -277,13 +349,13 @@ def purchase_supplier():
 @app.route('/purchase/supplier/add', methods=['GET', 'POST'])
 def add_supplier():
     # 添加调试输出
-    print("*** 访问 add_supplier 函数 ***")
-    print(f"请求方法: {request.method}")
-    print(f"会话用户: {session.get('username', '无用户')}")
+    logger.debug("*** 访问 add_supplier 函数 ***")
+    logger.debug("请求方法: %s", request.method)
+    logger.debug("会话用户: %s", session.get('username', '无用户'))
     
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -393,15 +465,39 @@ def add_supplier():
                          available_count=available_count,
                          added_count=added_count)
     except Exception as e:
-        print(f"渲染模板错误: {str(e)}")
+        logger.exception("渲染模板错误: %s", e)
         flash(f"显示供应商添加界面失败: {str(e)}", "danger")
         return redirect(url_for('purchase_supplier'))
 
+# 批量导入供应商（CSV/XLSX）
+@app.route('/purchase/supplier/import', methods=['POST'])
+def import_suppliers():
+    return run_bulk_import(SupplierImporter)
+
+def run_bulk_import(importer_class):
+    """执行批量导入并返回行级错误报告"""
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({"status": "error", "message": "未选择文件"}), 400
+    
+    conn = get_db_connection()
+    try:
+        report = importer_class(conn).run(iter_rows(file))
+        report['status'] = 'success' if report['failed_rows'] == 0 else 'partial'
+        return jsonify(report)
+    except BulkImportError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"status": "error", "message": f"导入失败: {str(e)}"}), 500
+    finally:
+        conn.close()
+
 @app.route('/purchase/supplier/view/<code>')
 def view_supplier(code):
     # 连接数据库获取供应商详情
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -422,7 +518,7 @@ def view_supplier(code):
 def edit_supplier(code):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -470,7 +566,7 @@ def edit_supplier(code):
 def delete_supplier(code):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     cursor = conn.cursor()
     
     try:
@@ -496,7 +592,7 @@ def purchase_inspect():
     
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -570,7 +666,7 @@ def new_inspection():
         
         # 连接数据库
         db_path = os.path.join('data', 'restaurant.db')
-        conn = sqlite3.connect(db_path)
+        conn = sql_profiler.connect(db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -635,7 +731,7 @@ def new_inspection():
     # 生成新的检验编号
     current_date = datetime.now().strftime('%Y%m%d')
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     cursor = conn.cursor()
     
     cursor.execute("SELECT MAX(inspection_id) FROM supplier_inspections WHERE inspection_id LIKE ?", (f'INSP{current_date}%',))
@@ -660,7 +756,7 @@ def new_inspection():
 def view_inspection(inspection_id):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -694,7 +790,7 @@ def update_inspection_result(inspection_id):
     
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     cursor = conn.cursor()
     
     try:
@@ -718,7 +814,7 @@ def update_inspection_result(inspection_id):
 def upload_attachment(inspection_id):
         # 检查检验记录是否存在
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -742,28 +838,15 @@ def upload_attachment(inspection_id):
     
     if file:
         try:
-            # 创建上传目录
-            upload_dir = os.path.join('static', 'uploads', 'inspections', inspection_id)
-            if not os.path.exists(upload_dir):
-                os.makedirs(upload_dir)
-            
             # 确保文件名安全
             filename = secure_filename(file.filename)
             
-            # 添加时间戳避免重名
-            filename_parts = os.path.splitext(filename)
-            timestamped_filename = f"{filename_parts[0]}_{int(time.time())}{filename_parts[1]}"
-            
-            file_path = os.path.join(upload_dir, timestamped_filename)
-            file.save(file_path)
-            
-            # 获取文件信息
-            file_size = os.path.getsize(file_path)
-            file_size_str = format_file_size(file_size)
+            # 边上传边计算哈希，内容相同的文件复用同一个 blob
+            blob = blob_store.save(file.stream)
+            file_size_str = format_file_size(blob['size'])
+            relative_path = blob['path']
             
             # 保存附件信息到数据库
-            relative_path = os.path.join('uploads', 'inspections', inspection_id, timestamped_filename)
-            
             cursor.execute('''
             INSERT INTO inspection_attachments (
                 inspection_id, file_name, file_path, file_type, file_size, uploader
@@ -792,7 +875,7 @@ def upload_attachment(inspection_id):
 @app.route('/purchase/inspect/get_attachments/<inspection_id>')
 def get_attachments(inspection_id):
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -829,7 +912,7 @@ def get_attachments(inspection_id):
 @app.route('/purchase/inspect/download_attachment/<int:attachment_id>')
 def download_attachment(attachment_id):
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -850,12 +933,12 @@ def download_attachment(attachment_id):
         return redirect(url_for('view_inspection', inspection_id=attachment['inspection_id']))
     
     conn.close()
-    return send_file(file_path, download_name=attachment['file_name'], as_attachment=True)
+    return send_blob(attachment['file_path'], attachment['file_name'])
 
 @app.route('/purchase/inspect/delete_attachment/<int:attachment_id>', methods=['POST'])
 def delete_attachment(attachment_id):
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -874,8 +957,10 @@ def delete_attachment(attachment_id):
         cursor.execute("DELETE FROM inspection_attachments WHERE id = ?", (attachment_id,))
         conn.commit()
         
-        # 删除文件
-        if os.path.exists(file_path):
+        # 提交后再删除文件：blob 只在没有其他附件或合同引用时回收
+        if blob_store.is_blob(attachment['file_path']):
+            blob_store.release(cursor, attachment['file_path'])
+        elif os.path.exists(file_path):
             os.remove(file_path)
         
         conn.close()
@@ -897,7 +982,7 @@ def handle_supplier_rating(code):
     
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -941,7 +1026,7 @@ def handle_supplier_rating(code):
                 # 如果是D或E评级，将供应商状态改为非活跃
                 if rating in ['D', 'E']:
                     # 重新连接以更新状态
-                    conn = sqlite3.connect(db_path)
+                    conn = sql_profiler.connect(db_path)
                     cursor = conn.cursor()
                     cursor.execute("UPDATE suppliers SET status = '非活跃' WHERE code = ?", (code,))
                     conn.commit()
@@ -987,7 +1072,7 @@ def supplier_contracts():
     
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1026,7 +1111,7 @@ def supplier_contracts():
 def new_contract():
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1058,22 +1143,11 @@ def new_contract():
         if 'contract_file' in request.files:
             file = request.files['contract_file']
             if file and file.filename:
-                # 确保上传目录存在
-                upload_dir = os.path.join('static', 'uploads', 'contracts')
-                if not os.path.exists(upload_dir):
-                    os.makedirs(upload_dir)
-                
                 # 获取原始文件名和扩展名
                 original_filename = secure_filename(file.filename)
                 file_type = os.path.splitext(original_filename)[1]
-                # 使用合同ID和原始扩展名构造新文件名
-                filename = f"{contract_id}{file_type}"
-                # 保存文件
-                filename = f"{contract_id}_{secure_filename(file.filename)}"
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                # 存储相对路径
-                file_path = os.path.join('uploads', 'contracts', filename)
+                # 保存到内容寻址存储，存储相对路径
+                file_path = blob_store.save(file.stream)['path']
         
         try:
             # 开始事务
@@ -1083,11 +1157,13 @@ def new_contract():
             cursor.execute('''
             INSERT INTO supplier_contracts (
                 contract_id, supplier_code, contract_date, effective_date, expiry_date,
-                contract_type, contract_terms, file_path, status, creator, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                contract_type, contract_terms, file_path, file_type, original_filename,
+                status, creator, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
             ''', (
                 contract_id, supplier_code, contract_date, effective_date, expiry_date,
-                contract_type, contract_terms, file_path, '有效', session['username']
+                contract_type, contract_terms, file_path, file_type, original_filename,
+                '有效', session['username']
             ))
             
             # 检查供应商是否已存在
@@ -1124,9 +1200,11 @@ def new_contract():
             
         except sqlite3.IntegrityError:
             cursor.execute("ROLLBACK")
+            blob_store.release(cursor, file_path)
             flash('合同ID已存在或供应商代码无效！', 'danger')
         except Exception as e:
             cursor.execute("ROLLBACK")
+            blob_store.release(cursor, file_path)
             flash(f'添加失败: {str(e)}', 'danger')
         finally:
             conn.close()
@@ -1156,7 +1234,7 @@ def new_contract():
 def view_contract(contract_id):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1184,22 +1262,42 @@ def view_contract(contract_id):
 def download_contract(contract_id):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     # 获取合同文件路径
-    cursor.execute("SELECT file_path FROM supplier_contracts WHERE contract_id = ?", (contract_id,))
+    cursor.execute("SELECT file_path, original_filename FROM supplier_contracts WHERE contract_id = ?", (contract_id,))
     result = cursor.fetchone()
     
     conn.close()
     
-    if not result or not result['file_path']:
+    if not result or not result['file_path'] or not os.path.exists(os.path.join('static', result['file_path'])):
         flash('合同文件不存在！', 'danger')
         return redirect(url_for('view_contract', contract_id=contract_id))
     
-    file_path = os.path.join('static', result['file_path'])
-    return send_file(file_path, as_attachment=True)
+    return send_blob(result['file_path'], result['original_filename'] or os.path.basename(result['file_path']))
+
+def send_blob(relative_path, download_name):
+    """发送附件文件：blob 以哈希作 ETag 并允许长期缓存，底层由 wsgi.file_wrapper 零拷贝发送"""
+    file_path = os.path.join('static', relative_path)
+    digest = blob_store.digest_of(relative_path)
+    if not digest:
+        return send_file(file_path, download_name=download_name, as_attachment=True)
+    
+    response = send_file(
+        file_path,
+        download_name=download_name,
+        as_attachment=True,
+        conditional=True,
+        etag=digest,
+        max_age=BLOB_CACHE_MAX_AGE
+    )
+    # 合同和附件属于内部资料，只允许浏览器缓存，不允许共享代理缓存
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/purchase/unified')
 def purchase_unified():
@@ -1211,7 +1309,7 @@ def purchase_unified():
     
     # 连接数据库获取采购单列表
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1265,7 +1363,7 @@ def purchase_unified():
 def new_purchase_order():
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1359,11 +1457,16 @@ def new_purchase_order():
                           current_date=datetime.now().strftime('%Y-%m-%d'),
                           item_categories=item_categories)
 
+# 批量导入采购单明细（CSV/XLSX）
+@app.route('/purchase/unified/import_items', methods=['POST'])
+def import_purchase_order_items():
+    return run_bulk_import(PurchaseOrderItemImporter)
+
 @app.route('/purchase/unified/view/<order_id>')
 def view_purchase_order(order_id):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1410,7 +1513,7 @@ def view_purchase_order(order_id):
 def edit_purchase_order(order_id):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1507,7 +1610,7 @@ def edit_purchase_order(order_id):
 def delete_purchase_order(order_id):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     cursor = conn.cursor()
     
     try:
@@ -1571,7 +1674,7 @@ def suppliers():
 def rate_supplier(code):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1722,7 +1825,7 @@ def rate_supplier(code):
 def supplier_ratings(code):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -1753,23 +1856,23 @@ def supplier_ratings(code):
 # 添加批量操作路由
 @app.route('/purchase/batch_operation', methods=['POST'])
 def batch_operation():
-    print("Received batch operation request")  # 添加日志
+    logger.debug("Received batch operation request")  # 添加日志
     try:
         # 获取JSON数据
         data = request.get_json()
-        print("Request data:", data)  # 添加日志
+        logger.debug("Request data: %s", data)  # 添加日志
         
         if not data or 'order_ids' not in data or 'operation' not in data:
-            print("Invalid request data")  # 添加日志
+            logger.warning("Invalid request data")  # 添加日志
             return jsonify({"status": "error", "message": "参数错误"}), 400
         
         order_ids = data['order_ids']
         operation = data['operation']
-        print(f"Processing operation: {operation} for orders: {order_ids}")  # 添加日志
+        logger.debug("Processing operation: %s for orders: %s", operation, order_ids)  # 添加日志
         
         # 连接数据库
         db_path = os.path.join('data', 'restaurant.db')
-        conn = sqlite3.connect(db_path)
+        conn = sql_profiler.connect(db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -1787,7 +1890,7 @@ def batch_operation():
         error_messages = []
         
         for order_id in order_ids:
-            print(f"Processing order: {order_id}")  # 添加日志
+            logger.debug("Processing order: %s", order_id)  # 添加日志
             # 获取当前订单状态
             cursor.execute("SELECT status FROM purchase_orders WHERE order_id = ?", (order_id,))
             result = cursor.fetchone()
@@ -1797,7 +1900,7 @@ def batch_operation():
                 continue
             
             current_status = result['status']
-            print(f"Current status for order {order_id}: {current_status}")  # 添加日志
+            logger.debug("Current status for order %s: %s", order_id, current_status)  # 添加日志
             
             # 根据操作类型执行相应操作
             if operation == 'delete':
@@ -1809,7 +1912,7 @@ def batch_operation():
                     success_count += 1
                 except Exception as e:
                     error_messages.append(f"删除订单 {order_id} 失败: {str(e)}")
-                    print(f"Error deleting order {order_id}: {str(e)}")  # 添加日志
+                    logger.exception("Error deleting order %s: %s", order_id, e)  # 添加日志
                 
             elif operation in status_map:
                 # 检查状态转换是否合法
@@ -1836,17 +1939,17 @@ def batch_operation():
                         WHERE order_id = ?
                         ''', (new_status, session.get('username', 'system'), order_id))
                         success_count += 1
-                        print(f"Successfully updated order {order_id} to status {new_status}")  # 添加日志
+                        logger.debug("Successfully updated order %s to status %s", order_id, new_status)  # 添加日志
                     except Exception as e:
                         error_messages.append(f"更新订单 {order_id} 状态失败: {str(e)}")
-                        print(f"Error updating order {order_id}: {str(e)}")  # 添加日志
+                        logger.exception("Error updating order %s: %s", order_id, e)  # 添加日志
                 else:
                     error_messages.append(f"订单 {order_id} 当前状态为 {current_status}，无法转换为 {new_status}")
-                    print(f"Invalid status transition for order {order_id}: {current_status} -> {new_status}")  # 添加日志
+                    logger.warning("Invalid status transition for order %s: %s -> %s", order_id, current_status, new_status)  # 添加日志
             
             else:
                 error_messages.append(f"不支持的操作类型: {operation}")
-                print(f"Unsupported operation: {operation}")  # 添加日志
+                logger.warning("Unsupported operation: %s", operation)  # 添加日志
                 break
         
         # 提交事务
@@ -1868,7 +1971,7 @@ def batch_operation():
             if error_messages:
                 message += f"，但有 {len(error_messages)} 个订单操作失败：{', '.join(error_messages)}"
             
-            print(f"Operation completed: {message}")  # 添加日志
+            logger.debug("Operation completed: %s", message)  # 添加日志
             return jsonify({
                 "status": "success",
                 "message": message,
@@ -1877,66 +1980,26 @@ def batch_operation():
             })
         else:
             message = "操作失败: " + ", ".join(error_messages)
-            print(f"Operation failed: {message}")  # 添加日志
+            logger.warning("Operation failed: %s", message)  # 添加日志
             return jsonify({
                 "status": "error",
                 "message": message
             })
             
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")  # 添加日志
+        logger.exception("Unexpected error: %s", e)  # 添加日志
         return jsonify({"status": "error", "message": f"操作失败: {str(e)}"}), 500
     
     finally:
         if 'conn' in locals():
             conn.close()
-            print("Database connection closed")  # 添加日志
-
-def migrate_contract_files():
-    """迁移现有合同文件记录，添加文件类型信息"""
-    db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    try:
-        # 检查是否需要添加新列
-        cursor.execute("PRAGMA table_info(supplier_contracts)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        # 添加新列
-        if 'file_type' not in columns:
-            cursor.execute("ALTER TABLE supplier_contracts ADD COLUMN file_type TEXT")
-        if 'original_filename' not in columns:
-            cursor.execute("ALTER TABLE supplier_contracts ADD COLUMN original_filename TEXT")
-        
-        # 更新现有记录的文件类型
-        cursor.execute("SELECT contract_id, file_path FROM supplier_contracts WHERE file_type IS NULL AND file_path IS NOT NULL")
-        records = cursor.fetchall()
-        
-        for record in records:
-            contract_id, file_path = record
-            if file_path:
-                file_type = os.path.splitext(file_path)[1]
-                original_filename = os.path.basename(file_path)
-                cursor.execute("""
-                    UPDATE supplier_contracts 
-                    SET file_type = ?, original_filename = ?
-                    WHERE contract_id = ?
-                """, (file_type, original_filename, contract_id))
-        
-        conn.commit()
-        print("合同文件记录迁移完成")
-    except Exception as e:
-        print(f"迁移失败: {str(e)}")
-        conn.rollback()
-    finally:
-        conn.close()
+            logger.debug("Database connection closed")  # 添加日志
 
 @app.route('/purchase/contract/delete/<contract_id>', methods=['POST'])
 def delete_contract(contract_id):
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     cursor = conn.cursor()
     
     try:
@@ -1944,15 +2007,18 @@ def delete_contract(contract_id):
         cursor.execute("SELECT file_path FROM supplier_contracts WHERE contract_id = ?", (contract_id,))
         result = cursor.fetchone()
         
+        # 删除合同记录
+        cursor.execute("DELETE FROM supplier_contracts WHERE contract_id = ?", (contract_id,))
+        conn.commit()
+        
         if result and result[0]:
-            # 删除实际文件
+            # 提交后再删除实际文件：blob 只在没有其他合同或附件引用时回收
             file_path = os.path.join('static', result[0])
-            if os.path.exists(file_path):
+            if blob_store.is_blob(result[0]):
+                blob_store.release(cursor, result[0])
+            elif os.path.exists(file_path):
                 os.remove(file_path)
         
-        # 删除合同记录
-        cursor.execute("DELETE FROM supplier_contracts WHERE contract_id = ?", (contract_id,))
-        conn.commit()
         flash('合同已成功删除！', 'success')
         
     except Exception as e:
@@ -1966,11 +2032,22 @@ def delete_contract(contract_id):
 @app.route('/purchase/analysis')
 def purchase_analysis():
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     try:
+        # 供应商、评级、采购单有变化时版本号递增；日期也是键的一部分，跨天后重新统计
+        today = datetime.now().strftime('%Y-%m-%d')
+        cache_version = fragment_cache.data_version(conn, 'purchase')
+        cache_key = ('purchase_analysis', today, cache_version)
+        stats = fragment_cache.cache.get(cache_key)
+        if stats is not None:
+            return render_template('purchase/analysis.html',
+                                 username=session['username'],
+                                 cache_version=cache_version,
+                                 **stats)
+        
         # 1. 基础统计数据
         # 供应商总数
         cursor.execute("SELECT COUNT(*) as total FROM suppliers WHERE status = '活跃'")
@@ -1986,7 +2063,6 @@ def purchase_analysis():
         total_purchase_amount = cursor.fetchone()['total']
         
         # 今日采购额
-        today = datetime.now().strftime('%Y-%m-%d')
         cursor.execute("""
             SELECT COALESCE(SUM(poi.total_price), 0) as total
             FROM purchase_order_items poi
@@ -2123,17 +2199,21 @@ def purchase_analysis():
                     'ratings': sorted(ratings, key=lambda x: x['sequence'])  # 按序号排序
                 })
         
+        stats = dict(active_suppliers=active_suppliers,
+                     total_purchase_amount=total_purchase_amount,
+                     today_purchase_amount=today_purchase_amount,
+                     today_purchase_count=today_purchase_count,
+                     supplier_percentages=supplier_percentages,
+                     monthly_stats=monthly_stats,
+                     rating_trends=rating_trends,
+                     item_stats=item_stats,
+                     category_stats=category_stats)
+        fragment_cache.cache.set(cache_key, stats)
+        
         return render_template('purchase/analysis.html',
                              username=session['username'],
-                             active_suppliers=active_suppliers,
-                             total_purchase_amount=total_purchase_amount,
-                             today_purchase_amount=today_purchase_amount,
-                             today_purchase_count=today_purchase_count,
-                             supplier_percentages=supplier_percentages,
-                             monthly_stats=monthly_stats,
-                             rating_trends=rating_trends,
-                             item_stats=item_stats,
-                             category_stats=category_stats)
+                             cache_version=cache_version,
+                             **stats)
     
     except Exception as e:
         flash(f'数据加载失败: {str(e)}', 'danger')
@@ -2141,51 +2221,63 @@ def purchase_analysis():
     finally:
         conn.close()
 
-# 添加数据库迁移函数
-def migrate_item_type():
-    """添加物资类型字段并设置默认分类"""
-    db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+# 三单匹配：采购单、入库单、发票/收据对账
+@app.route('/purchase/reconciliation/run', methods=['POST'])
+def run_reconciliation():
+    data = request.get_json(silent=True) or request.form
+    incremental = str(data.get('incremental', '')).lower() in ('1', 'true', 'yes')
+    date_from = data.get('date_from')
+    date_to = data.get('date_to')
     
+    if not incremental and not (date_from and date_to):
+        return jsonify({"status": "error", "message": "请提供对账起止日期，或使用增量对账"}), 400
+    
+    conn = get_db_connection()
     try:
-        # 检查是否已存在 item_type 列
-        cursor.execute("PRAGMA table_info(purchase_order_items)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'item_type' not in columns:
-            # 添加 item_type 列
-            cursor.execute("ALTER TABLE purchase_order_items ADD COLUMN item_type TEXT")
-            
-            # 根据商品名称设置默认分类
-            cursor.execute("""
-                UPDATE purchase_order_items 
-                SET item_type = CASE
-                    WHEN item_name LIKE '%肉%' OR item_name LIKE '%鸡%' OR item_name LIKE '%鸭%' OR 
-                         item_name LIKE '%鱼%' OR item_name LIKE '%虾%' THEN '肉类'
-                    WHEN item_name LIKE '%菜%' OR item_name LIKE '%葱%' OR item_name LIKE '%姜%' OR 
-                         item_name LIKE '%蒜%' OR item_name LIKE '%白菜%' OR item_name LIKE '%萝卜%' THEN '蔬菜类'
-                    WHEN item_name LIKE '%盐%' OR item_name LIKE '%糖%' OR item_name LIKE '%酱%' OR 
-                         item_name LIKE '%油%' OR item_name LIKE '%醋%' THEN '调料类'
-                    WHEN item_name LIKE '%米%' OR item_name LIKE '%面%' OR item_name LIKE '%粉%' THEN '主食类'
-                    WHEN item_name LIKE '%蛋%' OR item_name LIKE '%奶%' THEN '蛋奶类'
-                    ELSE '其他'
-                END
-                WHERE item_type IS NULL
-            """)
-            
-            # 设置 item_type 为非空
-            cursor.execute("""
-                UPDATE purchase_order_items 
-                SET item_type = '其他'
-                WHERE item_type IS NULL
-            """)
-            
-            conn.commit()
-            print("物资类型字段添加成功")
+        summary = ThreeWayMatcher(conn).run(date_from, date_to, incremental=incremental)
+        return jsonify({"status": "success", **summary})
     except Exception as e:
-        print(f"迁移失败: {str(e)}")
         conn.rollback()
+        return jsonify({"status": "error", "message": f"对账失败: {str(e)}"}), 500
+    finally:
+        conn.close()
+
+# 查询对账结果
+@app.route('/purchase/reconciliation/results')
+def reconciliation_results():
+    status = request.args.get('status', '')
+    match_type = request.args.get('match_type', '')
+    order_id = request.args.get('order_id', '')
+    exceptions_only = request.args.get('exceptions_only') == '1'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 100, type=int), 1), 1000)
+    
+    query = "SELECT * FROM purchase_match_results WHERE 1=1"
+    params = []
+    if status:
+        query += " AND status = ?"
+        params.append(status)
+    if match_type:
+        query += " AND match_type = ?"
+        params.append(match_type)
+    if order_id:
+        query += " AND order_id = ?"
+        params.append(order_id)
+    if exceptions_only:
+        query += " AND status != ?"
+        params.append(MATCHED)
+    query += " ORDER BY id DESC LIMIT ? OFFSET ?"
+    params.extend([per_page, (page - 1) * per_page])
+    
+    conn = get_db_connection()
+    try:
+        results = json_provider.dict_cursor(conn).execute(query, params).fetchall()
+        last_run = conn.execute("SELECT * FROM purchase_match_runs ORDER BY id DESC LIMIT 1").fetchone()
+        return jsonify({
+            "status": "success",
+            "results": results,
+            "last_run": dict(last_run) if last_run else None
+        })
     finally:
         conn.close()
 
@@ -2194,7 +2286,7 @@ def migrate_item_type():
 def purchase_documents():
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -2246,7 +2338,7 @@ def purchase_invoices():
     
     # 连接数据库
     db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -2470,7 +2562,7 @@ def purchase_receipts():
                              date_to=date_to)
 
     except Exception as e:
-        print(f"Error in purchase_receipts: {str(e)}")
+        logger.exception("Error in purchase_receipts: %s", e)
         flash('获取收据列表失败：' + str(e), 'error')
         return redirect(url_for('purchase_documents'))
 
@@ -2549,7 +2641,7 @@ def add_receipt():
         return jsonify({'status': 'success', 'message': '收据添加成功'})
 
     except Exception as e:
-        print(f"Error in add_receipt: {str(e)}")
+        logger.exception("Error in add_receipt: %s", e)
         return jsonify({'status': 'error', 'message': f'添加收据失败: {str(e)}'})
 
 @app.route('/purchase/receipts/<int:receipt_id>', methods=['GET'])
@@ -2603,7 +2695,7 @@ def get_receipt(receipt_id):
         })
 
     except Exception as e:
-        print(f"Error in get_receipt: {str(e)}")
+        logger.exception("Error in get_receipt: %s", e)
         return jsonify({'status': 'error', 'message': f'获取收据详情失败: {str(e)}'})
 
 @app.route('/purchase/receipts/<int:receipt_id>', methods=['PUT'])
@@ -2718,7 +2810,7 @@ def update_receipt(receipt_id):
         return jsonify({'status': 'success', 'message': '收据更新成功'})
 
     except Exception as e:
-        print(f"Error in update_receipt: {str(e)}")
+        logger.exception("Error in update_receipt: %s", e)
         return jsonify({'status': 'error', 'message': f'更新收据失败: {str(e)}'})
 
 @app.route('/purchase/receipts/<int:receipt_id>', methods=['DELETE'])
@@ -2752,7 +2844,7 @@ def delete_receipt(receipt_id):
         return jsonify({'status': 'success', 'message': '收据已作废'})
 
     except Exception as e:
-        print(f"Error in delete_receipt: {str(e)}")
+        logger.exception("Error in delete_receipt: %s", e)
         return jsonify({'status': 'error', 'message': '作废收据失败'})
 
 @app.route('/purchase/receipts/<int:receipt_id>/confirm', methods=['POST'])
@@ -2796,7 +2888,7 @@ def confirm_receipt(receipt_id):
         })
 
     except Exception as e:
-        print(f"Error in confirm_receipt: {str(e)}")
+        logger.exception("Error in confirm_receipt: %s", e)
         if conn:
             conn.rollback()
             conn.close()
@@ -2813,7 +2905,7 @@ def add_invoice():
         
         # 连接数据库
         db_path = os.path.join('data', 'restaurant.db')
-        conn = sqlite3.connect(db_path)
+        conn = sql_profiler.connect(db_path)
         cursor = conn.cursor()
         
         # 生成发票ID
@@ -2884,7 +2976,7 @@ def add_invoice():
 def get_invoice(invoice_id):
         
     try:
-        conn = sqlite3.connect(os.path.join('data', 'restaurant.db'))
+        conn = sql_profiler.connect(os.path.join('data', 'restaurant.db'))
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -2970,7 +3062,7 @@ def update_invoice(invoice_id):
         
     except Exception as e:
         conn.rollback()
-        print(f"Error: {str(e)}")
+        logger.exception("Error: %s", e)
         return jsonify({'status': 'error', 'message': '发票更新失败'})
         
     finally:
@@ -3018,7 +3110,7 @@ def delete_invoice(invoice_id):
         
     except Exception as e:
         conn.rollback()
-        print(f"Error: {str(e)}")
+        logger.exception("Error: %s", e)
         return jsonify({'status': 'error', 'message': '发票删除失败'})
         
     finally:
@@ -3054,75 +3146,13 @@ def get_invoice_details(invoice_id):
         })
         
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception("Error: %s", e)
         return jsonify({'status': 'error', 'message': f'获取发票详情失败: {str(e)}'})
         
     finally:
         if conn:
             conn.close()
 
-def migrate_invoice_table():
-    """迁移发票表结构，添加新字段"""
-    db_path = os.path.join('data', 'restaurant.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    try:
-        # 检查是否需要添加新列
-        cursor.execute("PRAGMA table_info(purchase_invoices)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        # 添加新列
-        if 'related_orders' not in columns:
-            cursor.execute("ALTER TABLE purchase_invoices ADD COLUMN related_orders TEXT")
-            print("发票表迁移完成：添加了 related_orders 字段")
-        
-        if 'scan_file' not in columns and 'file_path' in columns:
-            # 重命名 file_path 为 scan_file
-            cursor.execute("""
-                CREATE TABLE purchase_invoices_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    invoice_id TEXT UNIQUE NOT NULL,
-                    invoice_type TEXT NOT NULL,
-                    invoice_code TEXT NOT NULL,
-                    invoice_number TEXT NOT NULL,
-                    invoice_date DATE NOT NULL,
-                    supplier_id TEXT NOT NULL,
-                    total_amount DECIMAL(10,2) NOT NULL,
-                    tax_amount DECIMAL(10,2),
-                    related_orders TEXT,
-                    scan_file TEXT,
-                    remarks TEXT,
-                    status TEXT DEFAULT '待审核',
-                    created_by TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (supplier_id) REFERENCES suppliers (code)
-                )
-            """)
-            
-            # 复制数据，将 file_path 复制到 scan_file
-            cursor.execute("""
-                INSERT INTO purchase_invoices_new 
-                SELECT id, invoice_id, invoice_type, invoice_code, invoice_number, 
-                       invoice_date, supplier_id, total_amount, tax_amount, 
-                       NULL as related_orders, file_path as scan_file, remarks, 
-                       status, created_by, created_at
-                FROM purchase_invoices
-            """)
-            
-            # 删除旧表并重命名新表
-            cursor.execute("DROP TABLE purchase_invoices")
-            cursor.execute("ALTER TABLE purchase_invoices_new RENAME TO purchase_invoices")
-            print("发票表迁移完成：file_path 重命名为 scan_file")
-        
-        conn.commit()
-        
-    except Exception as e:
-        print(f"发票表迁移失败: {str(e)}")
-        conn.rollback()
-    finally:
-        conn.close()
-
 @app.route('/purchase/invoices/<invoice_id>/review', methods=['POST'])
 def review_invoice(invoice_id):
         
@@ -3160,88 +3190,190 @@ def review_invoice(invoice_id):
         
     except Exception as e:
         conn.rollback()
-        print(f"Error: {str(e)}")
+        logger.exception("Error: %s", e)
         return jsonify({'status': 'error', 'message': f'发票审核失败: {str(e)}'})
         
     finally:
         if conn:
             conn.close()
 
-def migrate_receipts_table():
-    """迁移收据表结构，添加新字段"""
+# 以下为迁移步骤，只由 MigrationRunner 执行一次；大表上的数据改写分批提交，不会长时间锁库
+def add_item_type(conn):
+    """采购明细增加物资编码和物资类型，并按商品名称设置默认分类"""
+    # 采购单录入和批量导入都按物资编码写入明细
+    add_columns(conn, 'purchase_order_items', {'item_code': 'TEXT', 'item_type': 'TEXT'})
+    update_in_batches(conn, 'purchase_order_items', """
+        item_type = CASE
+            WHEN item_name LIKE '%肉%' OR item_name LIKE '%鸡%' OR item_name LIKE '%鸭%' OR 
+                 item_name LIKE '%鱼%' OR item_name LIKE '%虾%' THEN '肉类'
+            WHEN item_name LIKE '%菜%' OR item_name LIKE '%葱%' OR item_name LIKE '%姜%' OR 
+                 item_name LIKE '%蒜%' OR item_name LIKE '%白菜%' OR item_name LIKE '%萝卜%' THEN '蔬菜类'
+            WHEN item_name LIKE '%盐%' OR item_name LIKE '%糖%' OR item_name LIKE '%酱%' OR 
+                 item_name LIKE '%油%' OR item_name LIKE '%醋%' THEN '调料类'
+            WHEN item_name LIKE '%米%' OR item_name LIKE '%面%' OR item_name LIKE '%粉%' THEN '主食类'
+            WHEN item_name LIKE '%蛋%' OR item_name LIKE '%奶%' THEN '蛋奶类'
+            ELSE '其他'
+        END
+    """, where='item_type IS NULL', label='采购明细物资分类')
+
+def add_contract_file_info(conn):
+    """合同记录增加文件类型和原始文件名，按已有文件路径补齐"""
+    add_columns(conn, 'supplier_contracts', {'file_type': 'TEXT', 'original_filename': 'TEXT'})
+    for low, high in rowid_batches(conn, 'supplier_contracts', label='合同文件信息'):
+        rows = conn.execute("""
+            SELECT contract_id, file_path FROM supplier_contracts
+            WHERE rowid BETWEEN ? AND ? AND file_type IS NULL AND file_path IS NOT NULL AND file_path != ''
+        """, (low, high)).fetchall()
+        conn.executemany("""
+            UPDATE supplier_contracts SET file_type = ?, original_filename = ? WHERE contract_id = ?
+        """, [(os.path.splitext(file_path)[1], os.path.basename(file_path), contract_id)
+              for contract_id, file_path in rows])
+
+def move_files_to_blob_store(conn):
+    """将旧的合同和检验附件文件迁移到内容寻址存储，重复文件合并为同一个 blob"""
+    # 旧路径 -> blob 路径，多条记录指向同一旧文件时复用迁移结果
+    migrated = {}
+    for table, key in (('inspection_attachments', 'id'), ('supplier_contracts', 'contract_id')):
+        for low, high in rowid_batches(conn, table, label=f'{table} 附件迁移'):
+            rows = conn.execute(f"""
+                SELECT {key}, file_path FROM {table}
+                WHERE rowid BETWEEN ? AND ? AND file_path IS NOT NULL AND file_path != ''
+            """, (low, high)).fetchall()
+            updates = []
+            for record_key, file_path in rows:
+                if blob_store.is_blob(file_path):
+                    continue
+                if file_path not in migrated:
+                    source_path = os.path.join('static', file_path)
+                    if not os.path.exists(source_path):
+                        continue
+                    migrated[file_path] = blob_store.save_file(source_path, remove_source=True)['path']
+                updates.append((migrated[file_path], record_key))
+            conn.executemany(f"UPDATE {table} SET file_path = ? WHERE {key} = ?", updates)
+    if migrated:
+        logger.info("已迁移 %s 个文件到内容寻址存储", len(migrated))
+
+def upgrade_invoice_table(conn):
+    """发票表增加关联订单字段，旧版的 file_path 列改名为 scan_file（分批复制重建）"""
+    columns = table_columns(conn, 'purchase_invoices')
+    if 'scan_file' in columns or 'file_path' not in columns:
+        add_columns(conn, 'purchase_invoices', {'related_orders': 'TEXT', 'scan_file': 'TEXT'})
+        return
+    related_orders = 'related_orders' if 'related_orders' in columns else 'NULL'
+    rebuild_table(conn, 'purchase_invoices', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id TEXT UNIQUE NOT NULL,
+            invoice_type TEXT NOT NULL,
+            invoice_code TEXT NOT NULL,
+            invoice_number TEXT NOT NULL,
+            invoice_date DATE NOT NULL,
+            supplier_id TEXT NOT NULL,
+            total_amount DECIMAL(10,2) NOT NULL,
+            tax_amount DECIMAL(10,2),
+            related_orders TEXT,
+            scan_file TEXT,
+            remarks TEXT,
+            status TEXT DEFAULT '待审核',
+            created_by TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (supplier_id) REFERENCES suppliers (code)
+        )
+    ''', columns='''id, invoice_id, invoice_type, invoice_code, invoice_number, invoice_date, supplier_id,
+                    total_amount, tax_amount, related_orders, scan_file, remarks, status, created_by, created_at''',
+        select=f'''id, invoice_id, invoice_type, invoice_code, invoice_number, invoice_date, supplier_id,
+                   total_amount, tax_amount, {related_orders}, file_path, remarks, status, created_by, created_at''')
+    logger.info("发票表迁移完成：file_path 重命名为 scan_file")
+
+def add_receipt_columns(conn):
+    """收据表补齐字段（旧库中的收据表缺少收付款方等信息）"""
+    add_columns(conn, 'purchase_receipts', {
+        'receipt_type': 'TEXT',
+        'receipt_number': 'TEXT',
+        'receipt_date': 'DATE',
+        'amount': 'DECIMAL(10,2)',
+        'payment_method': 'TEXT',
+        'purpose': 'TEXT',
+        'remarks': 'TEXT',
+        'scan_file': 'TEXT',
+        'status': "TEXT DEFAULT '待确认'",
+        'created_by': 'TEXT',
+        'created_at': 'TIMESTAMP',
+        'updated_by': 'TEXT',
+        'updated_at': 'TIMESTAMP',
+        'receipt_party_type': 'TEXT',
+        'receipt_party_id': 'TEXT',
+        'receipt_party_name': 'TEXT',
+        'issuing_party_type': 'TEXT',
+        'issuing_party_id': 'TEXT',
+        'issuing_party_name': 'TEXT',
+    })
+
+def add_data_versions(conn):
+    """供应商、评级和采购单写入时递增 data_versions 中的版本号，采购分析按版本号缓存"""
+    fragment_cache.install_version_triggers(
+        conn, 'purchase', ['suppliers', 'supplier_ratings', 'purchase_orders', 'purchase_order_items'])
+
+# 数据库迁移：按版本号顺序执行，已执行的记录及校验和在 schema_version 表中，启动时不再重复探测
+# 已发布的步骤不要修改，表结构变更请追加新版本
+MIGRATIONS = [
+    Migration(1, '创建采购基础表', lambda conn: init_db()),
+    Migration(2, '采购明细增加物资类型和物资编码', add_item_type),
+    Migration(3, '合同文件记录迁移', add_contract_file_info),
+    Migration(4, '附件迁移到内容寻址存储', move_files_to_blob_store),
+    Migration(5, '发票表增加关联订单和扫描件字段', upgrade_invoice_table),
+    Migration(6, '收据表补齐字段', add_receipt_columns),
+    Migration(7, '采购数据版本号', add_data_versions),
+]
+
+def run_migrations():
+    return MigrationRunner(os.path.join('data', 'restaurant.db'), 'purchase', MIGRATIONS).run()
+
+def create_app():
+    """应用工厂：准备数据目录并执行未应用的迁移；导入本模块不会访问数据库"""
+    os.makedirs('data', exist_ok=True)
+    run_migrations()
+    return app
+
+@metrics.track_job('collect_blob_garbage')
+def collect_blob_garbage():
+    """定时任务：回收没有引用的附件和合同文件，包括 release() 因宽限期跳过的文件"""
+    conn = get_db_connection()
     try:
-        # 连接数据库
-        db_path = os.path.join('data', 'restaurant.db')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # 获取当前表结构
-        cursor.execute("PRAGMA table_info(purchase_receipts)")
-        columns = [column[1] for column in cursor.fetchall()]
-
-        # 需要添加的字段列表
-        required_columns = {
-            'receipt_type': 'TEXT NOT NULL',
-            'receipt_number': 'TEXT NOT NULL',
-            'receipt_date': 'DATE NOT NULL',
-            'amount': 'DECIMAL(10,2) NOT NULL',
-            'payment_method': 'TEXT NOT NULL',
-            'purpose': 'TEXT NOT NULL',
-            'remarks': 'TEXT',
-            'scan_file': 'TEXT',
-            'status': 'TEXT DEFAULT "待确认"',
-            'created_by': 'TEXT NOT NULL',
-            'created_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
-            'updated_by': 'TEXT',
-            'updated_at': 'TIMESTAMP',
-            'receipt_party_type': 'TEXT NOT NULL',
-            'receipt_party_id': 'TEXT',
-            'receipt_party_name': 'TEXT',
-            'issuing_party_type': 'TEXT NOT NULL',
-            'issuing_party_id': 'TEXT',
-            'issuing_party_name': 'TEXT'
-        }
-
-        # 添加缺失的列
-        for column, type_def in required_columns.items():
-            if column not in columns:
-                try:
-                    cursor.execute(f"ALTER TABLE purchase_receipts ADD COLUMN {column} {type_def}")
-                    print(f"Added column {column} to purchase_receipts table")
-                except Exception as e:
-                    print(f"Error adding column {column}: {str(e)}")
-
-        conn.commit()
-        print("收据表迁移完成")
-
+        removed = blob_store.collect_garbage(conn.cursor())
+        logger.info("回收无引用的附件文件 %d 个", removed)
     except Exception as e:
-        print(f"收据表迁移失败: {str(e)}")
-        conn.rollback()
+        logger.exception("回收附件文件时出错: %s", e)
+        raise
     finally:
         conn.close()
 
+def start_scheduler():
+    """启动定时任务；多进程部署时只由选举出的主节点调用（见 gunicorn.conf.py）"""
+    # 调度器只在主节点用到，延迟导入以加快启动
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    # 每天凌晨回收一次无引用的附件
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(
+        collect_blob_garbage,
+        trigger=CronTrigger(hour=4),
+        id='collect_blob_garbage',
+        name='附件回收',
+        replace_existing=True
+    )
+    scheduler.start()
+    return scheduler
+
 if __name__ == '__main__':
     try:
-        # 初始化数据库
-        db_exists = init_db()
-        
-        # 如果是首次创建数据库，显示提示信息
-        if not db_exists:
-            print("数据库初始化完成！")
-            print("默认管理员账户：")
-            print("用户名: admin")
-            print("密码: admin123")
-        
-        # 执行数据库迁移
-        migrate_item_type()
-        migrate_contract_files()
-        migrate_invoice_table()
-        migrate_receipts_table()  # 添加这一行
+        create_app()
+        start_scheduler()
         
         # 运行应用
         app.run(debug=True)
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception("Error: %s", e)
         import traceback
         traceback.print_exc()
-
@@ -1,39 +1,78 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
 import sqlite3
+import logging
 import os
 import json
 from datetime import datetime, timedelta
 import uuid
-import xlsxwriter
 import io
 from werkzeug.utils import secure_filename
 import time
+from recipe_consumption import ConsumptionPoster, init_recipe_tables, get_recipe, save_recipe
+from order_archive import OrderArchiver, attach_order_history
+import db_backup
+import sql_profiler
+import metrics
+import static_assets
+import compression
+import json_provider
+import fragment_cache
+import order_events
+import menu_snapshot
+import session_store
+import thumbnails
+import log_config
+from migrations import Migration, MigrationRunner, add_columns, rowid_batches
+
+# 日志经队列由后台线程输出，级别与格式见 log_config
+log_config.configure_logging()
+logger = logging.getLogger('app_sales')
 
 app = Flask(__name__)
 app.secret_key = 'sales_management_key'
 
+# 每个请求的 SQL 次数与耗时（响应头 X-SQL-Query-Count / X-SQL-Query-Time，明细见 /debug/queries）
+profiler = sql_profiler.SQLProfiler(app)
+# 请求耗时、SQL 耗时等指标，Prometheus 从 /metrics 抓取
+metrics.init_app(app, 'sales')
+# 静态资源使用构建生成的指纹文件名、预压缩版本和长缓存（python -m static_assets build）
+assets = static_assets.StaticAssets(app)
+# 文本响应按 Accept-Encoding 压缩（级别见 compression.py 的环境变量）
+compression.init_app(app)
+# jsonify 使用 orjson 编码（未安装时回退到标准库），大列表流式输出
+json_provider.init_app(app)
+# 菜品图片的响应式缩略图（模板中使用 responsive_image）
+thumbnails.init_app(app)
+# 模板片段缓存：{% cache 名称, cache_version %}...{% endcache %}
+fragment_cache.init_app(app)
+
+# 订单状态变化经 /sales/orders/events 推送给后厨和前台屏幕（见 order_events.py）
+order_feed = order_events.EventHub(os.path.join('data', 'sales.db'))
+# 在售菜品快照，按 data_versions 中的版本号失效（见 menu_snapshot.py）
+menu_cache = menu_snapshot.MenuSnapshotCache()
+
 # 会话配置
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
-app.config['SESSION_TYPE'] = 'filesystem'
+# 会话只在内容变化时写回；SESSION_TYPE=sqlite 时存到服务端（见 session_store.py）
+session_store.init_app(app)
 
 @app.before_request
 def ensure_username():
+    # 静态资源、API 和指标接口不读写会话
+    if session_store.is_sessionless():
+        return
     if 'username' not in session:
         # 设置默认用户名和其他必要会话信息
         session['username'] = '管理员'
 
 def init_db():
-    """初始化数据库，只在数据库不存在时创建新的数据库"""
+    """初始化数据库表（由迁移 v1 执行一次）"""
     db_path = 'data/sales.db'
     
-    # 如果数据库已存在，直接返回
-    if os.path.exists(db_path):
-        return
-    
     # 确保数据目录存在
     os.makedirs('data', exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    conn = sql_profiler.connect(db_path)
     cursor = conn.cursor()
     
     # 创建菜单项表
@@ -155,13 +194,37 @@ def init_db():
     
     conn.commit()
     conn.close()
-    print("数据库初始化完成：创建了新的数据库文件")
+    logger.info("数据库初始化完成")
 
 def get_db_connection():
-    conn = sqlite3.connect('data/sales.db')
+    conn = sql_profiler.connect('data/sales.db')
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_history_connection(order_numbers):
+    """按订单号查询可能已归档的订单时使用：orders_all、order_items_all、receipts_all、receipt_items_all 为热库和冷库的合并视图
+
+    订单都在热库时不挂载冷库，否则只挂载订单号对应年份的冷库。
+    """
+    conn = get_db_connection()
+    attach_order_history(conn, order_numbers)
+    return conn
+
+@metrics.REGISTRY.add_collect_hook
+def collect_unreceipted_orders():
+    """抓取 /metrics 时统计已完成但还没有小票的订单"""
+    conn = get_db_connection()
+    try:
+        count = conn.execute('''
+            SELECT COUNT(*)
+            FROM orders o
+            WHERE o.order_status = '已完成'
+            AND NOT EXISTS (SELECT 1 FROM receipts r WHERE r.order_number = o.order_number)
+        ''').fetchone()[0]
+        metrics.UNRECEIPTED_ORDERS.set(count)
+    finally:
+        conn.close()
+
 # 主页
 @app.route('/')
 def home():
@@ -178,21 +241,8 @@ def logout():
 def sales():
     return render_template('sales/index.html', username=session['username'])
 
-# 菜单管理
-@app.route('/sales/menu')
-def menu():
-    # 获取筛选参数
-    category = request.args.get('category', '')
-    status = request.args.get('status', '')
-    is_heritage = request.args.get('is_heritage', '')
-    search = request.args.get('search', '')
-    sort_by = request.args.get('sort_by', 'item_code')
-    sort_order = request.args.get('sort_order', 'asc')
-    
-    # 连接数据库
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+def load_menu_page(cursor, category, status, is_heritage, search, sort_by, sort_order):
+    """菜品列表页的数据：筛选后的菜品、分类、热销菜品和分类统计"""
     # 构建查询条件
     query = "SELECT * FROM menu_items WHERE 1=1"
     params = []
@@ -214,22 +264,8 @@ def menu():
         search_term = f'%{search}%'
         params.extend([search_term, search_term, search_term])
     
-    # 添加排序
-    valid_sort_fields = {
-        'item_code': 'item_code',
-        'item_name': 'item_name',
-        'price': 'price',
-        'sales_count': 'sales_count',
-        'created_at': 'created_at'
-    }
-    
-    if sort_by not in valid_sort_fields:
-        sort_by = 'item_code'
-    
-    if sort_order not in ['asc', 'desc']:
-        sort_order = 'asc'
-    
-    query += f" ORDER BY {valid_sort_fields[sort_by]} {sort_order.upper()}"
+    # sort_by 和 sort_order 已在视图中校验
+    query += f" ORDER BY {sort_by} {sort_order.upper()}"
     
     # 执行查询
     cursor.execute(query, params)
@@ -265,16 +301,49 @@ def menu():
     """)
     category_stats = cursor.fetchall()
     
-    conn.close()
+    return dict(menu_items=menu_items, categories=categories, top_dishes=top_dishes, total_items=total_items,
+                heritage_count=heritage_count, category_stats=category_stats)
+
+# 菜单管理
+@app.route('/sales/menu')
+def menu():
+    # 获取筛选参数
+    category = request.args.get('category', '')
+    status = request.args.get('status', '')
+    is_heritage = request.args.get('is_heritage', '')
+    search = request.args.get('search', '')
+    sort_by = request.args.get('sort_by', 'item_code')
+    sort_order = request.args.get('sort_order', 'asc')
+    
+    # 添加排序
+    valid_sort_fields = {
+        'item_code': 'item_code',
+        'item_name': 'item_name',
+        'price': 'price',
+        'sales_count': 'sales_count',
+        'created_at': 'created_at'
+    }
+    
+    if sort_by not in valid_sort_fields:
+        sort_by = 'item_code'
+    
+    if sort_order not in ['asc', 'desc']:
+        sort_order = 'asc'
+    
+    conn = get_db_connection()
+    try:
+        # 菜品表有变化时版本号递增，同一筛选条件的重复访问直接使用缓存的查询结果
+        cache_version = fragment_cache.data_version(conn, 'menu')
+        cache_key = ('sales_menu', cache_version, category, status, is_heritage, search, sort_by, sort_order)
+        page = fragment_cache.cache.get_or_set(cache_key, lambda: load_menu_page(
+            conn.cursor(), category, status, is_heritage, search, sort_by, sort_order))
+    finally:
+        conn.close()
     
     return render_template('sales/menu.html',
                           username=session['username'],
-                          menu_items=menu_items,
-                          categories=categories,
-                          top_dishes=top_dishes,
-                          total_items=total_items,
-                          heritage_count=heritage_count,
-                          category_stats=category_stats,
+                          cache_version=cache_version,
+                          **page,
                           current_category=category,
                           current_status=status,
                           current_heritage=is_heritage,
@@ -282,6 +351,30 @@ def menu():
                           current_sort_order=sort_order,
                           search=search)
 
+def save_menu_image(image):
+    """保存上传的菜品图片并在后台生成缩略图，返回相对 static 的路径；没有上传时返回 None"""
+    if not image or not image.filename:
+        return None
+    # 获取文件扩展名
+    _, ext = os.path.splitext(image.filename)
+    # 生成唯一的文件名：时间戳_随机数.扩展名
+    unique_filename = f"{int(time.time())}_{uuid.uuid4().hex[:8]}{ext}"
+    # 确保目录存在
+    os.makedirs('static/uploads/menu', exist_ok=True)
+    image_path = f'uploads/menu/{unique_filename}'
+    image.save(os.path.join('static', image_path))
+    thumbnails.submit(image_path)
+    return image_path
+
+def remove_menu_image(image_path):
+    """删除菜品图片及其缩略图"""
+    if not image_path:
+        return
+    full_path = os.path.join('static', image_path)
+    if os.path.exists(full_path):
+        os.remove(full_path)
+    thumbnails.remove_thumbnails(image_path)
+
 # 新增菜品
 @app.route('/sales/menu/add', methods=['GET', 'POST'])
 def add_menu_item():
@@ -296,19 +389,7 @@ def add_menu_item():
         status = request.form['status']
         
         # 处理图片上传
-        image_path = ''
-        if 'image' in request.files:
-            image = request.files['image']
-            if image and image.filename:
-                # 获取文件扩展名
-                _, ext = os.path.splitext(image.filename)
-                # 生成唯一的文件名：时间戳_随机数.扩展名
-                unique_filename = f"{int(time.time())}_{uuid.uuid4().hex[:8]}{ext}"
-                # 确保目录存在
-                if not os.path.exists('static/uploads/menu'):
-                    os.makedirs('static/uploads/menu')
-                image_path = f'uploads/menu/{unique_filename}'
-                image.save(os.path.join('static', image_path))
+        image_path = save_menu_image(request.files.get('image')) or ''
         
         # 连接数据库
         conn = get_db_connection()
@@ -349,6 +430,7 @@ def add_menu_item():
             ))
             
             conn.commit()
+            menu_cache.refresh(conn)
             flash(f'菜品添加成功! 编号: {item_code}', 'success')
             return redirect(url_for('menu'))
             
@@ -422,7 +504,17 @@ def edit_menu_item(item_code):
                 WHERE item_code = ?
             ''', (item_name, category, is_heritage, price, cost, description, status, item_code))
             
+            # 上传了新图片时替换原图，旧图片和缩略图在提交后删除
+            old_image = None
+            image_path = save_menu_image(request.files.get('image'))
+            if image_path:
+                old_image = cursor.execute('SELECT image_path FROM menu_items WHERE item_code = ?',
+                                           (item_code,)).fetchone()['image_path']
+                cursor.execute('UPDATE menu_items SET image_path = ? WHERE item_code = ?', (image_path, item_code))
+            
             conn.commit()
+            menu_cache.refresh(conn)
+            remove_menu_image(old_image)
             flash('菜品信息已更新', 'success')
             return redirect(url_for('menu'))
             
@@ -471,15 +563,13 @@ def delete_menu_item(item_code):
             flash('该菜品已有关联订单，无法删除', 'error')
             return redirect(url_for('view_menu_item', item_code=item_code))
         
-        # 删除菜品图片（如果有）
-        if item['image_path']:
-            image_path = os.path.join('static', item['image_path'])
-            if os.path.exists(image_path):
-                os.remove(image_path)
+        # 删除菜品图片及缩略图（如果有）
+        remove_menu_image(item['image_path'])
         
         # 删除菜品记录
         cursor.execute('DELETE FROM menu_items WHERE item_code = ?', (item_code,))
         conn.commit()
+        menu_cache.refresh(conn)
         
         flash('菜品已成功删除', 'success')
         return redirect(url_for('menu'))
@@ -492,6 +582,93 @@ def delete_menu_item(item_code):
         conn.close()
 
 # 订单管理路由
+# 菜品配方（BOM）：查询和保存
+@app.route('/sales/menu/recipe/<item_code>', methods=['GET', 'POST'])
+def menu_item_recipe(item_code):
+    conn = get_db_connection()
+    try:
+        item = conn.execute('SELECT item_code FROM menu_items WHERE item_code = ?', (item_code,)).fetchone()
+        if not item:
+            return jsonify({'status': 'error', 'message': '菜品不存在'}), 404
+        
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            save_recipe(conn, item_code, data.get('ingredients', []))
+        
+        return jsonify({'status': 'success', 'item_code': item_code, 'ingredients': get_recipe(conn, item_code)})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'status': 'error', 'message': f'操作失败: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+# 立即处理已完成订单的原料扣减（定时任务也会按微批次自动处理）
+@app.route('/sales/inventory_consumption/run', methods=['POST'])
+def run_inventory_consumption():
+    conn = get_db_connection()
+    try:
+        result = ConsumptionPoster(conn).post_pending()
+        return jsonify({'status': 'success', **result})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'原料扣减失败: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@metrics.track_job('post_inventory_consumption')
+def post_inventory_consumption():
+    """定时任务：按配方为已完成订单扣减原料库存，每次处理一个微批次直到没有待处理订单"""
+    conn = get_db_connection()
+    try:
+        poster = ConsumptionPoster(conn)
+        while True:
+            result = poster.post_pending()
+            if not result['orders']:
+                break
+            if result['shortage']:
+                logger.warning("原料库存不足: %s", result['shortage'])
+    except Exception as e:
+        logger.exception("原料扣减出错: %s", e)
+        raise
+    finally:
+        conn.close()
+
+@app.route('/sales/archive/run', methods=['POST'])
+def run_order_archive():
+    """手动归档：months 为保留在热库中的月数"""
+    months = request.form.get('months', type=int) or request.args.get('months', type=int)
+    conn = get_db_connection()
+    try:
+        archiver = OrderArchiver(conn)
+        moved = archiver.run(months) if months else archiver.run()
+        return jsonify({'status': 'success', 'archived': moved})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'订单归档失败: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@metrics.track_job('archive_orders')
+def archive_orders():
+    """定时任务：把早于保留期的已结束订单按年份移到冷库，热库只保留近期数据"""
+    conn = get_db_connection()
+    try:
+        OrderArchiver(conn).run()
+    except Exception as e:
+        logger.exception("订单归档出错: %s", e)
+        raise
+    finally:
+        conn.close()
+
+@metrics.track_job('backup_sales_db')
+def backup_sales_db():
+    """定时任务：在线备份销售库，分步复制不阻塞收银写入"""
+    try:
+        metrics.observe_backup(db_backup.backup_database(os.path.join('data', 'sales.db'), 'sales'))
+    except Exception as e:
+        logger.exception("销售库备份失败: %s", e)
+        raise
+
 @app.route('/sales/orders')
 def orders():
     # 获取筛选参数
@@ -570,10 +747,22 @@ def tables():
 # 销售分析路由
 @app.route('/sales/analysis')
 def sales_analysis():
+    conn = get_db_connection()
     try:
         # 获取今日销售数据
         today = datetime.now().strftime('%Y-%m-%d')
-        cur = get_db_connection().cursor()
+        cur = conn.cursor()
+        current_month = datetime.now().strftime('%Y年%m月')
+        
+        # 订单或菜品有变化时版本号递增；日期也是键的一部分，跨天后重新统计
+        cache_version = fragment_cache.data_version(conn, 'orders', 'menu')
+        cache_key = ('sales_analysis', today, cache_version)
+        stats = fragment_cache.cache.get(cache_key)
+        if stats is not None:
+            return render_template('sales/analysis.html',
+                                cache_version=cache_version,
+                                current_month=current_month,
+                                **stats)
         
         # 今日销售额和订单数
         cur.execute("""
@@ -672,21 +861,25 @@ def sales_analysis():
         """)
         dish_details = [dict(row) for row in cur.fetchall()]
 
-        current_month = datetime.now().strftime('%Y年%m月')
+        stats = dict(today_sales=today_sales,
+                     today_orders=today_orders,
+                     hot_dishes=hot_dishes,
+                     monthly_dish_stats=monthly_dish_stats,
+                     monthly_stats=monthly_stats,
+                     dish_details=dish_details)
+        fragment_cache.cache.set(cache_key, stats)
 
         return render_template('sales/analysis.html',
-                            today_sales=today_sales,
-                            today_orders=today_orders,
-                            hot_dishes=hot_dishes,
-                            monthly_dish_stats=monthly_dish_stats,
-                            monthly_stats=monthly_stats,
-                            dish_details=dish_details,
-                            current_month=current_month)
+                            cache_version=cache_version,
+                            current_month=current_month,
+                            **stats)
 
     except Exception as e:
-        print(f"销售分析错误：{str(e)}")  # 添加错误日志
+        logger.exception("销售分析错误：%s", e)  # 添加错误日志
         flash(f'获取销售分析数据失败：{str(e)}', 'error')
         return redirect(url_for('sales'))
+    finally:
+        conn.close()
 
 @app.route('/sales/update_order_status/<order_number>', methods=['POST'])
 def update_order_status(order_number):
@@ -701,8 +894,11 @@ def update_order_status(order_number):
             SET order_status = ?, updated_at = CURRENT_TIMESTAMP
             WHERE order_number = ?
         ''', (status, order_number))
+        if cursor.rowcount:
+            order_events.record_event(conn, order_number, status)
         
         conn.commit()
+        order_feed.notify()
         flash(f'订单 {order_number} 状态更新为 {status}', 'success')
     except Exception as e:
         flash(f'更新失败: {str(e)}', 'danger')
@@ -734,7 +930,7 @@ def batch_orders():
         if action in status_map:
             # 更新订单状态
             new_status = status_map[action]
-            success_count = 0
+            updated = []
             
             for order_number in order_numbers:
                 cursor.execute('''
@@ -742,24 +938,33 @@ def batch_orders():
                     SET order_status = ?, updated_at = CURRENT_TIMESTAMP 
                     WHERE order_number = ?
                 ''', (new_status, order_number))
-                success_count += cursor.rowcount
+                if cursor.rowcount:
+                    updated.append(order_number)
+            success_count = len(updated)
+            order_events.record_events(conn, updated, new_status)
             
             conn.commit()
+            order_feed.notify()
             return jsonify({
                 'status': 'success',
                 'message': f'成功更新 {success_count} 个订单状态为{new_status}'
             })
             
         elif action == 'delete':
-            success_count = 0
+            deleted = []
             for order_number in order_numbers:
                 # 删除订单项
                 cursor.execute('DELETE FROM order_items WHERE order_number = ?', (order_number,))
                 # 删除订单
                 cursor.execute('DELETE FROM orders WHERE order_number = ?', (order_number,))
-                success_count += 1
+                if cursor.rowcount:
+                    deleted.append(order_number)
+            success_count = len(deleted)
+            # 屏幕上收到“已删除”后移除该订单
+            order_events.record_events(conn, deleted, '已删除')
             
             conn.commit()
+            order_feed.notify()
             return jsonify({
                 'status': 'success',
                 'message': f'成功删除 {success_count} 个订单'
@@ -780,6 +985,11 @@ def batch_orders():
     finally:
         conn.close()
 
+# 订单状态推送（Server-Sent Events），断线重连时按 Last-Event-ID 补发
+@app.route('/sales/orders/events')
+def order_status_events():
+    return order_events.event_stream(order_feed)
+
 @app.route('/sales/export_orders')
 def export_orders():
     # 获取要导出的订单号列表
@@ -788,12 +998,15 @@ def export_orders():
         flash('请选择要导出的订单', 'warning')
         return redirect(url_for('orders'))
     
-    conn = get_db_connection()
+    # 可能导出已归档的历史订单
+    conn = get_history_connection(order_numbers)
     cursor = conn.cursor()
     
     try:
         # 创建Excel文件
         output = io.BytesIO()
+        # xlsxwriter 只在导出时加载，不拖慢启动
+        import xlsxwriter
         workbook = xlsxwriter.Workbook(output)
         
         # 添加格式
@@ -826,7 +1039,7 @@ def export_orders():
         # 获取并写入订单数据
         placeholders = ','.join('?' * len(order_numbers))
         cursor.execute(f'''
-            SELECT * FROM orders 
+            SELECT * FROM orders_all 
             WHERE order_number IN ({placeholders})
             ORDER BY created_at DESC
         ''', order_numbers)
@@ -865,7 +1078,7 @@ def export_orders():
             
             # 获取并写入订单项
             cursor.execute('''
-                SELECT * FROM order_items 
+                SELECT * FROM order_items_all 
                 WHERE order_number = ?
             ''', (order['order_number'],))
             items = cursor.fetchall()
@@ -894,6 +1107,7 @@ def export_orders():
         
         workbook.close()
         output.seek(0)
+        metrics.observe_export('orders', output.getbuffer().nbytes)
         
         # 生成下载文件名
         filename = f'订单导出_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
@@ -911,6 +1125,25 @@ def export_orders():
     finally:
         conn.close()
 
+def allocate_order_numbers(cursor, count):
+    """生成 count 个连续的订单编号：DD + 年月日 + 4位序号（每天从0001开始）"""
+    today = datetime.now().strftime('%Y%m%d')
+    cursor.execute("""
+        SELECT MAX(SUBSTR(order_number, -4)) as max_seq 
+        FROM orders 
+        WHERE order_number LIKE ?
+    """, (f'DD{today}%',))
+    
+    result = cursor.fetchone()
+    max_seq = result['max_seq'] if result['max_seq'] else '0000'
+    
+    try:
+        next_seq = int(max_seq) + 1
+    except (ValueError, TypeError):
+        next_seq = 1
+    
+    return [f'DD{today}{seq:04d}' for seq in range(next_seq, next_seq + count)]
+
 # 新增订单
 @app.route('/sales/orders/new', methods=['GET', 'POST'])
 def new_order():
@@ -937,24 +1170,8 @@ def new_order():
         cursor = conn.cursor()
         
         try:
-            # 生成订单编号：DD + 年月日 + 4位序号（每天从0001开始）
-            today = datetime.now().strftime('%Y%m%d')
-            cursor.execute("""
-                SELECT MAX(SUBSTR(order_number, -4)) as max_seq 
-                FROM orders 
-                WHERE order_number LIKE ?
-            """, (f'DD{today}%',))
-            
-            result = cursor.fetchone()
-            max_seq = result['max_seq'] if result['max_seq'] else '0000'
-            
-            try:
-                next_seq = int(max_seq) + 1
-            except (ValueError, TypeError):
-                next_seq = 1
-                
-            # 格式化订单编号：DD + 年月日 + 4位序号
-            order_number = f'DD{today}{next_seq:04d}'
+            menu = menu_cache.get(conn)
+            order_number = allocate_order_numbers(cursor, 1)[0]
             
             # 计算订单总金额
             total_amount = 0
@@ -964,14 +1181,16 @@ def new_order():
             num_items = len(item_codes)
             quantities = quantities[:num_items]
             item_notes = (item_notes + [''] * num_items)[:num_items]
+            unavailable = []
             
             for i in range(num_items):
                 if item_codes[i] and quantities[i]:
-                    # 获取菜品信息
-                    cursor.execute("SELECT * FROM menu_items WHERE item_code = ?", (item_codes[i],))
-                    item = cursor.fetchone()
+                    # 菜品信息和价格取自菜单快照（只含在售菜品）
+                    item = menu.items.get(item_codes[i])
                     
-                    if item:
+                    if item is None:
+                        unavailable.append(item_codes[i])
+                    else:
                         quantity = int(quantities[i])
                         unit_price = float(item['price'])
                         total_price = quantity * unit_price
@@ -986,6 +1205,11 @@ def new_order():
                             'notes': item_notes[i]
                         })
             
+            # 表单打开后菜品被下架或删除
+            if unavailable:
+                flash(f'以下菜品已下架或不存在，请重新选择: {", ".join(unavailable)}', 'danger')
+                return redirect(url_for('new_order'))
+            
             # 应用折扣（如果有）
             discount_amount = 0
             final_amount = total_amount - discount_amount
@@ -1061,7 +1285,12 @@ def new_order():
                     item['notes']
                 ))
             
+            # 新订单同样推送给后厨屏幕
+            order_events.record_event(conn, order_number, '已接单')
             conn.commit()
+            order_feed.notify()
+            metrics.ORDERS_CREATED.labels(order_type).inc()
+            metrics.RECEIPTS_GENERATED.labels('new_order').inc()
             flash(f'订单创建成功! 订单号: {order_number}', 'success')
             
             return redirect(url_for('view_order', order_number=order_number))
@@ -1072,46 +1301,226 @@ def new_order():
         finally:
             conn.close()
     
-    # GET 请求，显示订单创建表单
+    # GET 请求，显示订单创建表单：在售菜品、分类和桌号都取自菜单快照，命中时只查一次版本号
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 获取菜单 - 修改查询条件，显示所有可用菜品
-    cursor.execute("""
-        SELECT * FROM menu_items 
-        WHERE status IN ('上架', '在售') 
-        ORDER BY category, item_name
-    """)
-    menu_items = cursor.fetchall()
+    try:
+        menu = menu_cache.get(conn)
+    finally:
+        conn.close()
     
-    # 获取菜品分类
-    cursor.execute("SELECT DISTINCT category FROM menu_items ORDER BY category")
-    categories = [row['category'] for row in cursor.fetchall()]
+    return render_template('sales/new_order.html',
+                          username=session['username'],
+                          menu_items=menu.menu_items,
+                          categories=menu.categories,
+                          table_numbers=menu.table_numbers)
+
+# POS 终端批量上传订单的上限和幂等键长度
+MAX_BULK_ORDERS = 500
+MAX_IDEMPOTENCY_KEY_LENGTH = 64
+ORDER_TYPES = ('堂食', '外卖')
+# 可选的文本字段，缺省为空字符串
+POS_ORDER_TEXT_FIELDS = ('table_number', 'customer_name', 'customer_phone', 'notes')
+
+def validate_pos_order(data, menu):
+    """按菜单快照校验终端上传的一个订单，返回 (订单, 错误列表)；价格以快照为准"""
+    errors = []
+    if not isinstance(data, dict):
+        return None, ['订单格式错误']
+    key = data.get('idempotency_key')
+    if not isinstance(key, str) or not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        errors.append(f'idempotency_key 必须是 1-{MAX_IDEMPOTENCY_KEY_LENGTH} 个字符的字符串')
+    order_type = data.get('order_type')
+    if order_type not in ORDER_TYPES:
+        errors.append(f"order_type 必须是 {'、'.join(ORDER_TYPES)} 之一")
+    texts = {}
+    for field in POS_ORDER_TEXT_FIELDS:
+        value = data.get(field)
+        if value is None:
+            value = ''
+        if not isinstance(value, str):
+            errors.append(f'{field} 必须是字符串')
+        texts[field] = value
+    table_number = texts['table_number']
+    if table_number and isinstance(table_number, str) and table_number not in menu.table_numbers:
+        errors.append(f'桌号不存在: {table_number}')
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        errors.append('订单必须包含至少一个菜品')
+        items = []
+    
+    order_items = []
+    for index, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            errors.append(f'第 {index} 个菜品格式错误')
+            continue
+        item_code = item.get('item_code')
+        menu_item = menu.items.get(item_code) if isinstance(item_code, str) else None
+        if menu_item is None:
+            errors.append(f'第 {index} 个菜品不存在或未上架: {item_code}')
+            continue
+        quantity = item.get('quantity')
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            errors.append(f'第 {index} 个菜品数量必须是正整数')
+            continue
+        notes = item.get('notes')
+        if notes is not None and not isinstance(notes, str):
+            errors.append(f'第 {index} 个菜品备注必须是字符串')
+            continue
+        unit_price = float(menu_item['price'])
+        order_items.append({
+            'item_code': menu_item['item_code'],
+            'item_name': menu_item['item_name'],
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_price': quantity * unit_price,
+            'notes': notes or ''
+        })
+    if errors:
+        return None, errors
     
-    # 生成桌号选项
-    table_prefixes = ['天', '地', '玄', '黄']  # 桌号前缀
-    table_numbers = []
-    for prefix in table_prefixes:
-        for num in range(1, 100):  # 01-99
-            table_numbers.append(f"{prefix}{num:02d}")  # 使用:02d格式化数字为两位
+    return {
+        'idempotency_key': key,
+        'order_type': order_type,
+        **texts,
+        'total_amount': sum(item['total_price'] for item in order_items),
+        'items': order_items
+    }, []
+
+def insert_pos_orders(conn, orders, order_numbers):
+    """在调用方的事务中用 executemany 写入订单、明细、小票、菜品销量和幂等键"""
+    order_rows, item_rows, receipt_rows, receipt_item_rows, key_rows = [], [], [], [], []
+    sales_counts = {}
+    for order, order_number in zip(orders, order_numbers):
+        receipt_number = f'FP{order_number[2:]}'
+        # 暂无折扣，实收金额即总金额
+        order_rows.append((
+            order_number, order['order_type'], '已接单', order['table_number'],
+            order['customer_name'], order['customer_phone'], order['total_amount'], 0,
+            order['total_amount'], order['notes'], '系统分配'
+        ))
+        receipt_rows.append((
+            receipt_number, order_number, order['order_type'], order['total_amount'],
+            order['customer_name'], order['customer_phone'], None
+        ))
+        key_rows.append((order['idempotency_key'], order_number))
+        for item in order['items']:
+            values = (item['item_code'], item['item_name'], item['quantity'],
+                      item['unit_price'], item['total_price'], item['notes'])
+            item_rows.append((order_number, *values))
+            receipt_item_rows.append((receipt_number, *values))
+            sales_counts[item['item_code']] = sales_counts.get(item['item_code'], 0) + item['quantity']
+    
+    conn.executemany('''
+        INSERT INTO orders (
+            order_number, order_type, order_status, table_number,
+            customer_name, customer_phone, total_amount, discount_amount,
+            final_amount, notes, assigned_chef
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', order_rows)
+    conn.executemany('''
+        INSERT INTO order_items (
+            order_number, item_code, item_name, quantity,
+            unit_price, total_price, notes
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', item_rows)
+    conn.executemany('''
+        UPDATE menu_items
+        SET sales_count = sales_count + ?
+        WHERE item_code = ?
+    ''', [(quantity, item_code) for item_code, quantity in sales_counts.items()])
+    conn.executemany('''
+        INSERT INTO receipts (
+            receipt_number, order_number, order_time, dining_mode,
+            total_amount, customer_name, customer_phone, member_info,
+            is_printed, receipt_date
+        ) VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, 0, CURRENT_TIMESTAMP)
+    ''', receipt_rows)
+    # 小票 ID 由数据库分配，明细按小票编号（唯一索引）回查
+    conn.executemany('''
+        INSERT INTO receipt_items (
+            receipt_id, item_code, item_name, quantity,
+            unit_price, total_price, notes
+        ) VALUES ((SELECT id FROM receipts WHERE receipt_number = ?), ?, ?, ?, ?, ?, ?)
+    ''', receipt_item_rows)
+    conn.executemany('INSERT INTO pos_order_keys (idempotency_key, order_number) VALUES (?, ?)', key_rows)
+    order_events.record_events(conn, order_numbers, '已接单')
+
+# API：POS 终端批量上传订单。终端离线时先在本地排队，恢复后按批提交；
+# 每个订单带终端生成的 idempotency_key，重试时已写入的订单返回原订单号而不会重复下单。
+# 请求体 {"orders": [{"idempotency_key", "order_type", "table_number", "items": [{"item_code", "quantity", "notes"}], ...}]}
+@app.route('/api/sales/orders/bulk', methods=['POST'])
+def bulk_create_orders():
+    payload = request.get_json(silent=True)
+    orders_data = payload.get('orders') if isinstance(payload, dict) else None
+    if not isinstance(orders_data, list) or not orders_data:
+        return jsonify({'success': False, 'message': '请求体应为 {"orders": [...]}'}), 400
+    if len(orders_data) > MAX_BULK_ORDERS:
+        return jsonify({'success': False, 'message': f'每批最多 {MAX_BULK_ORDERS} 个订单'}), 400
     
-    conn.close()
+    conn = get_db_connection()
+    try:
+        menu = menu_cache.get(conn)
+        # 结果与请求中的订单一一对应；同一批内重复的幂等键只写入第一个
+        results = []
+        pending = {}
+        for data in orders_data:
+            order, errors = validate_pos_order(data, menu)
+            key = data.get('idempotency_key') if isinstance(data, dict) else None
+            results.append({'idempotency_key': key})
+            if errors:
+                results[-1].update(status='invalid', errors=errors)
+            elif key in pending:
+                results[-1]['status'] = 'duplicate'
+            else:
+                pending[key] = order
+        
+        # 立即获取写锁，多个进程同时提交时订单编号不会冲突
+        conn.execute('BEGIN IMMEDIATE')
+        assigned = {}
+        if pending:
+            placeholders = ','.join('?' * len(pending))
+            rows = conn.execute(f'''
+                SELECT idempotency_key, order_number FROM pos_order_keys
+                WHERE idempotency_key IN ({placeholders})
+            ''', list(pending)).fetchall()
+            assigned = {row['idempotency_key']: row['order_number'] for row in rows}
+        new_orders = [order for key, order in pending.items() if key not in assigned]
+        order_numbers = allocate_order_numbers(conn.cursor(), len(new_orders))
+        insert_pos_orders(conn, new_orders, order_numbers)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.exception("批量写入订单失败: %s", e)
+        return jsonify({'success': False, 'message': f'批量写入订单失败: {str(e)}'}), 500
+    finally:
+        conn.close()
     
-    return render_template('sales/new_order.html',
-                          username=session['username'],
-                          menu_items=menu_items,
-                          categories=categories,
-                          table_numbers=table_numbers)
+    order_feed.notify()
+    for order, order_number in zip(new_orders, order_numbers):
+        metrics.ORDERS_CREATED.labels(order['order_type']).inc()
+        assigned[order['idempotency_key']] = order_number
+    metrics.RECEIPTS_GENERATED.labels('pos_bulk').inc(len(new_orders))
+    
+    created_keys = {order['idempotency_key'] for order in new_orders}
+    for result in results:
+        key = result['idempotency_key']
+        if 'status' not in result:
+            result['status'] = 'created' if key in created_keys else 'duplicate'
+        if result['status'] != 'invalid':
+            result['order_number'] = assigned[key]
+    
+    return jsonify({'success': True, 'created': len(new_orders), 'results': results})
 
 # 查看订单详情
 @app.route('/sales/orders/view/<order_number>')
 def view_order(order_number):
-    conn = get_db_connection()
+    # 订单可能已归档到冷库
+    conn = get_history_connection([order_number])
     cursor = conn.cursor()
     
     # 获取订单基本信息
     cursor.execute('''
-        SELECT * FROM orders 
+        SELECT * FROM orders_all 
         WHERE order_number = ?
     ''', (order_number,))
     order = cursor.fetchone()
@@ -1123,7 +1532,7 @@ def view_order(order_number):
     # 获取订单明细
     cursor.execute('''
         SELECT oi.*, mi.image_path 
-        FROM order_items oi 
+        FROM order_items_all oi 
         LEFT JOIN menu_items mi ON oi.item_code = mi.item_code 
         WHERE oi.order_number = ?
     ''', (order_number,))
@@ -1131,7 +1540,7 @@ def view_order(order_number):
     
     # 获取订单的小票信息
     cursor.execute('''
-        SELECT * FROM receipts 
+        SELECT * FROM receipts_all 
         WHERE order_number = ?
     ''', (order_number,))
     receipt = cursor.fetchone()
@@ -1287,6 +1696,7 @@ def export_receipts():
     
     # 创建Excel文件
     output = io.BytesIO()
+    import xlsxwriter
     workbook = xlsxwriter.Workbook(output)
     
     # 设置格式
@@ -1401,6 +1811,7 @@ def export_receipts():
     
     workbook.close()
     output.seek(0)
+    metrics.observe_export('receipts', output.getbuffer().nbytes)
     
     # 生成下载文件名
     filename = f'小票批量导出_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
@@ -1439,69 +1850,6 @@ def delete_receipts():
     finally:
         conn.close()
 
-def migrate_receipts_table():
-    """迁移小票表结构，添加新字段"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # 获取当前表结构
-        cursor.execute("PRAGMA table_info(receipts)")
-        current_columns = {column[1] for column in cursor.fetchall()}
-
-        # 需要添加的字段列表
-        required_columns = {
-            'receipt_number': 'TEXT UNIQUE NOT NULL',
-            'order_number': 'TEXT NOT NULL',
-            'order_time': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
-            'dining_mode': 'TEXT',
-            'total_amount': 'REAL NOT NULL',
-            'customer_name': 'TEXT',
-            'customer_phone': 'TEXT',
-            'member_info': 'TEXT',
-            'is_printed': 'INTEGER DEFAULT 0',
-            'receipt_date': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-        }
-
-        # 如果表不存在，创建表
-        if 'receipts' not in {table[0] for table in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}:
-            create_table_sql = '''
-            CREATE TABLE receipts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                receipt_number TEXT UNIQUE NOT NULL,
-                order_number TEXT NOT NULL,
-                order_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                dining_mode TEXT,
-                total_amount REAL NOT NULL,
-                customer_name TEXT,
-                customer_phone TEXT,
-                member_info TEXT,
-                is_printed INTEGER DEFAULT 0,
-                receipt_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (order_number) REFERENCES orders (order_number)
-            )
-            '''
-            cursor.execute(create_table_sql)
-            print("Created receipts table")
-        else:
-            # 添加缺失的列
-            for column, type_def in required_columns.items():
-                if column not in current_columns:
-                    try:
-                        cursor.execute(f"ALTER TABLE receipts ADD COLUMN {column} {type_def}")
-                        print(f"Added column {column} to receipts table")
-                    except Exception as e:
-                        print(f"Error adding column {column}: {str(e)}")
-
-        conn.commit()
-        print("小票表迁移完成")
-
-    except Exception as e:
-        print(f"小票表迁移失败: {str(e)}")
-        conn.rollback()
-    finally:
-        conn.close()
-
 # 添加上下文处理器，为所有模板提供now()函数
 @app.context_processor
 def utility_processor():
@@ -1537,6 +1885,7 @@ def export_receipt_by_id(id):
     
     # 创建Excel文件
     output = io.BytesIO()
+    import xlsxwriter
     workbook = xlsxwriter.Workbook(output)
     worksheet = workbook.add_worksheet()
     
@@ -1613,6 +1962,7 @@ def export_receipt_by_id(id):
     
     workbook.close()
     output.seek(0)
+    metrics.observe_export('receipt', output.getbuffer().nbytes)
     
     # 生成文件名
     filename = f"小票_{receipt['receipt_number']}.xlsx"
@@ -1624,86 +1974,6 @@ def export_receipt_by_id(id):
                     download_name=filename,
                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
-def fix_order_numbers():
-    """修正现有订单的编号格式"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取所有订单，按创建时间排序
-        cursor.execute("""
-            SELECT order_number, created_at, 
-                   strftime('%Y%m%d', created_at) as order_date
-            FROM orders 
-            ORDER BY created_at
-        """)
-        orders = cursor.fetchall()
-        
-        # 按日期分组
-        date_orders = {}
-        for order in orders:
-            date = order['order_date']
-            if date not in date_orders:
-                date_orders[date] = []
-            date_orders[date].append(order['order_number'])
-        
-        # 开始事务
-        cursor.execute("BEGIN TRANSACTION")
-        
-        try:
-            # 更新订单编号
-            for date, order_numbers in date_orders.items():
-                for i, old_number in enumerate(order_numbers, 1):
-                    new_number = f'DD{date}{i:04d}'
-                    
-                    # 更新订单表
-                    cursor.execute("""
-                        UPDATE orders 
-                        SET order_number = ? 
-                        WHERE order_number = ?
-                    """, (new_number, old_number))
-                    
-                    # 更新订单明细表
-                    cursor.execute("""
-                        UPDATE order_items 
-                        SET order_number = ? 
-                        WHERE order_number = ?
-                    """, (new_number, old_number))
-                    
-                    # 更新小票表
-                    cursor.execute("""
-                        UPDATE receipts 
-                        SET order_number = ?,
-                            receipt_number = ?
-                        WHERE order_number = ?
-                    """, (new_number, f'FP{date}{i:04d}', old_number))
-                    
-                    # 更新小票明细表（通过receipts表的关联）
-                    cursor.execute("""
-                        UPDATE receipt_items
-                        SET receipt_id = (
-                            SELECT id FROM receipts WHERE order_number = ?
-                        )
-                        WHERE receipt_id IN (
-                            SELECT id FROM receipts WHERE order_number = ?
-                        )
-                    """, (new_number, old_number))
-            
-            # 提交事务
-            cursor.execute("COMMIT")
-            print("订单编号修正完成")
-            
-        except Exception as e:
-            # 发生错误时回滚
-            cursor.execute("ROLLBACK")
-            print(f"修正订单编号时发生错误: {str(e)}")
-            raise
-            
-    except Exception as e:
-        print(f"修正订单编号失败: {str(e)}")
-    finally:
-        conn.close()
-
 @app.route('/receipts/import', methods=['POST'])
 def import_receipts():
     conn = get_db_connection()
@@ -1776,6 +2046,7 @@ def import_receipts():
             imported_count += 1
         
         conn.commit()
+        metrics.RECEIPTS_GENERATED.labels('import').inc(imported_count)
         return jsonify({
             'success': True,
             'message': f'成功导入 {imported_count} 张小票'
@@ -1790,17 +2061,164 @@ def import_receipts():
     finally:
         conn.close()
 
+# 以下为迁移步骤，只由 MigrationRunner 执行一次；大表上的数据改写分批提交，不会长时间锁住收银
+def add_receipt_columns(conn):
+    """小票表补齐字段（旧库中的小票表缺少会员、打印状态等信息）"""
+    add_columns(conn, 'receipts', {
+        'receipt_number': 'TEXT',
+        'order_number': 'TEXT',
+        'order_time': 'TIMESTAMP',
+        'dining_mode': 'TEXT',
+        'total_amount': 'REAL',
+        'customer_name': 'TEXT',
+        'customer_phone': 'TEXT',
+        'member_info': 'TEXT',
+        'is_printed': 'INTEGER DEFAULT 0',
+        'receipt_date': 'TIMESTAMP',
+    })
+
+def renumber_orders(conn):
+    """历史订单编号统一为 DD+日期+4位序号，订单、明细和小票分批改写"""
+    # 新旧编号映射落盘，中途中断后重新执行沿用同一份映射
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS order_number_migration (
+            old_number TEXT PRIMARY KEY,
+            new_number TEXT UNIQUE NOT NULL
+        )
+    ''')
+    if conn.execute('SELECT COUNT(*) FROM order_number_migration').fetchone()[0] == 0:
+        conn.execute('''
+            INSERT INTO order_number_migration (old_number, new_number)
+            SELECT order_number, new_number FROM (
+                SELECT order_number,
+                       'DD' || strftime('%Y%m%d', created_at) || printf('%04d', ROW_NUMBER() OVER (
+                           PARTITION BY strftime('%Y%m%d', created_at) ORDER BY created_at, rowid)) AS new_number
+                FROM orders
+                WHERE created_at IS NOT NULL
+            )
+            WHERE new_number != order_number
+        ''')
+        conn.commit()
+
+    # 新编号可能与尚未改写的旧编号相同，先改成带 ~ 前缀的临时编号，全部完成后再去掉前缀
+    batch = 'SELECT old_number FROM order_number_migration WHERE rowid BETWEEN ? AND ?'
+    new_number = 'SELECT new_number FROM order_number_migration WHERE old_number = {table}.order_number'
+    for low, high in rowid_batches(conn, 'order_number_migration', label='订单编号改写'):
+        for table in ('orders', 'order_items'):
+            conn.execute(f'''
+                UPDATE {table} SET order_number = '~' || ({new_number.format(table=table)})
+                WHERE order_number IN ({batch})
+            ''', (low, high))
+        conn.execute(f'''
+            UPDATE receipts
+            SET order_number = '~' || ({new_number.format(table='receipts')}),
+                receipt_number = '~FP' || substr(({new_number.format(table='receipts')}), 3)
+            WHERE order_number IN ({batch})
+        ''', (low, high))
+
+    batch = "SELECT '~' || new_number FROM order_number_migration WHERE rowid BETWEEN ? AND ?"
+    for low, high in rowid_batches(conn, 'order_number_migration', label='订单编号确认'):
+        for table in ('orders', 'order_items'):
+            conn.execute(f'UPDATE {table} SET order_number = substr(order_number, 2) WHERE order_number IN ({batch})',
+                         (low, high))
+        conn.execute(f'''
+            UPDATE receipts SET order_number = substr(order_number, 2), receipt_number = substr(receipt_number, 2)
+            WHERE order_number IN ({batch})
+        ''', (low, high))
+
+    conn.execute('DROP TABLE order_number_migration')
+    conn.commit()
+    logger.info("订单编号修正完成")
+
+def add_order_indexes(conn):
+    """归档按下单时间挑选订单、按订单号搬运明细，原表没有任何索引"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order_number ON order_items (order_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_receipts_order_number ON receipts (order_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt_id ON receipt_items (receipt_id)')
+
+def add_data_versions(conn):
+    """菜品、订单表写入时递增 data_versions 中的版本号，菜单页和销售分析按版本号缓存"""
+    fragment_cache.install_version_triggers(conn, 'menu', ['menu_items'])
+    fragment_cache.install_version_triggers(conn, 'orders', ['orders', 'order_items'])
+
+def add_pos_order_keys(conn):
+    """终端批量上传订单的幂等键（键 -> 订单号），以及菜单快照的版本号触发器"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pos_order_keys (
+            idempotency_key TEXT PRIMARY KEY,
+            order_number TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    menu_snapshot.install_triggers(conn)
+
+# 数据库迁移：按版本号顺序执行，已执行的记录及校验和在 schema_version 表中，启动时不再重复执行
+# 已发布的步骤不要修改，表结构变更请追加新版本
+MIGRATIONS = [
+    Migration(1, '创建销售基础表', lambda conn: init_db()),
+    Migration(2, '小票表补齐字段', add_receipt_columns),
+    # 历史订单编号统一为 DD+日期+4位序号，只需执行一次
+    Migration(3, '修正历史订单编号', renumber_orders),
+    Migration(4, '创建菜品配方表', init_recipe_tables),
+    Migration(5, '订单归档与明细查询索引', add_order_indexes),
+    Migration(6, '菜单与订单数据版本号', add_data_versions),
+    Migration(7, '订单状态事件表', order_events.create_table),
+    Migration(8, 'POS 批量下单幂等键与菜单快照版本号', add_pos_order_keys),
+]
+
+def run_migrations():
+    return MigrationRunner(os.path.join('data', 'sales.db'), 'sales', MIGRATIONS).run()
+
+def create_app():
+    """应用工厂：准备数据目录并执行未应用的迁移；导入本模块不会访问数据库"""
+    os.makedirs('data', exist_ok=True)
+    run_migrations()
+    return app
+
+def start_scheduler():
+    """启动定时任务；多进程部署时只由选举出的主节点调用（见 gunicorn.conf.py）"""
+    # 调度器只在主节点用到，延迟导入以加快启动
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    # 每30秒按微批次扣减已完成订单的原料，不占用下单和结账请求的时间
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(
+        post_inventory_consumption,
+        trigger=IntervalTrigger(seconds=30),
+        id='post_inventory_consumption',
+        name='订单原料扣减',
+        replace_existing=True
+    )
+    # 每天凌晨营业结束后归档历史订单
+    scheduler.add_job(
+        archive_orders,
+        trigger=CronTrigger(hour=3),
+        id='archive_orders',
+        name='历史订单归档',
+        replace_existing=True
+    )
+    # 归档之前先备份
+    scheduler.add_job(
+        backup_sales_db,
+        trigger=CronTrigger(hour=2, minute=30),
+        id='backup_sales_db',
+        name='销售库备份',
+        replace_existing=True
+    )
+    scheduler.start()
+    return scheduler
+
 if __name__ == '__main__':
     try:
-        # 初始化数据库（如果不存在）
-        init_db()
-        
-        # 修正订单编号
-        fix_order_numbers()
+        create_app()
+        start_scheduler()
         
         # 启动应用
         app.run(debug=True, host='localhost', port=5002)
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception("Error: %s", e)
         import traceback
         traceback.print_exc()
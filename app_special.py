@@ -1,15 +1,23 @@
 import os
+import logging
 import sqlite3
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, abort
 from werkzeug.utils import secure_filename
 import json
-import requests
 import uuid
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 from flask_sqlalchemy import SQLAlchemy
 from models import db, HeritageFood, HeritageFoodTrial
+from chunked_upload import ChunkedUploadManager, ChunkedUploadError
+import sql_profiler
+import metrics
+import static_assets
+import compression
+import json_provider
+import order_events
+import session_store
+import log_config
+from migrations import Migration, MigrationRunner
 
 # 配置目录
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -18,6 +26,10 @@ STATIC_DIR = os.path.join(BASE_DIR, 'static')
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 UPLOAD_FOLDER = os.path.join(STATIC_DIR, 'uploads', 'heritage_dishes')
 
+# 日志经队列由后台线程输出，级别与格式见 log_config
+log_config.configure_logging()
+logger = logging.getLogger('app_special')
+
 # 配置Flask应用
 app = Flask(__name__,
            static_folder=STATIC_DIR,
@@ -27,8 +39,23 @@ app.secret_key = 'special_management_system_secret_key'
 # 配置SQLAlchemy
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(DB_DIR, "restaurant.db")}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# ORM 的连接同样使用带统计的连接类
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'factory': sql_profiler.ProfiledConnection}}
 db = SQLAlchemy(app)
 
+# 每个请求的 SQL 次数与耗时（响应头 X-SQL-Query-Count / X-SQL-Query-Time，明细见 /debug/queries）
+profiler = sql_profiler.SQLProfiler(app)
+# 请求耗时、SQL 耗时等指标，Prometheus 从 /metrics 抓取
+metrics.init_app(app, 'special')
+# 静态资源使用构建生成的指纹文件名、预压缩版本和长缓存（python -m static_assets build）
+assets = static_assets.StaticAssets(app)
+# 文本响应按 Accept-Encoding 压缩（级别见 compression.py 的环境变量）
+compression.init_app(app)
+# jsonify 使用 orjson 编码（未安装时回退到标准库），大列表流式输出
+json_provider.init_app(app)
+# 会话只在内容变化时写回；SESSION_TYPE=sqlite 时存到服务端（见 session_store.py）
+session_store.init_app(app)
+
 # 定义模型
 class HeritageFood(db.Model):
     __tablename__ = 'heritage_foods'
@@ -62,9 +89,28 @@ SALES_API_KEY = os.getenv('SALES_API_KEY', 'your_api_key_here')  # 从环境变
 
 # 允许上传的视频文件扩展名
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'wmv'}
+# 分片上传的视频大小上限，与 MAX_CONTENT_LENGTH 一致
+MAX_VIDEO_SIZE = 200 * 1024 * 1024
+
+# 传承菜视频目录；分片上传临时目录放在 data 下，不通过 static 对外公开
+HERITAGE_VIDEO_DIR = os.path.join(STATIC_DIR, 'uploads', 'heritage', 'videos')
+HERITAGE_CHUNK_DIR = os.path.join(DB_DIR, 'heritage_chunks')
+
+# 视频MIME类型
+VIDEO_MIMETYPES = {
+    'mp4': 'video/mp4',
+    'avi': 'video/x-msvideo',
+    'mov': 'video/quicktime',
+    'wmv': 'video/x-ms-wmv'
+}
+
+# 视频分片上传管理器
+video_uploads = ChunkedUploadManager(HERITAGE_CHUNK_DIR, HERITAGE_VIDEO_DIR, max_size=MAX_VIDEO_SIZE)
 
 # 数据库文件路径
 DB_PATH = os.path.join('data', 'restaurant.db')
+# DIY 饮品订单状态变化经 /api/diy/orders/events 推送给制作台屏幕（见 order_events.py）
+diy_order_feed = order_events.EventHub(DB_PATH)
 
 # 传承菜数据（示例数据，实际应该使用数据库）
 heritage_dishes = []
@@ -73,14 +119,29 @@ heritage_trials = []
 def get_db_connection():
     """连接数据库"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sql_profiler.connect(DB_PATH)
         conn.row_factory = sqlite3.Row
         conn.execute('PRAGMA foreign_keys = ON')
         return conn
     except Exception as e:
-        print(f"Error connecting to database: {str(e)}")
+        logger.exception("Error connecting to database: %s", e)
         raise
 
+@metrics.REGISTRY.add_collect_hook
+def collect_sync_backlog():
+    """抓取 /metrics 时统计待同步积压（与 get_sync_status 的口径一致）"""
+    conn = get_db_connection()
+    try:
+        pending = conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM heritage_dish_trials WHERE sync_status = 0 AND status = '已完成'),
+                (SELECT COUNT(*) FROM diy_drink_orders WHERE sync_status = 0 AND status = '已完成')
+        ''').fetchone()
+        metrics.SYNC_PENDING.labels('heritage_trial').set(pending[0])
+        metrics.SYNC_PENDING.labels('diy_order').set(pending[1])
+    finally:
+        conn.close()
+
 def init_db():
     """初始化特色管理数据库"""
     conn = get_db_connection()
@@ -182,16 +243,17 @@ def init_db():
         ''')
 
         conn.commit()
-        print("特色管理数据库初始化完成")
+        logger.info("特色管理数据库初始化完成")
 
     except Exception as e:
-        print(f"特色管理数据库初始化失败: {str(e)}")
+        logger.exception("特色管理数据库初始化失败: %s", e)
         raise
     finally:
         conn.close()
 
 # 销售系统API集成类
 class SalesSystemAPI:
+    # requests 只在调用销售系统接口时导入，不拖慢启动
     @staticmethod
     def get_headers():
         return {
@@ -202,6 +264,7 @@ class SalesSystemAPI:
     @staticmethod
     def create_order(order_data):
         """创建订单"""
+        import requests
         try:
             response = requests.post(
                 f'{SALES_API_BASE_URL}/api/orders/create',
@@ -211,12 +274,13 @@ class SalesSystemAPI:
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"创建订单失败: {str(e)}")
+            logger.exception("创建订单失败: %s", e)
             raise
 
     @staticmethod
     def update_order(order_id, order_data):
         """更新订单"""
+        import requests
         try:
             response = requests.put(
                 f'{SALES_API_BASE_URL}/api/orders/{order_id}',
@@ -226,12 +290,13 @@ class SalesSystemAPI:
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"更新订单失败: {str(e)}")
+            logger.exception("更新订单失败: %s", e)
             raise
 
     @staticmethod
     def get_dishes():
         """获取菜品列表"""
+        import requests
         try:
             response = requests.get(
                 f'{SALES_API_BASE_URL}/api/dishes/list',
@@ -240,7 +305,7 @@ class SalesSystemAPI:
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"获取菜品列表失败: {str(e)}")
+            logger.exception("获取菜品列表失败: %s", e)
             raise
 
 # 同步管理类
@@ -248,6 +313,7 @@ class SyncManager:
     @staticmethod
     def log_sync_attempt(conn, sync_type, record_id, status, error_message=None):
         """记录同步尝试"""
+        metrics.SYNC_ATTEMPTS.labels(sync_type, status).inc()
         try:
             conn.execute('''
                 INSERT INTO sync_logs (sync_type, record_id, status, error_message)
@@ -255,7 +321,7 @@ class SyncManager:
             ''', (sync_type, record_id, status, error_message))
             conn.commit()
         except Exception as e:
-            print(f"记录同步日志失败: {str(e)}")
+            logger.exception("记录同步日志失败: %s", e)
             conn.rollback()
 
     @staticmethod
@@ -369,12 +435,14 @@ class SyncManager:
 # 添加定时任务管理器
 class TaskManager:
     def __init__(self, app):
+        from apscheduler.schedulers.background import BackgroundScheduler
         self.app = app
         self.scheduler = BackgroundScheduler()
         self.setup_tasks()
 
     def setup_tasks(self):
         """设置定时任务"""
+        from apscheduler.triggers.interval import IntervalTrigger
         # 每5分钟同步一次未同步的记录
         self.scheduler.add_job(
             func=self.sync_pending_records,
@@ -384,11 +452,21 @@ class TaskManager:
             replace_existing=True
         )
 
+        # 每小时清理一次超时未完成的视频分片上传
+        self.scheduler.add_job(
+            func=metrics.track_job('cleanup_stale_uploads')(video_uploads.cleanup_stale),
+            trigger=IntervalTrigger(hours=1),
+            id='cleanup_stale_uploads',
+            name='清理过期分片上传',
+            replace_existing=True
+        )
+
     def start(self):
         """启动定时任务"""
         self.scheduler.start()
-        print("定时任务已启动")
+        logger.info("定时任务已启动")
 
+    @metrics.track_job('sync_pending_records')
     def sync_pending_records(self):
         """同步所有未同步的记录"""
         with self.app.app_context():
@@ -403,9 +481,9 @@ class TaskManager:
                 for trial in trials:
                     try:
                         SyncManager.sync_heritage_trial(conn, trial['id'])
-                        print(f"成功同步传承菜试做记录 ID: {trial['id']}")
+                        logger.debug("成功同步传承菜试做记录 ID: %s", trial['id'])
                     except Exception as e:
-                        print(f"同步传承菜试做记录失败 ID: {trial['id']}, 错误: {str(e)}")
+                        logger.exception("同步传承菜试做记录失败 ID: %s, 错误: %s", trial['id'], e)
 
                 # 同步DIY饮品订单
                 orders = conn.execute('''
@@ -416,12 +494,12 @@ class TaskManager:
                 for order in orders:
                     try:
                         SyncManager.sync_diy_order(conn, order['id'])
-                        print(f"成功同步DIY饮品订单 ID: {order['id']}")
+                        logger.debug("成功同步DIY饮品订单 ID: %s", order['id'])
                     except Exception as e:
-                        print(f"同步DIY饮品订单失败 ID: {order['id']}, 错误: {str(e)}")
+                        logger.exception("同步DIY饮品订单失败 ID: %s, 错误: %s", order['id'], e)
 
             except Exception as e:
-                print(f"执行同步任务时出错: {str(e)}")
+                logger.exception("执行同步任务时出错: %s", e)
             finally:
                 conn.close()
 
@@ -445,7 +523,7 @@ def heritage_index():
 def get_heritage_list():
     conn = get_db_connection()
     try:
-        dishes = conn.execute('''
+        dishes = json_provider.dict_cursor(conn).execute('''
             SELECT 
                 h.id,
                 h.dish_id,
@@ -460,7 +538,7 @@ def get_heritage_list():
             ORDER BY h.created_at DESC
         ''').fetchall()
         
-        return jsonify([dict(dish) for dish in dishes])
+        return jsonify(dishes)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
@@ -510,14 +588,100 @@ def upload_video():
         video.save(os.path.join('static/uploads/heritage/videos', filename))
         return jsonify({
             'message': '上传成功',
-            'url': f'/static/uploads/heritage/videos/{filename}'
+            'url': f'/static/uploads/heritage/videos/{filename}',
+            'stream_url': url_for('stream_heritage_video', filename=filename)
         })
 
     return jsonify({'error': '上传失败'}), 400
 
+# API：创建视频分片上传任务
+@app.route('/api/special/heritage/upload/init', methods=['POST'])
+def init_video_upload():
+    data = request.json or {}
+    filename = secure_filename(data.get('filename', ''))
+    if not filename or not allowed_video_file(filename):
+        return jsonify({'error': '不支持的视频文件类型'}), 400
+
+    try:
+        total_size = int(data.get('size', 0))
+        meta = video_uploads.create(filename, total_size, data.get('sha256'))
+        return jsonify({
+            'upload_id': meta['upload_id'],
+            'chunk_size': meta['chunk_size'],
+            'total_chunks': meta['total_chunks']
+        })
+    except (TypeError, ValueError):
+        return jsonify({'error': '文件大小无效'}), 400
+    except ChunkedUploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+
+# API：查询分片上传进度（断点续传）
+@app.route('/api/special/heritage/upload/<upload_id>', methods=['GET'])
+def get_video_upload_status(upload_id):
+    try:
+        meta = video_uploads.status(upload_id)
+        return jsonify({
+            'upload_id': upload_id,
+            'total_chunks': meta['total_chunks'],
+            'received_chunks': meta['received_chunks'],
+            'missing_chunks': meta['missing_chunks']
+        })
+    except ChunkedUploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+
+# API：上传单个分片，请求体为分片原始字节，X-Chunk-SHA256 为分片校验值
+@app.route('/api/special/heritage/upload/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_video_chunk(upload_id, index):
+    try:
+        result = video_uploads.save_chunk(
+            upload_id, index, request.stream,
+            checksum=request.headers.get('X-Chunk-SHA256')
+        )
+        return jsonify({'success': True, **result})
+    except ChunkedUploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+
+# API：合并分片，生成最终视频文件
+@app.route('/api/special/heritage/upload/<upload_id>/complete', methods=['POST'])
+def complete_video_upload(upload_id):
+    try:
+        meta = video_uploads.status(upload_id)
+        filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{meta['filename']}"
+        result = video_uploads.complete(upload_id, filename)
+        return jsonify({
+            'message': '上传成功',
+            'url': f'/static/uploads/heritage/videos/{filename}',
+            'stream_url': url_for('stream_heritage_video', filename=filename),
+            'size': result['size'],
+            'sha256': result['sha256']
+        })
+    except ChunkedUploadError as e:
+        return jsonify({'error': e.message}), e.status_code
+
+# 视频播放：支持 Range 请求（206 部分内容），拖动进度条时无需重新下载整个文件
+@app.route('/special/heritage/video/<path:filename>')
+def stream_heritage_video(filename):
+    filename = secure_filename(filename)
+    video_path = os.path.join(HERITAGE_VIDEO_DIR, filename)
+    if not filename or not allowed_video_file(filename) or not os.path.isfile(video_path):
+        abort(404)
+
+    # conditional=True 时 Werkzeug 处理 Range/If-Range 并返回 206，
+    # 文件对象交给 wsgi.file_wrapper，在 gunicorn 等服务器下使用 sendfile 零拷贝发送
+    response = send_file(
+        video_path,
+        mimetype=VIDEO_MIMETYPES.get(filename.rsplit('.', 1)[1].lower()),
+        conditional=True,
+        etag=True,
+        max_age=7 * 24 * 3600
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
 # API：从销售系统导入传承菜
 @app.route('/api/heritage/import_from_sales', methods=['POST'])
 def import_from_sales():
+    import requests
     try:
         # 从销售系统获取菜品列表
         response = requests.get(f'{SALES_API_BASE_URL}/api/dishes/list')
@@ -639,14 +803,14 @@ def diy_index():
 def get_diy_ingredients():
     conn = get_db_connection()
     try:
-        ingredients = conn.execute('''
+        ingredients = json_provider.dict_cursor(conn).execute('''
             SELECT *
             FROM diy_ingredients
             WHERE status = 1
             ORDER BY attribute, name
         ''').fetchall()
         
-        return jsonify([dict(ing) for ing in ingredients])
+        return jsonify(ingredients)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
@@ -712,7 +876,7 @@ def create_diy_order():
 def get_diy_orders():
     conn = get_db_connection()
     try:
-        orders = conn.execute('''
+        orders = json_provider.dict_cursor(conn).execute('''
             SELECT 
                 o.id,
                 o.customer_name,
@@ -729,7 +893,7 @@ def get_diy_orders():
         
         return jsonify({
             'success': True,
-            'orders': [dict(order) for order in orders]
+            'orders': orders
         })
     except Exception as e:
         return jsonify({
@@ -742,6 +906,7 @@ def get_diy_orders():
 # API：同步订单到销售系统
 @app.route('/api/diy/sync_order', methods=['POST'])
 def sync_order_to_sales():
+    import requests
     data = request.json
     conn = get_db_connection()
     try:
@@ -800,6 +965,11 @@ def sync_order_to_sales():
     finally:
         conn.close()
 
+# API：DIY饮品订单状态推送（Server-Sent Events），断线重连时按 Last-Event-ID 补发
+@app.route('/api/diy/orders/events')
+def diy_order_status_events():
+    return order_events.event_stream(diy_order_feed)
+
 # API：更新DIY饮品订单状态
 @app.route('/api/diy/update_status', methods=['POST'])
 def update_diy_order_status():
@@ -808,12 +978,16 @@ def update_diy_order_status():
         conn = get_db_connection()
         try:
             # 更新订单状态
-            conn.execute('''
+            cursor = conn.execute('''
                 UPDATE diy_drink_orders
                 SET status = ?,
                     updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
             ''', (data['status'], data['order_id']))
+            # 订单不存在时不记录事件，也不同步
+            if not cursor.rowcount:
+                return jsonify({'success': False, 'message': '订单不存在'}), 404
+            order_events.record_event(conn, data['order_id'], data['status'], source='diy')
 
             # 如果状态是"已完成"，尝试同步到销售系统
             if data['status'] == '已完成':
@@ -821,12 +995,13 @@ def update_diy_order_status():
                     order_id = SyncManager.sync_diy_order(conn, data['order_id'])
                     message = f'订单已完成，已同步到销售系统（订单号：{order_id}）'
                 except Exception as e:
-                    print(f"同步到销售系统失败: {str(e)}")
+                    logger.exception("同步到销售系统失败: %s", e)
                     message = '订单已完成，将稍后同步到销售系统'
             else:
                 message = f'订单状态已更新为：{data["status"]}'
 
             conn.commit()
+            diy_order_feed.notify()
             return jsonify({
                 'success': True,
                 'message': message
@@ -859,7 +1034,7 @@ def get_sync_status():
             ''').fetchone()['count']
 
             # 获取最近的同步失败记录
-            recent_failures = conn.execute('''
+            recent_failures = json_provider.dict_cursor(conn).execute('''
                 SELECT sync_type, record_id, error_message, created_at
                 FROM sync_logs
                 WHERE status = 'failed'
@@ -871,7 +1046,7 @@ def get_sync_status():
                 'success': True,
                 'pending_trials': pending_trials,
                 'pending_orders': pending_orders,
-                'recent_failures': [dict(f) for f in recent_failures]
+                'recent_failures': recent_failures
             })
         finally:
             conn.close()
@@ -890,7 +1065,8 @@ def ensure_directories():
         STATIC_DIR,
         TEMPLATES_DIR,
         UPLOAD_FOLDER,
-        os.path.join(STATIC_DIR, 'uploads', 'heritage', 'videos'),
+        HERITAGE_VIDEO_DIR,
+        HERITAGE_CHUNK_DIR,
         os.path.join(TEMPLATES_DIR, 'special'),
         os.path.join(TEMPLATES_DIR, 'special', 'heritage'),
         os.path.join(TEMPLATES_DIR, 'special', 'diy')
@@ -899,48 +1075,43 @@ def ensure_directories():
     for directory in directories:
         if not os.path.exists(directory):
             os.makedirs(directory)
-            print(f"创建目录: {directory}")
+            logger.info("创建目录: %s", directory)
 
-# 初始化数据库和定时任务
-def init_app():
-    print("开始初始化应用...")
-    
-    # 确保所有必要的目录存在
-    ensure_directories()
-    print("目录检查完成")
-    
-    # 初始化数据库
+def create_schema(conn):
+    """ORM 模型表和特色管理表（只创建缺失的表，不删除已有数据）"""
     with app.app_context():
-        try:
-            # 删除所有表
-            db.drop_all()
-            print("已删除所有表")
-            
-            # 重新创建所有表
-            db.create_all()
-            print("SQLAlchemy表创建完成")
-            init_db()
-            print("SQLite表创建完成")
-        except Exception as e:
-            print(f"初始化数据库时出错: {str(e)}")
-            raise
-    
-    # 初始化定时任务
-    try:
-        task_manager = TaskManager(app)
-        task_manager.start()
-        print("定时任务启动完成")
-    except Exception as e:
-        print(f"启动定时任务时出错: {str(e)}")
-        raise
+        db.create_all()
+    init_db()
+
+# 数据库迁移：按版本号顺序执行，已执行的记录在 schema_version 表中
+MIGRATIONS = [
+    Migration(1, '创建特色管理表', create_schema),
+    Migration(2, 'DIY 订单状态事件表', order_events.create_table),
+]
+
+def run_migrations():
+    return MigrationRunner(DB_PATH, 'special', MIGRATIONS).run()
+
+def create_app():
+    """应用工厂：准备目录并执行未应用的迁移；导入本模块不会访问数据库"""
+    ensure_directories()
+    run_migrations()
+    return app
+
+def start_scheduler():
+    """启动定时任务；多进程部署时只由选举出的主节点调用（见 gunicorn.conf.py）"""
+    task_manager = TaskManager(app)
+    task_manager.start()
+    return task_manager.scheduler
 
 if __name__ == '__main__':
     try:
-        init_app()
-        print("应用初始化完成，启动服务器...")
+        create_app()
+        start_scheduler()
+        logger.info("应用初始化完成，启动服务器...")
         # 修改端口为5003，但仅在直接运行时使用
         if not hasattr(app, 'parent_app'):
             app.run(debug=True, port=5003)
     except Exception as e:
-        print(f"启动应用时出错: {str(e)}")
-        raise 
\ No newline at end of file
+        logger.exception("启动应用时出错: %s", e)
+        raise
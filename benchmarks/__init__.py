@@ -0,0 +1,13 @@
+"""性能基准测试
+
+依赖见 benchmarks/requirements.txt。
+
+生成测试数据（默认 small 规模，full 为 100 万订单 / 10 万采购明细 / 5 万批次）：
+    python -m benchmarks.datagen --scale full --output benchmarks/.data/full
+
+运行基准并与已保存的基线对比：
+    python -m pytest benchmarks --benchmark-compare
+
+更新基线：
+    python -m pytest benchmarks --benchmark-save=baseline
+"""
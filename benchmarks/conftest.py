@@ -0,0 +1,97 @@
+import os
+import sys
+import importlib
+import itertools
+
+import pytest
+from jinja2 import ChoiceLoader, FunctionLoader
+
+from benchmarks import datagen
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+# 基线结果随代码一起提交，回归时 --benchmark-compare 可以直接看到差异
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, 'baselines')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--bench-scale', choices=sorted(datagen.SCALES), default='small',
+                     help='基准数据规模（full 为 100 万订单）')
+    parser.addoption('--bench-regenerate', action='store_true',
+                     help='重新生成基准数据，而不是复用 benchmarks/.data 下已有的数据')
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # 默认把结果存到 benchmarks/baselines，而不是当前目录下的 .benchmarks
+    if hasattr(config.option, 'benchmark_storage') and config.option.benchmark_storage == 'file://./.benchmarks':
+        config.option.benchmark_storage = f'file://{BASELINE_DIR}'
+
+
+@pytest.fixture(scope='session')
+def bench_workspace(request):
+    """生成（或复用）基准数据，并切换到数据所在目录：各子系统都用相对路径 data/*.db"""
+    scale = request.config.getoption('--bench-scale')
+    workspace = os.path.join(BENCHMARK_DIR, '.data', scale)
+    marker = os.path.join(workspace, 'data', 'sales.db')
+    if request.config.getoption('--bench-regenerate') or not os.path.exists(marker):
+        datagen.generate(workspace, scale)
+
+    previous_dir = os.getcwd()
+    os.chdir(workspace)
+    sys.path.insert(0, ROOT_DIR)
+    yield workspace
+    os.chdir(previous_dir)
+
+
+def load_app(module_name):
+    """导入子系统并返回测试客户端；精简版仓库不包含模板，缺失的模板渲染为空页面，只测量路由本身的数据处理"""
+    module = importlib.import_module(module_name)
+    app = module.create_app()
+    app.config['TESTING'] = True
+    app.jinja_env.loader = ChoiceLoader([app.jinja_env.loader, FunctionLoader(lambda name: '')])
+    return module, app.test_client()
+
+
+@pytest.fixture(scope='session')
+def sales_client(bench_workspace):
+    return load_app('app_sales')[1]
+
+
+@pytest.fixture(scope='session')
+def inventory_client(bench_workspace):
+    return load_app('app_inventory')[1]
+
+
+@pytest.fixture(scope='session')
+def purchase_client(bench_workspace):
+    return load_app('app_purchase')[1]
+
+
+@pytest.fixture(scope='session')
+def pending_outbound_numbers(bench_workspace):
+    """待出库单号迭代器，出库处理每轮消耗一个"""
+    import sqlite3
+    conn = sqlite3.connect(os.path.join('data', 'restaurant.db'))
+    numbers = [row[0] for row in conn.execute(
+        "SELECT DISTINCT outbound_no FROM outbound_records WHERE status = '待出库' ORDER BY outbound_no")]
+    conn.close()
+    return itertools.cycle(numbers) if numbers else iter(())
+
+
+@pytest.fixture(scope='session')
+def recent_order_numbers(bench_workspace):
+    import sqlite3
+    conn = sqlite3.connect(os.path.join('data', 'sales.db'))
+    numbers = [row[0] for row in conn.execute('SELECT order_number FROM orders ORDER BY created_at DESC LIMIT 500')]
+    conn.close()
+    return numbers
+
+
+@pytest.fixture(scope='session')
+def menu_item_codes(bench_workspace):
+    import sqlite3
+    conn = sqlite3.connect(os.path.join('data', 'sales.db'))
+    codes = [row[0] for row in conn.execute("SELECT item_code FROM menu_items WHERE status = '在售' ORDER BY item_code LIMIT 3")]
+    conn.close()
+    return codes
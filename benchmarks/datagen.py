@@ -0,0 +1,275 @@
+import os
+import sys
+import random
+import sqlite3
+import argparse
+import importlib
+from itertools import islice
+from datetime import datetime, timedelta
+
+# 数据规模：orders 销售订单、purchase_lines 采购明细、lots 入库批次
+SCALES = {
+    'small': {'orders': 20000, 'purchase_lines': 5000, 'lots': 2500, 'pending_outbound': 500},
+    'full': {'orders': 1000000, 'purchase_lines': 100000, 'lots': 50000, 'pending_outbound': 2000},
+}
+DEFAULT_SEED = 20240101
+# 默认基准日期：固定取值，不随运行日期变化，相同参数生成的数据才完全一致
+DEFAULT_ANCHOR = datetime(2024, 12, 31, 21, 0, 0)
+# 数据覆盖的天数（截至基准日期）
+HISTORY_DAYS = 365
+# executemany 每批写入的行数
+INSERT_CHUNK_SIZE = 10000
+
+SUPPLY_TYPES = ['肉禽类', '蔬菜类', '香料类', '调味品', '主食类', '豆制品蛋奶', '菌菇类', '其他']
+MATERIALS = {
+    '肉禽类': ['鸡肉', '猪肉', '牛肉', '羊肉', '鸭肉', '草鱼', '鲜虾'],
+    '蔬菜类': ['白菜', '土豆', '尖椒', '西红柿', '黄瓜', '萝卜', '生菜', '洋葱'],
+    '香料类': ['八角', '花椒', '桂皮', '香叶'],
+    '调味品': ['酱油', '食醋', '白糖', '食盐', '料酒', '豆瓣酱'],
+    '主食类': ['大米', '面粉', '米粉', '面条'],
+    '豆制品蛋奶': ['豆腐', '鸡蛋', '牛奶', '腐竹'],
+    '菌菇类': ['香菇', '金针菇', '木耳', '平菇'],
+    '其他': ['食用油', '淀粉', '芝麻'],
+}
+MENU_CATEGORIES = ['热菜', '凉菜', '汤羹', '主食', '饮品', '传承菜']
+PURCHASE_STATUSES = ['已审核', '已收货', '已付款', '已入库', '已入库', '已入库', '草稿', '待审核']
+ORDER_STATUSES = ['已完成'] * 17 + ['已接单', '制作中', '已取消']
+
+
+def chunked(rows, size=INSERT_CHUNK_SIZE):
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_many(conn, sql, rows):
+    count = 0
+    for chunk in chunked(rows):
+        conn.executemany(sql, chunk)
+        count += len(chunk)
+    conn.commit()
+    return count
+
+
+def fast_connect(path):
+    # 只用于生成数据：关闭同步写盘以加快批量写入
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    return conn
+
+
+def create_schemas():
+    """在当前目录下按各子系统自己的初始化逻辑建表"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    app_purchase = importlib.import_module('app_purchase')
+    app_inventory = importlib.import_module('app_inventory')
+    app_sales = importlib.import_module('app_sales')
+
+    # 导入模块不会建库，按各子系统的迁移序列初始化当前目录下的数据库
+    app_purchase.run_migrations()
+    app_inventory.run_migrations()
+    app_sales.run_migrations()
+
+    # init_db 建的评级表缺少评级页面写入的综合评级列，采购分析要用到，这里按评级页面的写法补齐
+    conn = sqlite3.connect(os.path.join('data', 'restaurant.db'))
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(supplier_ratings)')}
+    for column, column_type in (('overall_rating', 'TEXT'), ('overall_score', 'REAL')):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE supplier_ratings ADD COLUMN {column} {column_type}')
+    conn.commit()
+    conn.close()
+
+
+def generate_restaurant(conn, rng, volumes, anchor):
+    materials = [(name, supply_type) for supply_type, names in MATERIALS.items() for name in names]
+    item_codes = {name: f'WZ{index:04d}' for index, (name, _) in enumerate(materials, start=1)}
+
+    suppliers = [f'GYS{index:04d}' for index in range(1, 201)]
+    insert_many(conn, '''
+        INSERT INTO suppliers (code, name, contact_person, contact_phone, address, supply_type,
+                               cooperation_start_date, status, credit_rating)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', ((
+        code, f'供应商{index}', f'联系人{index}', f'138{rng.randrange(10 ** 8):08d}', f'地址{index}号',
+        SUPPLY_TYPES[index % len(SUPPLY_TYPES)],
+        (anchor - timedelta(days=rng.randrange(HISTORY_DAYS, 3 * HISTORY_DAYS))).strftime('%Y-%m-%d'),
+        '活跃' if index % 20 else '停用', rng.choice('ABBBC')
+    ) for index, code in enumerate(suppliers, start=1)))
+
+    # 每个供应商每季度一次评级
+    insert_many(conn, '''
+        INSERT INTO supplier_ratings (supplier_code, rating, rating_date, rater, overall_rating, overall_score)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((
+        code, grade, (anchor - timedelta(days=quarter * 91)).strftime('%Y-%m-%d'), '采购主管', grade,
+        round(rng.uniform(60, 98), 1)
+    ) for code in suppliers for quarter in range(4) for grade in [rng.choice('ABBBC')]))
+
+    # 采购单平均 5 条明细，单号 PO + 日期 + 3位序号
+    order_count = max(volumes['purchase_lines'] // 5, 1)
+    orders = []
+    per_day = {}
+    for _ in range(order_count):
+        order_date = anchor - timedelta(days=rng.randrange(HISTORY_DAYS))
+        day = order_date.strftime('%Y%m%d')
+        per_day[day] = per_day.get(day, 0) + 1
+        orders.append((f'PO{day}{per_day[day]:03d}', rng.choice(suppliers), order_date.strftime('%Y-%m-%d'),
+                       rng.choice(PURCHASE_STATUSES)))
+    insert_many(conn, '''
+        INSERT INTO purchase_orders (order_id, supplier_id, order_date, status, created_by, created_at)
+        VALUES (?, ?, ?, ?, 'admin', ?)
+    ''', ((order_id, supplier_id, order_date, status, f'{order_date} 09:00:00')
+          for order_id, supplier_id, order_date, status in orders))
+
+    lines = []
+    for line_index in range(volumes['purchase_lines']):
+        order_id, _, order_date, status = orders[line_index % order_count]
+        name, supply_type = rng.choice(materials)
+        quantity = rng.randint(5, 200)
+        unit_price = round(rng.uniform(1, 80), 2)
+        lines.append((order_id, item_codes[name], name, supply_type, quantity, 'kg', unit_price,
+                      round(quantity * unit_price, 2), order_date, status))
+    insert_many(conn, '''
+        INSERT INTO purchase_order_items (order_id, item_code, item_name, item_type, quantity, unit,
+                                          unit_price, total_price)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (line[:8] for line in lines))
+
+    # 入库批次：每个批次对应一条采购明细，入库时间晚于采购日期 1~5 天
+    lots = []
+    for lot_index in range(volumes['lots']):
+        order_id, _, name, _, quantity, unit, _, _, order_date, _ = rng.choice(lines)
+        inbound_time = datetime.strptime(order_date, '%Y-%m-%d') + timedelta(days=rng.randint(1, 5), hours=rng.randint(8, 18))
+        lots.append((f'IN{lot_index + 1:08d}', order_id, name, float(quantity), unit,
+                     inbound_time.strftime('%Y-%m-%d %H:%M:%S'), 0 if lot_index % 50 == 0 else 1,
+                     f'质检员{lot_index % 7}', f'库位{rng.choice("ABCDEF")}{rng.randint(1, 20)}'))
+    insert_many(conn, '''
+        INSERT INTO inbound_records (inbound_no, purchase_no, item_name, quantity, unit, inbound_time,
+                                     quality_check, inspector, storage_location)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', lots)
+
+    # 已出库历史（每个批次约两次领用）和待出库单（供出库处理基准使用）
+    qualified = [lot for lot in lots if lot[6] == 1]
+
+    def outbound_rows():
+        for index in range(len(qualified) * 2):
+            inbound_no, _, name, quantity, unit, inbound_time = rng.choice(qualified)[:6]
+            outbound_time = datetime.strptime(inbound_time, '%Y-%m-%d %H:%M:%S') + timedelta(days=rng.randint(0, 10))
+            yield (f'OUTH{index + 1:08d}', inbound_no, name, round(quantity * rng.uniform(0.01, 0.1), 2), unit,
+                   outbound_time.strftime('%Y-%m-%d %H:%M:%S'), '厨房', '主管', '日常领用', '已出库')
+        for index in range(volumes['pending_outbound']):
+            inbound_no, _, name, quantity, unit = rng.choice(qualified)[:5]
+            yield (f'OUTP{index + 1:08d}', inbound_no, name, 0.01, unit,
+                   None, '厨房', '主管', '日常领用', '待出库')
+
+    insert_many(conn, '''
+        INSERT INTO outbound_records (outbound_no, inbound_no, item_name, quantity, unit, outbound_time,
+                                      receiver, approver, purpose, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', outbound_rows())
+
+
+def generate_sales(conn, rng, volumes, anchor):
+    year = anchor.strftime('%Y')
+    menu = []
+    for index in range(1, 121):
+        category = MENU_CATEGORIES[index % len(MENU_CATEGORIES)]
+        price = round(rng.uniform(8, 128), 0)
+        menu.append((f'ID{year}{index:03d}', f'{category}{index}', category, 1 if category == '传承菜' else 0,
+                     price, round(price * rng.uniform(0.3, 0.5), 2), '在售' if index % 15 else '下架'))
+    insert_many(conn, '''
+        INSERT INTO menu_items (item_code, item_name, category, is_heritage, price, cost, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', menu)
+
+    # 订单均匀分布在最近一年，单号 DD + 日期 + 4位日序号；热门菜品按权重抽取
+    weights = [1.0 / (rank + 1) for rank in range(len(menu))]
+    per_day = {}
+    items = []
+
+    def order_rows():
+        for _ in range(volumes['orders']):
+            created = anchor - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+            day = created.strftime('%Y%m%d')
+            per_day[day] = per_day.get(day, 0) + 1
+            order_number = f'DD{day}{per_day[day]:04d}'
+            total = 0.0
+            for dish in rng.choices(menu, weights=weights, k=rng.randint(1, 4)):
+                quantity = rng.randint(1, 3)
+                total += dish[4] * quantity
+                items.append((order_number, dish[0], dish[1], quantity, dish[4], dish[4] * quantity))
+            order_type = '堂食' if rng.random() < 0.7 else '外卖'
+            created_at = created.strftime('%Y-%m-%d %H:%M:%S')
+            yield (order_number, order_type, rng.choice(ORDER_STATUSES),
+                   f'{rng.choice("天地玄黄")}{rng.randint(1, 99):02d}' if order_type == '堂食' else '',
+                   total, total, rng.choice(['现金', '微信', '支付宝', '银行卡']), created_at, created_at)
+
+    order_sql = '''
+        INSERT INTO orders (order_number, order_type, order_status, table_number, total_amount, final_amount,
+                            payment_method, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    item_sql = '''
+        INSERT INTO order_items (order_number, item_code, item_name, quantity, unit_price, total_price)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    # 订单和明细分块交替写入，内存占用与总量无关
+    for chunk in chunked(order_rows()):
+        conn.executemany(order_sql, chunk)
+        conn.executemany(item_sql, items)
+        items.clear()
+    conn.commit()
+
+    conn.execute('''
+        UPDATE menu_items
+        SET sales_count = (SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE order_items.item_code = menu_items.item_code)
+    ''')
+    conn.commit()
+
+
+def generate(output_dir, scale='small', seed=DEFAULT_SEED, anchor=None):
+    """在 output_dir/data 下生成 restaurant.db 和 sales.db；相同参数生成的数据完全一致"""
+    volumes = SCALES[scale] if isinstance(scale, str) else scale
+    anchor = anchor or DEFAULT_ANCHOR
+
+    os.makedirs(output_dir, exist_ok=True)
+    previous_dir = os.getcwd()
+    os.chdir(output_dir)
+    try:
+        for name in ('restaurant.db', 'sales.db'):
+            if os.path.exists(os.path.join('data', name)):
+                os.remove(os.path.join('data', name))
+        create_schemas()
+
+        conn = fast_connect(os.path.join('data', 'restaurant.db'))
+        generate_restaurant(conn, random.Random(seed), volumes, anchor)
+        conn.close()
+
+        conn = fast_connect(os.path.join('data', 'sales.db'))
+        generate_sales(conn, random.Random(seed + 1), volumes, anchor)
+        conn.close()
+    finally:
+        os.chdir(previous_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成性能基准测试数据')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--anchor-date', help=f'数据截止日期 YYYY-MM-DD，默认 {DEFAULT_ANCHOR:%Y-%m-%d}')
+    parser.add_argument('--output', default=os.path.join('benchmarks', '.data', 'small'))
+    args = parser.parse_args()
+
+    anchor = datetime.strptime(args.anchor_date, '%Y-%m-%d').replace(hour=21) if args.anchor_date else None
+    started = datetime.now()
+    generate(os.path.abspath(args.output), args.scale, args.seed, anchor)
+    print(f"已生成 {args.scale} 规模数据到 {args.output}，耗时 {(datetime.now() - started).total_seconds():.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
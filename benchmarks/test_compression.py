@@ -0,0 +1,63 @@
+"""响应压缩基准：大 JSON 接口在各压缩级别下节省的字节数（extra_info）与压缩耗时
+
+pytest benchmarks/test_compression.py --benchmark-columns=mean,max 查看耗时，
+--benchmark-json 输出中的 extra_info 记录原始大小、压缩后大小和节省比例。
+"""
+import gzip
+
+import pytest
+
+import compression
+
+ROUTES = {
+    'stock_list': '/api/inventory/stock/list',
+    'transfer_history': '/api/inventory/transfer/history',
+}
+ENCODINGS = [('gzip', 1), ('gzip', 6), ('gzip', 9), ('br', 4), ('br', 6)]
+
+
+@pytest.fixture(scope='module')
+def payloads(inventory_client):
+    return {name: inventory_client.get(url).data for name, url in ROUTES.items()}
+
+
+def decompress(encoding, data):
+    if encoding == 'br':
+        return compression.brotli.decompress(data)
+    return gzip.decompress(data)
+
+
+@pytest.mark.benchmark(group='compression')
+@pytest.mark.parametrize('route', sorted(ROUTES))
+@pytest.mark.parametrize('encoding,level', ENCODINGS)
+def test_compress_payload(benchmark, payloads, route, encoding, level):
+    """只测压缩本身的 CPU 开销"""
+    if encoding == 'br' and compression.brotli is None:
+        pytest.skip('未安装 brotli')
+    middleware = compression.CompressionMiddleware(None, gzip_level=level, brotli_quality=level)
+    data = payloads[route]
+
+    def run():
+        encoder = middleware._encoder(encoding)
+        return encoder.compress(data) + encoder.finish()
+
+    compressed = benchmark(run)
+    assert decompress(encoding, compressed) == data
+    benchmark.extra_info.update({
+        'raw_bytes': len(data),
+        'compressed_bytes': len(compressed),
+        'saved_ratio': round(1 - len(compressed) / len(data), 4),
+    })
+
+
+@pytest.mark.benchmark(group='compression')
+@pytest.mark.parametrize('accept_encoding', ['identity', 'gzip'])
+def test_transfer_history_request(benchmark, inventory_client, accept_encoding):
+    """端到端请求：对比压缩与不压缩时接口的总耗时"""
+    headers = {'Accept-Encoding': accept_encoding}
+    response = benchmark.pedantic(lambda: inventory_client.get(ROUTES['transfer_history'], headers=headers),
+                                  rounds=5, iterations=1)
+    assert response.status_code == 200
+    assert response.headers.get('Content-Encoding') == (None if accept_encoding == 'identity' else 'gzip')
+    assert 'Accept-Encoding' in response.headers['Vary']
+    benchmark.extra_info['response_bytes'] = len(response.data)
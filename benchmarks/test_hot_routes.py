@@ -0,0 +1,98 @@
+"""热点路由基准：通过 Flask 测试客户端驱动，与真实请求走同样的代码路径"""
+import itertools
+import uuid
+
+import pytest
+
+import fragment_cache
+
+
+def check(response, expected=(200,)):
+    assert response.status_code in expected, response.status_code
+    return response
+
+
+@pytest.mark.benchmark(group='sales')
+def test_new_order_form(benchmark, sales_client):
+    benchmark(lambda: check(sales_client.get('/sales/orders/new')))
+
+
+@pytest.mark.benchmark(group='sales')
+def test_new_order_submit(benchmark, sales_client, menu_item_codes):
+    form = {
+        'order_type': '堂食',
+        'table_number': '天01',
+        'item_code[]': menu_item_codes[:2],
+        'quantity[]': ['2', '1'],
+        'item_note[]': ['', '少辣'],
+    }
+    # 每轮写入一张新订单；提交成功后重定向到订单详情
+    benchmark.pedantic(lambda: check(sales_client.post('/sales/orders/new', data=form), (302,)),
+                       rounds=50, iterations=1)
+
+
+@pytest.mark.benchmark(group='sales')
+def test_bulk_order_submit(benchmark, sales_client, menu_item_codes):
+    """POS 批量上传：每轮一个请求写入 100 个订单（幂等键每轮不同，基准数据目录会复用）"""
+    run_id = uuid.uuid4().hex[:8]
+    batches = itertools.count()
+
+    def run():
+        batch = next(batches)
+        orders = [{
+            'idempotency_key': f'bench-{run_id}-{batch}-{i}',
+            'order_type': '堂食',
+            'table_number': '天01',
+            'items': [{'item_code': menu_item_codes[0], 'quantity': 2}, {'item_code': menu_item_codes[1], 'quantity': 1}],
+        } for i in range(100)]
+        response = check(sales_client.post('/api/sales/orders/bulk', json={'orders': orders}))
+        assert response.json['created'] == 100
+
+    benchmark.pedantic(run, rounds=10, iterations=1)
+
+
+@pytest.mark.benchmark(group='sales')
+def test_sales_analysis(benchmark, sales_client):
+    benchmark.pedantic(lambda: check(sales_client.get('/sales/analysis')), rounds=5, iterations=1)
+
+
+@pytest.mark.benchmark(group='sales')
+def test_sales_analysis_uncached(benchmark, sales_client):
+    """每轮清空片段缓存，测量统计 SQL 加渲染的完整耗时"""
+    benchmark.pedantic(lambda: check(sales_client.get('/sales/analysis')),
+                       setup=fragment_cache.cache.clear, rounds=5, iterations=1)
+
+
+@pytest.mark.benchmark(group='sales')
+def test_export_orders(benchmark, sales_client, recent_order_numbers):
+    url = '/sales/export_orders?orders=' + ','.join(recent_order_numbers)
+    benchmark.pedantic(lambda: check(sales_client.get(url)), rounds=10, iterations=1)
+
+
+@pytest.mark.benchmark(group='inventory')
+def test_stock_list(benchmark, inventory_client):
+    benchmark.pedantic(lambda: check(inventory_client.get('/api/inventory/stock/list')), rounds=10, iterations=1)
+
+
+@pytest.mark.benchmark(group='inventory')
+def test_process_outbound(benchmark, inventory_client, pending_outbound_numbers):
+    def setup():
+        return (next(pending_outbound_numbers),), {}
+
+    def process(outbound_no):
+        check(inventory_client.post('/api/inventory/outbound/process_v2', json={
+            'outbound_no': outbound_no, 'status': '已出库', 'receiver': '厨房', 'approver': '主管'
+        }), (200, 400))
+
+    benchmark.pedantic(process, setup=setup, rounds=50, iterations=1)
+
+
+@pytest.mark.benchmark(group='purchase')
+def test_purchase_analysis(benchmark, purchase_client):
+    benchmark.pedantic(lambda: check(purchase_client.get('/purchase/analysis')), rounds=5, iterations=1)
+
+
+@pytest.mark.benchmark(group='purchase')
+def test_purchase_analysis_uncached(benchmark, purchase_client):
+    benchmark.pedantic(lambda: check(purchase_client.get('/purchase/analysis')),
+                       setup=fragment_cache.cache.clear, rounds=5, iterations=1)
@@ -0,0 +1,88 @@
+"""JSON 序列化基准：Flask 默认编码器与 json_provider（orjson）在最大的接口数据上的编码耗时"""
+import json
+import tracemalloc
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+
+ROUTES = {
+    'stock_list': '/api/inventory/stock/list',
+    'transfer_history': '/api/inventory/transfer/history',
+}
+
+
+@pytest.fixture(scope='module')
+def inventory_app(inventory_client):
+    return inventory_client.application
+
+
+@pytest.fixture(scope='module')
+def payloads(inventory_client):
+    return {name: json.loads(inventory_client.get(url).data) for name, url in ROUTES.items()}
+
+
+@pytest.mark.benchmark(group='json')
+@pytest.mark.parametrize('route', sorted(ROUTES))
+@pytest.mark.parametrize('provider', ['stdlib', 'fast'])
+def test_jsonify(benchmark, inventory_app, payloads, route, provider):
+    if provider == 'fast' and json_provider.orjson is None:
+        pytest.skip('未安装 orjson')
+    encoder = json_provider.FastJSONProvider(inventory_app) if provider == 'fast' else DefaultJSONProvider(inventory_app)
+    data = payloads[route]
+
+    def run():
+        with inventory_app.app_context():
+            return encoder.response(data).get_data()
+
+    body = benchmark(run)
+    assert json.loads(body) == data
+    benchmark.extra_info['bytes'] = len(body)
+
+
+@pytest.mark.benchmark(group='json')
+@pytest.mark.parametrize('row_factory', ['sqlite3.Row', 'dict_factory'])
+def test_rows_to_json(benchmark, inventory_app, row_factory):
+    """查询出库记录并编码：sqlite3.Row 逐行转 dict 与行工厂直接产出 dict 的对比"""
+    import app_inventory
+
+    def run():
+        conn = app_inventory.get_db_connection()
+        try:
+            if row_factory == 'dict_factory':
+                rows = json_provider.dict_cursor(conn).execute('SELECT * FROM outbound_records').fetchall()
+            else:
+                rows = [dict(row) for row in conn.execute('SELECT * FROM outbound_records').fetchall()]
+        finally:
+            conn.close()
+        return inventory_app.json.dumps_bytes(rows)
+
+    assert json.loads(benchmark.pedantic(run, rounds=10, iterations=1))
+
+
+STREAMED_ROUTES = [
+    '/api/inventory/stock/list',
+    '/api/inventory/transfer/history',
+    '/api/inventory/debug/all_outbound_records',
+    '/api/inventory/inbound_list/completed',
+]
+
+
+@pytest.mark.benchmark(group='json-stream')
+@pytest.mark.parametrize('url', STREAMED_ROUTES)
+def test_streamed_route(benchmark, inventory_client, url):
+    """流式接口：逐块读取响应，记录总字节数与读取期间的 Python 内存峰值"""
+    def run():
+        response = inventory_client.get(url, buffered=False)
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in response.response)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            response.close()
+        return size, peak
+
+    size, peak = benchmark.pedantic(run, rounds=5, iterations=1)
+    benchmark.extra_info.update({'bytes': size, 'peak_memory_bytes': peak})
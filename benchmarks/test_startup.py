@@ -0,0 +1,40 @@
+"""启动耗时基准：每轮在新的解释器中导入子系统，测量冷启动时间
+
+import 只允许定义路由，不能建库、建目录或导入重量级依赖；create_app() 在已是最新版本的数据库上
+只做一次 schema_version 查询。
+"""
+import os
+import sys
+import subprocess
+
+import pytest
+
+from benchmarks.conftest import ROOT_DIR
+
+APP_MODULES = ['app_purchase', 'app_inventory', 'app_sales', 'app_special']
+# 只在真正用到时才导入的依赖
+LAZY_DEPENDENCIES = ['xlsxwriter', 'requests', 'apscheduler']
+
+
+def run_python(code, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, LOG_LEVEL='WARNING')
+    subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, check=True)
+
+
+@pytest.mark.benchmark(group='startup')
+@pytest.mark.parametrize('module_name', APP_MODULES)
+def test_import(benchmark, tmp_path, module_name):
+    check = (f'import sys, {module_name}\n'
+             f'loaded = [m for m in {LAZY_DEPENDENCIES!r} if m in sys.modules]\n'
+             f'assert not loaded, loaded\n')
+    benchmark.pedantic(run_python, args=(check, str(tmp_path)), rounds=5, iterations=1)
+    # 导入没有副作用：空目录下不会产生数据库、日志等文件
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.benchmark(group='startup')
+@pytest.mark.parametrize('module_name', ['app_purchase', 'app_inventory', 'app_sales'])
+def test_create_app(benchmark, bench_workspace, module_name):
+    # 基准数据已迁移到最新版本，这里测量的是生产环境重启时的耗时
+    code = f'import {module_name}; {module_name}.create_app()'
+    benchmark.pedantic(run_python, args=(code, bench_workspace), rounds=5, iterations=1)
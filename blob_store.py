@@ -0,0 +1,150 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+# 读写磁盘时使用的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 最近写入或复用过的 blob 在该时间内不回收：save() 返回后引用记录要等事务提交才可见，
+# 其他进程此时统计引用数为零也不能删除文件
+RELEASE_GRACE_SECONDS = 600
+
+# 同一进程内 save() 与 release() 互斥，避免检查引用和删除文件之间有新的写入
+_lock = threading.Lock()
+
+# 引用 blob 的数据表及其路径字段，引用计数由这些表实时统计
+REFERENCE_TABLES = (
+    ('inspection_attachments', 'file_path'),
+    ('supplier_contracts', 'file_path'),
+)
+
+
+# 内容寻址存储类
+class BlobStore:
+    """按 SHA-256 内容寻址的文件存储：相同内容只保存一份，无引用时回收"""
+
+    def __init__(self, static_dir='static', blob_dir=os.path.join('uploads', 'blobs')):
+        self.static_dir = static_dir
+        self.blob_dir = blob_dir
+
+    def relative_path(self, digest):
+        """blob 相对 static 目录的路径，按哈希前两位分目录"""
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def absolute_path(self, relative_path):
+        return os.path.join(self.static_dir, relative_path)
+
+    def is_blob(self, relative_path):
+        return bool(relative_path) and os.path.normpath(relative_path).startswith(
+            os.path.normpath(self.blob_dir) + os.sep)
+
+    def digest_of(self, relative_path):
+        """从 blob 路径中取出 SHA-256，用作 ETag"""
+        return os.path.basename(relative_path) if self.is_blob(relative_path) else None
+
+    def save(self, stream):
+        """流式写入临时文件并同时计算哈希，内容已存在时直接复用"""
+        tmp_dir = os.path.join(self.static_dir, self.blob_dir, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    block = stream.read(COPY_BUFFER_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+
+            relative_path = self.relative_path(digest.hexdigest())
+            target_path = self.absolute_path(relative_path)
+            with _lock:
+                if os.path.exists(target_path):
+                    # 复用已有内容时刷新修改时间，回收时按宽限期跳过
+                    os.utime(target_path)
+                else:
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return {
+            'sha256': digest.hexdigest(),
+            'size': size,
+            'path': relative_path
+        }
+
+    def save_file(self, file_path, remove_source=False):
+        """将已有文件导入存储，用于迁移旧的上传文件"""
+        with open(file_path, 'rb') as f:
+            blob = self.save(f)
+        if remove_source and os.path.abspath(file_path) != os.path.abspath(self.absolute_path(blob['path'])):
+            os.remove(file_path)
+        return blob
+
+    def count_references(self, cursor, relative_path):
+        """统计所有引用表中指向该 blob 的记录数"""
+        total = 0
+        for table, column in REFERENCE_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {column} = ?", (relative_path,))
+            total += cursor.fetchone()[0]
+        return total
+
+    def is_recent(self, file_path):
+        """文件在宽限期内写入或复用过"""
+        return time.time() - os.path.getmtime(file_path) < RELEASE_GRACE_SECONDS
+
+    def release(self, cursor, relative_path):
+        """删除引用记录的事务提交后调用：重新统计引用数，为零时回收文件，返回是否已删除
+
+        宽限期内的文件可能正被其他请求引用，留给 collect_garbage 回收。
+        """
+        if not self.is_blob(relative_path):
+            return False
+
+        file_path = self.absolute_path(relative_path)
+        with _lock:
+            if self.count_references(cursor, relative_path) > 0:
+                return False
+            if not os.path.exists(file_path) or self.is_recent(file_path):
+                return False
+            os.remove(file_path)
+        return True
+
+    def collect_garbage(self, cursor):
+        """全量扫描，回收没有任何引用且已过宽限期的 blob，返回回收数量"""
+        root = os.path.join(self.static_dir, self.blob_dir)
+        if not os.path.exists(root):
+            return 0
+
+        referenced = set()
+        for table, column in REFERENCE_TABLES:
+            cursor.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} LIKE ?",
+                           (self.blob_dir + '%',))
+            referenced.update(os.path.normpath(row[0]) for row in cursor.fetchall())
+
+        removed = 0
+        for prefix in os.listdir(root):
+            prefix_dir = os.path.join(root, prefix)
+            if prefix == 'tmp' or not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if os.path.normpath(self.relative_path(name)) in referenced:
+                    continue
+                file_path = os.path.join(prefix_dir, name)
+                with _lock:
+                    if self.is_recent(file_path):
+                        continue
+                    os.remove(file_path)
+                removed += 1
+            if not os.listdir(prefix_dir):
+                shutil.rmtree(prefix_dir, ignore_errors=True)
+        return removed
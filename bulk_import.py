@@ -0,0 +1,250 @@
+import io
+import os
+import csv
+import time
+from itertools import islice
+
+# 每批校验和写入的行数（同时受 SQLite 单条语句 999 个参数的限制）
+DEFAULT_BATCH_SIZE = 500
+# 错误报告最多保留的条数，避免大文件全部出错时占用过多内存
+MAX_REPORTED_ERRORS = 1000
+
+
+class BulkImportError(Exception):
+    """导入文件本身无法解析时抛出（格式、表头等），行级错误写入报告"""
+
+
+def iter_csv_rows(stream):
+    """逐行解析 CSV，生成 (行号, 行字典)，兼容带 BOM 的 Excel 导出文件"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    if not reader.fieldnames:
+        raise BulkImportError('文件为空或缺少表头')
+    for row in reader:
+        yield reader.line_num, {(k or '').strip(): (v or '').strip() for k, v in row.items()}
+
+
+def iter_xlsx_rows(stream):
+    """以只读模式逐行解析 XLSX 第一个工作表，生成 (行号, 行字典)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise BulkImportError('导入 XLSX 文件需要安装 openpyxl')
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            raise BulkImportError('文件为空或缺少表头')
+        header = [str(h).strip() if h is not None else '' for h in header]
+        for line_num, values in enumerate(rows, start=2):
+            if values is None or all(v is None for v in values):
+                continue
+            yield line_num, {
+                key: (str(value).strip() if value is not None else '')
+                for key, value in zip(header, values)
+            }
+    finally:
+        workbook.close()
+
+
+def iter_rows(file):
+    """根据扩展名选择解析器，file 为上传的 FileStorage"""
+    extension = os.path.splitext(file.filename or '')[1].lower()
+    if extension == '.csv':
+        return iter_csv_rows(file.stream)
+    if extension == '.xlsx':
+        return iter_xlsx_rows(file.stream)
+    raise BulkImportError('仅支持 CSV 或 XLSX 文件')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_number(value, field, allow_zero=True):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field}不是有效数字: {value}')
+    if number < 0 or (number == 0 and not allow_zero):
+        raise ValueError(f'{field}必须大于{"等于" if allow_zero else ""}0')
+    return number
+
+
+# 批量导入基类
+class BulkImporter:
+    """流式批量导入：生成器逐行读取，按批次校验并用 executemany 写入，每批提交一次"""
+
+    # 子类定义：必填列、插入语句
+    required_columns = ()
+    insert_sql = None
+
+    def __init__(self, conn, batch_size=DEFAULT_BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+
+    def validate_batch(self, cursor, batch):
+        """校验一批 (行号, 行字典)，返回 (参数列表, 错误列表)"""
+        raise NotImplementedError
+
+    def run(self, rows):
+        started = time.perf_counter()
+        report = {
+            'total_rows': 0,
+            'imported_rows': 0,
+            'failed_rows': 0,
+            'errors': []
+        }
+        cursor = self.conn.cursor()
+        # 是否有错误因超出 MAX_REPORTED_ERRORS 未写入报告
+        errors_truncated = False
+
+        for batch in batched(rows, self.batch_size):
+            report['total_rows'] += len(batch)
+
+            # 必填列缺失的行直接记为错误，不进入批量校验
+            checked = []
+            errors = []
+            for line_num, row in batch:
+                missing = [column for column in self.required_columns if not row.get(column)]
+                if missing:
+                    errors.append((line_num, f'缺少必填字段: {", ".join(missing)}'))
+                else:
+                    checked.append((line_num, row))
+
+            params, batch_errors = self.validate_batch(cursor, checked) if checked else ([], [])
+            errors.extend(batch_errors)
+
+            report['failed_rows'] += len(errors)
+
+            if params:
+                try:
+                    cursor.executemany(self.insert_sql, params)
+                    self.conn.commit()
+                    report['imported_rows'] += len(params)
+                except Exception as e:
+                    # 整批回滚，该批通过校验的行全部计为失败
+                    self.conn.rollback()
+                    report['failed_rows'] += len(params)
+                    errors.append((batch[0][0], f'第 {batch[0][0]} 行起的批次写入失败: {str(e)}'))
+
+            for line_num, message in errors:
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'line': line_num, 'message': message})
+                else:
+                    errors_truncated = True
+
+        elapsed = time.perf_counter() - started
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['rows_per_second'] = round(report['total_rows'] / elapsed, 1) if elapsed > 0 else None
+        report['errors_truncated'] = errors_truncated
+        return report
+
+
+# 供应商导入
+class SupplierImporter(BulkImporter):
+    required_columns = ('code', 'name', 'supply_type')
+    insert_sql = '''
+    INSERT INTO suppliers (
+        code, name, contact_person, contact_phone, address, supply_type,
+        cooperation_start_date, status, credit_rating, remarks
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def __init__(self, conn, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(conn, batch_size)
+        # 文件内已出现的编码，用于发现文件内重复
+        self.seen_codes = set()
+
+    def validate_batch(self, cursor, batch):
+        codes = list({row['code'] for _, row in batch})
+        placeholders = ','.join('?' * len(codes))
+        cursor.execute(f"SELECT code FROM suppliers WHERE code IN ({placeholders})", codes)
+        existing = {row[0] for row in cursor.fetchall()}
+
+        params = []
+        errors = []
+        today = time.strftime('%Y-%m-%d')
+        for line_num, row in batch:
+            code = row['code']
+            if code in existing:
+                errors.append((line_num, f'供应商编码已存在: {code}'))
+                continue
+            if code in self.seen_codes:
+                errors.append((line_num, f'文件中供应商编码重复: {code}'))
+                continue
+            credit_rating = row.get('credit_rating') or 'B'
+            if credit_rating not in ('A', 'B', 'C', 'D'):
+                errors.append((line_num, f'信用评级无效: {credit_rating}'))
+                continue
+
+            self.seen_codes.add(code)
+            params.append((
+                code, row['name'], row.get('contact_person'), row.get('contact_phone'),
+                row.get('address'), row['supply_type'],
+                row.get('cooperation_start_date') or today,
+                row.get('status') or '活跃', credit_rating,
+                row.get('remarks') or '批量导入'
+            ))
+        return params, errors
+
+
+# 采购单明细导入
+class PurchaseOrderItemImporter(BulkImporter):
+    required_columns = ('order_id', 'item_code', 'item_name', 'quantity', 'unit_price')
+    insert_sql = '''
+    INSERT INTO purchase_order_items (
+        order_id, item_code, item_name, item_type, quantity, unit,
+        unit_price, total_price, remarks
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def validate_batch(self, cursor, batch):
+        # 一次查询本批涉及的采购单及其供应商状态
+        order_ids = list({row['order_id'] for _, row in batch})
+        placeholders = ','.join('?' * len(order_ids))
+        cursor.execute(f'''
+        SELECT po.order_id, po.status, s.code AS supplier_code, s.status AS supplier_status
+        FROM purchase_orders po
+        LEFT JOIN suppliers s ON po.supplier_id = s.code
+        WHERE po.order_id IN ({placeholders})
+        ''', order_ids)
+        orders = {row[0]: row for row in cursor.fetchall()}
+
+        params = []
+        errors = []
+        for line_num, row in batch:
+            order = orders.get(row['order_id'])
+            if not order:
+                errors.append((line_num, f'采购单不存在: {row["order_id"]}'))
+                continue
+            if order[1] not in ('草稿', '待审核', '已提交'):
+                errors.append((line_num, f'采购单状态为"{order[1]}"，不能追加明细'))
+                continue
+            if not order[2]:
+                errors.append((line_num, f'采购单的供应商不存在: {row["order_id"]}'))
+                continue
+            if order[3] != '活跃':
+                errors.append((line_num, f'供应商 {order[2]} 状态为"{order[3]}"'))
+                continue
+
+            try:
+                quantity = parse_number(row['quantity'], '数量', allow_zero=False)
+                unit_price = parse_number(row['unit_price'], '单价')
+                total_price = parse_number(row['total_price'], '金额') if row.get('total_price') else round(quantity * unit_price, 2)
+            except ValueError as e:
+                errors.append((line_num, str(e)))
+                continue
+
+            params.append((
+                row['order_id'], row['item_code'], row['item_name'], row.get('item_type') or '其他',
+                quantity, row.get('unit'), unit_price, total_price, row.get('remarks')
+            ))
+        return params, errors
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+
+# 默认分片大小：5MB（单个分片请求远小于 MAX_CONTENT_LENGTH）
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+# 默认文件大小上限：200MB，与应用的 MAX_CONTENT_LENGTH 一致
+DEFAULT_MAX_SIZE = 200 * 1024 * 1024
+# 读写磁盘时使用的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+# 未完成的上传超过该时长（秒）后会被清理
+STALE_UPLOAD_SECONDS = 24 * 3600
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ChunkedUploadError(Exception):
+    """分片上传过程中的业务错误，status_code 用于直接返回给客户端"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# 分片上传管理类
+class ChunkedUploadManager:
+    """断点续传的分片上传：分片直接流式写入磁盘并校验 SHA-256，全部到齐后原子合并"""
+
+    def __init__(self, temp_dir, target_dir, chunk_size=DEFAULT_CHUNK_SIZE, max_size=DEFAULT_MAX_SIZE):
+        self.temp_dir = temp_dir
+        self.target_dir = target_dir
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+
+    def _upload_dir(self, upload_id):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise ChunkedUploadError('无效的上传ID', 400)
+        return os.path.join(self.temp_dir, upload_id)
+
+    def _load_meta(self, upload_id):
+        meta_path = os.path.join(self._upload_dir(upload_id), 'meta.json')
+        if not os.path.exists(meta_path):
+            raise ChunkedUploadError('上传任务不存在或已过期', 404)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _received_chunks(self, upload_id):
+        upload_dir = self._upload_dir(upload_id)
+        return sorted(
+            int(name[:-5]) for name in os.listdir(upload_dir)
+            if name.endswith('.part') and name[:-5].isdigit()
+        )
+
+    def create(self, filename, total_size, sha256=None):
+        """创建上传任务，返回上传ID和分片信息"""
+        if total_size <= 0:
+            raise ChunkedUploadError('文件大小无效', 400)
+        if total_size > self.max_size:
+            raise ChunkedUploadError(f'文件过大，最大允许 {self.max_size // (1024 * 1024)}MB', 413)
+
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir, exist_ok=True)
+
+        total_chunks = (total_size + self.chunk_size - 1) // self.chunk_size
+        meta = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'total_size': total_size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': total_chunks,
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time()
+        }
+        with open(os.path.join(upload_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        return meta
+
+    def status(self, upload_id):
+        """查询已接收的分片，客户端据此从断点继续上传"""
+        meta = self._load_meta(upload_id)
+        received = self._received_chunks(upload_id)
+        meta['received_chunks'] = received
+        meta['missing_chunks'] = sorted(set(range(meta['total_chunks'])) - set(received))
+        return meta
+
+    def save_chunk(self, upload_id, index, stream, checksum=None):
+        """将请求体流式写入分片文件，同时计算并校验 SHA-256"""
+        meta = self._load_meta(upload_id)
+        if index < 0 or index >= meta['total_chunks']:
+            raise ChunkedUploadError(f'分片序号超出范围: {index}', 400)
+
+        # 除最后一片外，每个分片大小必须等于 chunk_size
+        if index == meta['total_chunks'] - 1:
+            expected_size = meta['total_size'] - index * meta['chunk_size']
+        else:
+            expected_size = meta['chunk_size']
+
+        upload_dir = self._upload_dir(upload_id)
+        part_path = os.path.join(upload_dir, f'{index}.part')
+        tmp_path = f'{part_path}.{uuid.uuid4().hex[:8]}.tmp'
+
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    block = stream.read(COPY_BUFFER_SIZE)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > expected_size:
+                        raise ChunkedUploadError(f'分片 {index} 大小超出预期', 400)
+                    digest.update(block)
+                    f.write(block)
+
+            if written != expected_size:
+                raise ChunkedUploadError(f'分片 {index} 大小不匹配: 期望 {expected_size}, 实际 {written}', 400)
+
+            if checksum and digest.hexdigest() != checksum.lower():
+                raise ChunkedUploadError(f'分片 {index} 校验失败', 422)
+
+            # 校验通过后再原子替换，重复上传同一分片是幂等的
+            os.replace(tmp_path, part_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return {'index': index, 'size': written, 'sha256': digest.hexdigest()}
+
+    def complete(self, upload_id, target_name):
+        """按顺序合并全部分片，校验整体 SHA-256 后原子移动到目标目录"""
+        meta = self._load_meta(upload_id)
+        missing = sorted(set(range(meta['total_chunks'])) - set(self._received_chunks(upload_id)))
+        if missing:
+            raise ChunkedUploadError(f'仍有 {len(missing)} 个分片未上传', 409)
+
+        upload_dir = self._upload_dir(upload_id)
+        # 通过重命名目录抢占合并权，避免并发的 complete 请求重复合并
+        assembling_dir = f'{upload_dir}.assembling'
+        try:
+            os.rename(upload_dir, assembling_dir)
+        except OSError:
+            raise ChunkedUploadError('该上传任务正在合并中', 409)
+        # 重命名不更新目录自身的修改时间，记下合并开始时间，避免 cleanup_stale 清理合并中的目录
+        os.utime(assembling_dir)
+
+        os.makedirs(self.target_dir, exist_ok=True)
+        target_path = os.path.join(self.target_dir, target_name)
+        tmp_target = f'{target_path}.{upload_id[:8]}.tmp'
+
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_target, 'wb') as out:
+                for index in range(meta['total_chunks']):
+                    with open(os.path.join(assembling_dir, f'{index}.part'), 'rb') as part:
+                        while True:
+                            block = part.read(COPY_BUFFER_SIZE)
+                            if not block:
+                                break
+                            digest.update(block)
+                            out.write(block)
+                out.flush()
+                os.fsync(out.fileno())
+
+            if meta['sha256'] and digest.hexdigest() != meta['sha256']:
+                raise ChunkedUploadError('文件整体校验失败，请重新上传', 422)
+
+            os.replace(tmp_target, target_path)
+        except Exception:
+            if os.path.exists(tmp_target):
+                os.remove(tmp_target)
+            # 合并失败时恢复分片目录，允许客户端重试
+            if os.path.exists(assembling_dir) and not os.path.exists(upload_dir):
+                os.rename(assembling_dir, upload_dir)
+            raise
+
+        shutil.rmtree(assembling_dir, ignore_errors=True)
+        return {
+            'path': target_path,
+            'size': meta['total_size'],
+            'sha256': digest.hexdigest()
+        }
+
+    def cleanup_stale(self, max_age=STALE_UPLOAD_SECONDS):
+        """清理超时未完成的上传任务，返回清理数量
+
+        合并中的 .assembling 目录按合并开始时间计算，超时说明合并进程已中断。
+        """
+        if not os.path.exists(self.temp_dir):
+            return 0
+
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.temp_dir):
+            path = os.path.join(self.temp_dir, name)
+            if os.path.isdir(path) and now - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
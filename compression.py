@@ -0,0 +1,191 @@
+# 响应压缩 WSGI 中间件：按 Accept-Encoding 协商 brotli/gzip，只压缩文本类响应。
+# 已知长度的响应低于阈值时原样返回；长度未知的流式响应（生成器）边生成边压缩，每块刷新一次，客户端可以逐步收到数据。
+#
+# 压缩级别可通过环境变量调整：COMPRESS_LEVEL（gzip，1-9）、COMPRESS_BROTLI_QUALITY（0-11）、COMPRESS_MIN_SIZE（字节）
+import os
+import zlib
+import logging
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # 未安装时只使用 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 动态响应每次都要现压，级别取速度与压缩率的折中；静态资源在构建时已用最高级别预压缩
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 4
+# 小于该字节数的响应压缩收益抵不上 CPU 开销
+DEFAULT_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+# 不压缩的状态码：无响应体、协商缓存命中、分段下载
+SKIP_STATUSES = {'204', '206', '304'}
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class _GzipEncoder:
+    encoding = 'gzip'
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    encoding = 'br'
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """包装 app.wsgi_app；已经带 Content-Encoding 的响应（如预压缩的静态资源）不会重复压缩"""
+
+    def __init__(self, app, gzip_level=None, brotli_quality=None, min_size=None, mimetypes=COMPRESSIBLE_TYPES):
+        self.app = app
+        self.gzip_level = gzip_level if gzip_level is not None else _env_int('COMPRESS_LEVEL', DEFAULT_GZIP_LEVEL)
+        self.brotli_quality = (brotli_quality if brotli_quality is not None
+                               else _env_int('COMPRESS_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY))
+        self.min_size = min_size if min_size is not None else _env_int('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        self.mimetypes = set(mimetypes)
+
+    def negotiate(self, environ):
+        """按客户端 q 值选择编码，q 值相同时优先 brotli；都不接受时返回 None"""
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        candidates = [('br', 2), ('gzip', 1)] if brotli is not None else [('gzip', 1)]
+        best = max(candidates, key=lambda c: (accepted[c[0]], c[1]))
+        return best[0] if accepted[best[0]] > 0 else None
+
+    def _encoder(self, encoding):
+        if encoding == 'br':
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    def _should_compress(self, status, headers):
+        if status[:3] in SKIP_STATUSES:
+            return False
+        content_type = ''
+        for name, value in headers:
+            lower = name.lower()
+            if lower in ('content-encoding', 'content-range'):
+                return False
+            if lower == 'cache-control' and 'no-transform' in value.lower():
+                return False
+            if lower == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+            elif lower == 'content-length' and int(value or 0) < self.min_size:
+                return False
+        return content_type in self.mimetypes
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+        encoding = self.negotiate(environ)
+        state = {}
+
+        def _start_response(status, headers, exc_info=None):
+            # 应用返回之后才调用 start_response 的（纯生成器应用）来不及换成压缩后的响应体，原样发送
+            if 'returned' in state or not self._should_compress(status, headers):
+                return start_response(status, headers, exc_info)
+            headers = _add_vary(headers)
+            if encoding is None:
+                return start_response(status, headers, exc_info)
+
+            encoder = self._encoder(encoding)
+            # 有 Content-Length 的是完整响应，整体压缩；否则是流式响应，每块之后刷新
+            state['streaming'] = not any(name.lower() == 'content-length' for name, _ in headers)
+            state['encoder'] = encoder
+            new_headers = []
+            for name, value in headers:
+                lower = name.lower()
+                if lower == 'content-length':
+                    continue
+                # 压缩后字节不同，强 ETag 改为弱 ETag
+                if lower == 'etag' and not value.startswith('W/'):
+                    value = 'W/' + value
+                new_headers.append((name, value))
+            new_headers.append(('Content-Encoding', encoder.encoding))
+            write = start_response(status, new_headers, exc_info)
+
+            def compressed_write(data):
+                chunk = encoder.compress(data) + encoder.flush()
+                if chunk:
+                    write(chunk)
+            return compressed_write
+
+        app_iter = self.app(environ, _start_response)
+        state['returned'] = True
+        if 'encoder' not in state:
+            return app_iter
+        return _CompressedIterable(app_iter, state['encoder'], state['streaming'])
+
+
+class _CompressedIterable:
+    """压缩后的响应体；close 转发给原响应，服务器中途断开时也能释放数据库游标等资源"""
+
+    def __init__(self, app_iter, encoder, streaming):
+        self.app_iter = app_iter
+        self.encoder = encoder
+        self.streaming = streaming
+
+    def __iter__(self):
+        encoder = self.encoder
+        for data in self.app_iter:
+            chunk = encoder.compress(data)
+            if self.streaming and data:
+                chunk += encoder.flush()
+            if chunk:
+                yield chunk
+        yield encoder.finish()
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+def _add_vary(headers):
+    """可压缩的响应都要带 Vary: Accept-Encoding，缓存才不会把压缩版本发给不支持的客户端"""
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            values = {v.strip().lower() for v in value.split(',')}
+            if 'accept-encoding' in values or '*' in values:
+                return headers
+            headers = list(headers)
+            headers[index] = (name, f'{value}, Accept-Encoding')
+            return headers
+    return list(headers) + [('Vary', 'Accept-Encoding')]
+
+
+def init_app(app, **options):
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, **options)
+    logger.debug("响应压缩已启用：gzip=%s，brotli=%s", app.wsgi_app.gzip_level,
+                 app.wsgi_app.brotli_quality if brotli is not None else '未安装')
+    return app.wsgi_app
@@ -0,0 +1,151 @@
+# SQLite 在线备份：用备份接口分步复制页面，每步之间让出数据库，收银和定时任务的写入不会被长时间阻塞。
+# 备份先写到临时文件，在副本上做 PRAGMA integrity_check（不占用线上库），校验通过后 gzip 压缩并轮转。
+#
+# 手动备份：python -m db_backup data/sales.db
+# 恢复（需先停止服务）：gunzip -c data/backups/sales-20240101-030000.db.gz > data/sales.db
+import os
+import sys
+import glob
+import gzip
+import time
+import shutil
+import sqlite3
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.path.join('data', 'backups')
+# 每步复制的页数（默认页大小 4KB，即每步约 1MB），步与步之间暂停 STEP_PAUSE 秒让写入进来
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+# 分步备份期间源库被其他连接修改时 SQLite 会从头重新复制；超过次数后改为一次复制完
+MAX_RESTARTS = 3
+# 每个数据库保留的备份份数
+KEEP_BACKUPS = 7
+COMPRESS_LEVEL = 6
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    pass
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _snapshot(source_path, target_path, pages, pause):
+    """把源库复制到 target_path，返回 (页数, 重新开始的次数)"""
+    restarts = 0
+    source = sqlite3.connect(source_path)
+    try:
+        while True:
+            target = sqlite3.connect(target_path)
+            state = {'remaining': None, 'total': 0}
+
+            def progress(status, remaining, total):
+                # remaining 变大说明源库在两步之间被修改，备份已从头开始
+                if state['remaining'] is not None and remaining > state['remaining']:
+                    raise _BackupRestarted()
+                state['remaining'], state['total'] = remaining, total
+                if pause:
+                    time.sleep(pause)
+
+            step_pages = pages if restarts < MAX_RESTARTS else -1
+            try:
+                source.backup(target, pages=step_pages, progress=progress)
+                return state['total'] or target.execute('PRAGMA page_count').fetchone()[0], restarts
+            except _BackupRestarted:
+                restarts += 1
+                logger.info("%s 备份期间有写入，重新开始（第 %s 次）", source_path, restarts)
+            finally:
+                target.close()
+    finally:
+        source.close()
+
+
+def check_integrity(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return result == ['ok'], result
+
+
+def compress(source_path, target_path, level=COMPRESS_LEVEL):
+    with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=level) as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+    return os.path.getsize(target_path)
+
+
+def rotate(name, backup_dir=BACKUP_DIR, keep=KEEP_BACKUPS):
+    """只保留最近 keep 份备份，返回删除的文件"""
+    backups = sorted(glob.glob(os.path.join(backup_dir, f'{name}-*.db.gz')))
+    removed = backups[:-keep] if keep > 0 else backups
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def backup_database(db_path, name=None, backup_dir=BACKUP_DIR, pages=PAGES_PER_STEP, pause=STEP_PAUSE,
+                    keep=KEEP_BACKUPS, compress_level=COMPRESS_LEVEL):
+    """备份一个数据库并返回报告：大小、耗时、吞吐量、压缩后大小等"""
+    name = name or os.path.splitext(os.path.basename(db_path))[0]
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    snapshot_path = os.path.join(backup_dir, f'{name}-{stamp}.db.partial')
+    archive_path = os.path.join(backup_dir, f'{name}-{stamp}.db.gz')
+
+    started = time.perf_counter()
+    try:
+        page_count, restarts = _snapshot(db_path, snapshot_path, pages, pause)
+        copied = time.perf_counter()
+        size = os.path.getsize(snapshot_path)
+
+        ok, result = check_integrity(snapshot_path)
+        if not ok:
+            raise BackupError(f'{name} 备份校验失败: {result[:5]}')
+        verified = time.perf_counter()
+
+        try:
+            compressed_size = compress(snapshot_path, archive_path, compress_level)
+        except Exception:
+            # 不留下写了一半的压缩包，避免轮转时把它当成有效备份
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            raise
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+    finished = time.perf_counter()
+    removed = rotate(name, backup_dir, keep)
+
+    copy_seconds = copied - started
+    report = {
+        'database': name,
+        'path': archive_path,
+        'pages': page_count,
+        'size_bytes': size,
+        'compressed_bytes': compressed_size,
+        'restarts': restarts,
+        'copy_seconds': round(copy_seconds, 3),
+        'verify_seconds': round(verified - copied, 3),
+        'compress_seconds': round(finished - verified, 3),
+        'duration_seconds': round(finished - started, 3),
+        'throughput_mb_s': round(size / 1024 / 1024 / copy_seconds, 2) if copy_seconds > 0 else None,
+        'rotated': len(removed),
+    }
+    logger.info("%s 备份完成：%.1f MB -> %.1f MB，复制 %.2f 秒（%s MB/s），校验 %.2f 秒，压缩 %.2f 秒",
+                name, size / 1024 / 1024, compressed_size / 1024 / 1024, report['copy_seconds'],
+                report['throughput_mb_s'], report['verify_seconds'], report['compress_seconds'],
+                extra={'backup': report})
+    return report
+
+
+if __name__ == '__main__':
+    import log_config
+    log_config.configure_logging()
+    for path in sys.argv[1:] or [os.path.join('data', 'restaurant.db'), os.path.join('data', 'sales.db')]:
+        backup_database(path)
@@ -0,0 +1,161 @@
+# 模板片段缓存：{% cache 'menu_table', cache_version, current_category %} ... {% endcache %}
+# 缓存键包含数据版本号，数据变化后版本号递增，旧片段不再命中，随后被 LRU 淘汰。
+#
+# 版本号存在各数据库的 data_versions 表，由触发器在相关表写入时递增，所有写入路径和所有工作进程都能看到；
+# 视图每次只查一次版本号，命中时既跳过统计 SQL（cache.get_or_set 缓存查询结果）也跳过模板渲染。
+# 注意：rebuild_table 重建表时 SQLite 会一并删除表上的触发器，重建后需要重新安装。
+import sys
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+# 每个进程的缓存上限：条目数和估算的字节数，先到先淘汰
+MAX_ENTRIES = 512
+MAX_BYTES = 32 * 1024 * 1024
+# 单个条目超过总容量的 1/8 时不缓存，避免一个大页面把其他条目全部挤掉
+MAX_ENTRY_FRACTION = 8
+VERSION_TABLE = 'data_versions'
+
+
+def _estimate_size(value):
+    """粗略估算缓存值占用的字节数：字符串按长度，容器递归累加"""
+    if isinstance(value, str):
+        return len(value) * 2 + 50
+    if isinstance(value, dict):
+        return sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items()) + 100
+    if isinstance(value, (list, tuple, set)) or hasattr(value, 'keys'):
+        return sum(_estimate_size(v) for v in value) + 60
+    return sys.getsizeof(value)
+
+
+def _freeze(value):
+    """把模板传入的键转成可哈希的值"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class FragmentCache:
+    """进程内 LRU 缓存，线程安全"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=None):
+        size = _estimate_size(value) if size is None else size
+        if size > self.max_bytes // MAX_ENTRY_FRACTION:
+            return False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+        return True
+
+    def get_or_set(self, key, compute):
+        """命中时直接返回；未命中时调用 compute() 计算并缓存（并发未命中时可能重复计算，结果相同）"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 名称, 键... %}...{% endcache %}：按模板名 + 名称 + 键缓存渲染结果"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=cache)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render_cached', [nodes.Const(parser.name), nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, template_name, args, caller):
+        key = ('fragment', template_name, _freeze(args))
+        return self.environment.fragment_cache.get_or_set(key, caller)
+
+
+def install_version_triggers(conn, name, tables, columns=None):
+    """为 tables 安装触发器：任一表增删改时 data_versions 中 name 的版本号加一（迁移中调用）
+
+    给出 columns 时只有这些列被更新才算修改（例如菜品销量变化不影响菜单快照）。
+    """
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute(f'INSERT OR IGNORE INTO {VERSION_TABLE} (name, version) VALUES (?, 0)', (name,))
+    for table in tables:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            target = f'UPDATE OF {", ".join(columns)}' if event == 'UPDATE' and columns else event
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_{name}_version
+                AFTER {target} ON {table}
+                BEGIN
+                    UPDATE {VERSION_TABLE} SET version = version + 1 WHERE name = '{name}';
+                END
+            ''')
+
+
+def data_version(conn, *names):
+    """读取一个或多个数据版本号，返回元组，可直接作为缓存键的一部分"""
+    placeholders = ','.join('?' * len(names))
+    versions = dict(conn.execute(f'SELECT name, version FROM {VERSION_TABLE} WHERE name IN ({placeholders})',
+                                 names).fetchall())
+    return tuple(versions.get(name, 0) for name in names)
+
+
+def init_app(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    return cache
@@ -0,0 +1,69 @@
+# 生产环境多进程部署配置，每个子系统单独启动一组工作进程，例如：
+#   BIND=0.0.0.0:5002 gunicorn -c gunicorn.conf.py 'app_sales:create_app()'
+#   BIND=0.0.0.0:5001 gunicorn -c gunicorn.conf.py 'app_inventory:create_app()'
+# 平滑重启（等待处理中的请求完成后再退出旧进程）：kill -HUP <master pid>
+import os
+import sys
+import multiprocessing
+
+import metrics
+from scheduler_leader import SchedulerLeader
+
+bind = os.environ.get('BIND', '127.0.0.1:5000')
+# 工作进程数与每个进程的线程数；SQLite 写入串行，线程数不宜过大
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+# 主进程预先创建应用（create_app 中的迁移只执行一次），工作进程 fork 后共享只读内存
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+# 平滑重启/停止时等待处理中的请求完成的最长时间
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+# 定期替换工作进程，避免长时间运行后内存持续增长
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 5000))
+max_requests_jitter = 500
+
+# 访问日志交给应用日志（log_config）统一输出
+accesslog = None
+errorlog = '-'
+
+# 各工作进程的指标汇总目录，按子系统分开；/metrics 落到任意工作进程都返回所有进程合并后的数据
+METRICS_DIR = os.environ.get('METRICS_MULTIPROC_DIR', os.path.join('data', 'metrics'))
+
+
+def _app_module(server):
+    module_name = server.app.app_uri.split(':', 1)[0]
+    return sys.modules.get(module_name)
+
+
+def on_starting(server):
+    # 主进程启动时清空上次运行留下的指标文件，之后 fork 的工作进程沿用该设置
+    module_name = server.app.app_uri.split(':', 1)[0]
+    metrics.REGISTRY.enable_multiprocess(os.path.join(METRICS_DIR, module_name), clear=True)
+
+
+def post_fork(server, worker):
+    """每个工作进程参与定时任务主节点选举，只有当选的进程运行定时任务"""
+    metrics.REGISTRY.start_flusher()
+    module = _app_module(server)
+    start_scheduler = getattr(module, 'start_scheduler', None)
+    if start_scheduler is None:
+        return
+    name = module.__name__
+    worker.scheduler_leader = SchedulerLeader(name, start_scheduler).start()
+
+
+def worker_exit(server, worker):
+    # 主节点退出时立即释放锁，由其他工作进程接管定时任务
+    leader = getattr(worker, 'scheduler_leader', None)
+    if leader is not None:
+        leader.stop()
+    metrics.REGISTRY.stop_flusher()
+
+
+def child_exit(server, worker):
+    # 在主进程中把退出的工作进程的计数合并进归档文件，计数不会因进程替换而回落
+    metrics.REGISTRY.retire_process(worker.pid)
@@ -0,0 +1,192 @@
+# JSON 序列化：安装了 orjson 时 jsonify 使用 orjson（比标准库快数倍），未安装或遇到 orjson 不支持的值时回退到标准库。
+# 输出与 Flask 默认行为保持一致：键排序、日期为 HTTP 日期格式、Decimal 转字符串；中文直接输出 UTF-8 而不是 \uXXXX。
+#
+# 接口查询可用 dict_factory 直接得到普通 dict，不必再 [dict(row) for row in rows]；
+# 大列表（超过 STREAM_MIN_ITEMS 项）分批编码、以生成器响应逐块发送，不在内存里拼出完整的响应体。
+#
+# 大表查询用 stream_rows / stream_items：游标按 fetchmany 分批读取、分批编码，读完后先关闭连接再发送响应。
+# restaurant.db 使用默认的回滚日志模式，游标未读完时连接持有共享锁，边读边发会让其他连接的写入
+# 一直等到客户端下载完，超过 busy timeout 后失败。
+# 请求带 ?format=ndjson 或 Accept: application/x-ndjson 时每行输出一个 JSON 对象，便于命令行工具逐行处理。
+import sqlite3
+import decimal
+import logging
+from datetime import date
+
+from flask import current_app, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # 未安装时使用标准库
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# 顶层列表达到该长度时改为流式响应
+STREAM_MIN_ITEMS = 2000
+# 流式编码时每块包含的元素数，同时也是 fetchmany 每次读取的行数
+STREAM_BATCH_SIZE = 500
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def dict_factory(cursor, row):
+    """sqlite3 行工厂：返回普通 dict，可直接交给 jsonify"""
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def dict_cursor(conn):
+    """返回行为普通 dict 的游标，不影响连接上其他查询的 row_factory"""
+    cursor = conn.cursor()
+    cursor.row_factory = dict_factory
+    return cursor
+
+
+def _default(o):
+    """orjson 不认识的类型，按 Flask 默认编码器的规则转换"""
+    if isinstance(o, sqlite3.Row):
+        return dict(o)
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    ensure_ascii = False
+
+    def default(self, o):
+        # 标准库回退路径同样支持 sqlite3.Row
+        if isinstance(o, sqlite3.Row):
+            return dict(o)
+        return super().default(o)
+
+    def _options(self, indent=False):
+        # 日期交给 _default 转成 HTTP 日期，与标准库路径输出一致
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=_default, option=self._options(indent))
+            except TypeError as e:
+                # 超出 64 位的整数、非字符串且非数字的键等，交给标准库处理
+                logger.debug("orjson 无法编码，回退到标准库: %s", e)
+        if indent:
+            return super().dumps(obj, indent=2).encode('utf-8')
+        return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def iter_array(self, items, batch_size=STREAM_BATCH_SIZE):
+        """把可迭代对象编码为 JSON 数组，按批生成字节块"""
+        yield b'['
+        batch = []
+        first = True
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                # 整批编码后去掉外层方括号，比逐个元素编码少很多次调用
+                yield (b'' if first else b',') + self.dumps_bytes(batch)[1:-1]
+                batch = []
+                first = False
+        if batch:
+            yield (b'' if first else b',') + self.dumps_bytes(batch)[1:-1]
+        yield b']\n'
+
+    def iter_ndjson(self, items, batch_size=STREAM_BATCH_SIZE):
+        """每个元素编码为一行 JSON，按批生成字节块"""
+        batch = []
+        for item in items:
+            batch.append(self.dumps_bytes(item))
+            if len(batch) >= batch_size:
+                yield b'\n'.join(batch) + b'\n'
+                batch = []
+        if batch:
+            yield b'\n'.join(batch) + b'\n'
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        if isinstance(obj, list) and len(obj) >= STREAM_MIN_ITEMS and not indent:
+            return self._app.response_class(self.iter_array(obj), mimetype=self.mimetype)
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+def iter_cursor(cursor, size=STREAM_BATCH_SIZE):
+    """按 fetchmany 分批读取游标，逐行产出"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield from rows
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_response(chunks, conn=None, mimetype='application/json'):
+    """把字节块生成器包装成流式响应；传入 conn 时先在连接上读完全部数据、关闭连接后再发送
+
+    响应头发出后出错已无法改状态码，只记录日志并截断输出，客户端会得到不完整的 JSON。
+    """
+    if conn is not None:
+        try:
+            chunks = list(chunks)
+        except Exception as e:
+            logger.exception("读取查询结果出错: %s", e)
+            return jsonify({'error': str(e)}), 500
+        finally:
+            conn.close()
+
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            logger.exception("流式输出中断: %s", e)
+    return current_app.response_class(generate(), mimetype=mimetype)
+
+
+def stream_items(items, conn=None, batch_size=STREAM_BATCH_SIZE):
+    """把逐个产出的对象流式输出为 JSON 数组（或 NDJSON）
+
+    conn 由本函数在数据读完后关闭，视图里不要再关闭。
+    """
+    provider = current_app.json
+    if wants_ndjson():
+        return stream_response(provider.iter_ndjson(items, batch_size), conn, NDJSON_MIMETYPE)
+    return stream_response(provider.iter_array(items, batch_size), conn)
+
+
+def stream_rows(cursor, conn=None, transform=None, batch_size=STREAM_BATCH_SIZE):
+    """把已执行查询的游标流式输出，transform 把每行转成要输出的对象"""
+    rows = iter_cursor(cursor, batch_size)
+    items = map(transform, rows) if transform is not None else rows
+    return stream_items(items, conn, batch_size)
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    return app.json
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# 环境变量：
+#   LOG_LEVEL   根日志级别，默认 INFO
+#   LOG_LEVELS  按模块设置级别，如 "app_inventory=DEBUG,sql_profiler.slow=WARNING"
+#   LOG_FORMAT  json（默认）或 text
+#   LOG_FILE    额外写入的日志文件（按 10MB 轮转）
+DEFAULT_LEVEL = 'INFO'
+
+_listener = None
+
+# LogRecord 自带的属性，其余属性（logger.info(..., extra={...}) 传入）作为结构化字段输出
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        payload = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_text:
+            payload['exc_info'] = record.exc_text
+        elif record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _PreparedQueueHandler(QueueHandler):
+    """在调用线程里只做消息拼接和异常文本化，JSON 序列化和写出都交给后台线程"""
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_module_levels(spec):
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, module_levels=None, fmt=None, log_file=None):
+    """配置根日志：业务线程只把记录放入队列，由 QueueListener 线程统一格式化输出；重复调用无副作用"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.environ.get('LOG_LEVEL') or DEFAULT_LEVEL).upper()
+    levels = parse_module_levels(os.environ.get('LOG_LEVELS'))
+    levels.update(module_levels or {})
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+    log_file = log_file or os.environ.get('LOG_FILE')
+
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        handlers.append(RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _PreparedQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        # 预加载后 fork 出的工作进程不会继承监听线程，需要在子进程中重新启动
+        os.register_at_fork(after_in_child=lambda: _restart_listener(queue_handler, handlers))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    return _listener
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener(queue_handler, handlers):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
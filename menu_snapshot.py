@@ -0,0 +1,75 @@
+# 菜单快照：在售菜品按 item_code 缓存在进程内，下单页面、下单校验和读取价格不必每次查询 menu_items。
+# 快照同时包含分类列表和固定的桌号列表。
+#
+# 快照带版本号：data_versions 中的 menu_catalog 由触发器在菜品增删、或名称/分类/价格/状态等列变化时递增，
+# 销量（sales_count）变化不算，所以下单不会让快照失效。每次使用前只查一次版本号，
+# 与缓存的版本不同（其他进程改了菜单也一样）时重新加载；本进程新增、编辑、删除菜品提交后调用 refresh 立即重建。
+import threading
+
+import fragment_cache
+import json_provider
+
+VERSION_NAME = 'menu_catalog'
+AVAILABLE_STATUSES = ('上架', '在售')
+# 快照包含的列，也是触发版本号递增的列
+CATALOG_COLUMNS = ['item_name', 'category', 'is_heritage', 'price', 'cost', 'description', 'image_path', 'status']
+# 桌号：前缀 + 01-99
+TABLE_PREFIXES = ['天', '地', '玄', '黄']
+TABLE_NUMBERS = tuple(f'{prefix}{num:02d}' for prefix in TABLE_PREFIXES for num in range(1, 100))
+
+
+def install_triggers(conn):
+    """安装菜单快照的版本号触发器（迁移中调用）"""
+    fragment_cache.install_version_triggers(conn, VERSION_NAME, ['menu_items'], columns=CATALOG_COLUMNS)
+
+
+class MenuSnapshot:
+    """某一版本的在售菜品，只读，多个线程共用"""
+
+    table_numbers = TABLE_NUMBERS
+
+    def __init__(self, version, items, categories):
+        self.version = version
+        # item_code -> 菜品 dict，按分类、名称排序
+        self.items = items
+        self.menu_items = list(items.values())
+        # 所有菜品（含下架）的分类，供分类筛选
+        self.categories = categories
+
+    @classmethod
+    def load(cls, conn, version):
+        cursor = json_provider.dict_cursor(conn)
+        cursor.execute(f'''
+            SELECT item_code, {', '.join(CATALOG_COLUMNS)} FROM menu_items
+            WHERE status IN ({', '.join('?' * len(AVAILABLE_STATUSES))})
+            ORDER BY category, item_name
+        ''', AVAILABLE_STATUSES)
+        items = {item['item_code']: item for item in cursor.fetchall()}
+        categories = [row[0] for row in conn.execute('SELECT DISTINCT category FROM menu_items ORDER BY category')]
+        return cls(version, items, categories)
+
+
+class MenuSnapshotCache:
+    """进程内只保留最新版本的快照"""
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self, conn):
+        version = fragment_cache.data_version(conn, VERSION_NAME)[0]
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            # 并发请求同时发现过期时只加载一次
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = MenuSnapshot.load(conn, version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def refresh(self, conn):
+        """菜单写入提交后调用：丢弃旧快照并立即按新版本重建"""
+        self._snapshot = None
+        return self.get(conn)
@@ -0,0 +1,426 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+from flask import Response, g, request
+
+import sql_profiler
+
+# 请求耗时的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 导出文件大小分桶（字节）：10KB ~ 100MB
+SIZE_BUCKETS = (10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 20 * 1024 ** 2, 100 * 1024 ** 2)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 多进程部署时工作进程把指标写到共享目录的间隔（秒）
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# 已退出进程的计数合并到该文件，目录里不会随工作进程替换不断增加文件
+ARCHIVE_FILE = 'archive.json'
+ARCHIVE_KEEP_FILES = 100
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """指标注册表；collect_hooks 在每次抓取前执行，用于按需计算积压数量等 Gauge
+
+    默认只包含当前进程的数据。gunicorn 多进程部署时调用 enable_multiprocess(directory)：
+    各工作进程每 FLUSH_INTERVAL 秒把自己的数据写到 directory/<pid>-<随机串>.json，
+    抓取时合并目录下所有进程的数据，请求落到任意一个工作进程都返回完整的指标。
+    Counter 和 Histogram 跨进程求和；Gauge 取当前进程的值，当前进程没有时取最近写入的进程的值。
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collect_hooks = []
+        self.multiprocess_dir = None
+        self._flusher = None
+        self._file_pid = None
+        self._file_name = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collect_hook(self, hook):
+        self.collect_hooks.append(hook)
+        return hook
+
+    def render(self):
+        for hook in self.collect_hooks:
+            try:
+                hook()
+            except Exception as e:
+                COLLECT_ERRORS.labels(getattr(hook, '__name__', 'hook')).inc()
+                logger.exception("采集指标失败: %s", e)
+        lines = []
+        if self.multiprocess_dir is None:
+            for metric in self.metrics.values():
+                lines.extend(metric.render(metric.samples()))
+        else:
+            merged = self.merge(self.read_processes())
+            for name, metric in self.metrics.items():
+                lines.extend(metric.render(merged.get(name, {}).items()))
+        return '\n'.join(lines) + '\n'
+
+    def samples(self):
+        """当前进程的全部指标数据，可序列化为 JSON：{指标名: [[标签值, 数据], ...]}"""
+        return {name: [[list(values), state] for values, state in metric.samples()]
+                for name, metric in self.metrics.items()}
+
+    def merge(self, sources):
+        """按指标类型合并多份 samples()，sources 按写入时间从旧到新排列"""
+        states = {}
+        for source in sources:
+            for name, samples in source.items():
+                for values, state in samples:
+                    states.setdefault(name, {}).setdefault(tuple(values), []).append(state)
+        return {
+            name: {values: self.metrics[name].merge(values_states) for values, values_states in by_values.items()}
+            for name, by_values in states.items() if name in self.metrics
+        }
+
+    def enable_multiprocess(self, directory, clear=False):
+        """启用多进程汇总；clear=True 时清空上次运行留下的数据，只应在 fork 工作进程之前调用"""
+        if clear and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(directory, name))
+        os.makedirs(directory, exist_ok=True)
+        self.multiprocess_dir = directory
+
+    def _process_file(self):
+        # 文件名带随机串：进程号被新的工作进程复用时不会与已归档的文件混淆
+        pid = os.getpid()
+        if self._file_pid != pid:
+            self._file_pid = pid
+            self._file_name = f'{pid}-{uuid.uuid4().hex[:8]}.json'
+        return self._file_name
+
+    def _write_json(self, path, data):
+        tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning("指标文件 %s 无法解析: %s", path, e)
+            return None
+
+    def flush(self):
+        """把当前进程的数据写到共享目录"""
+        if self.multiprocess_dir is not None:
+            self._write_json(os.path.join(self.multiprocess_dir, self._process_file()), self.samples())
+
+    def read_processes(self):
+        """读取所有进程的数据，从旧到新排列，当前进程的数据排在最后"""
+        own_file = self._process_file()
+        processes = []
+        for name in os.listdir(self.multiprocess_dir):
+            if name == ARCHIVE_FILE or name == own_file or not name.endswith('.json'):
+                continue
+            path = os.path.join(self.multiprocess_dir, name)
+            data = self._read_json(path)
+            if data is not None:
+                processes.append((os.path.getmtime(path), name, data))
+        # 归档文件最后读取：读取期间被归档的进程以归档中的数据为准，不会重复计数
+        archive = self._read_json(os.path.join(self.multiprocess_dir, ARCHIVE_FILE)) or {'files': [], 'samples': {}}
+        archived = set(archive['files'])
+        processes.sort(key=lambda item: item[0])
+        return [archive['samples']] + [data for _, name, data in processes if name not in archived] + [self.samples()]
+
+    def retire_process(self, pid):
+        """工作进程退出后由 gunicorn 主进程调用，把它的数据合并进归档文件并删除进程文件"""
+        if self.multiprocess_dir is None:
+            return
+        archive_path = os.path.join(self.multiprocess_dir, ARCHIVE_FILE)
+        for name in os.listdir(self.multiprocess_dir):
+            if not name.startswith(f'{pid}-') or not name.endswith('.json'):
+                continue
+            path = os.path.join(self.multiprocess_dir, name)
+            data = self._read_json(path)
+            if data is not None:
+                archive = self._read_json(archive_path) or {'files': [], 'samples': {}}
+                merged = self.merge([archive['samples'], data])
+                self._write_json(archive_path, {
+                    # 文件名只用于读取时去重，保留最近的一部分即可
+                    'files': (archive['files'] + [name])[-ARCHIVE_KEEP_FILES:],
+                    'samples': {metric: [[list(values), state] for values, state in by_values.items()]
+                                for metric, by_values in merged.items()}
+                })
+            os.remove(path)
+
+    def start_flusher(self, interval=FLUSH_INTERVAL):
+        """在工作进程中启动后台线程定期 flush；fork 之后调用"""
+        if self.multiprocess_dir is None or self._flusher is not None:
+            return
+        stopped = threading.Event()
+
+        def run():
+            while not stopped.wait(interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.exception("写入指标文件失败: %s", e)
+
+        self._flusher = stopped
+        threading.Thread(target=run, name='metrics-flusher', daemon=True).start()
+
+    def stop_flusher(self):
+        """停止后台线程并最后写一次，工作进程退出时调用"""
+        if self._flusher is not None:
+            self._flusher.set()
+            self._flusher = None
+        self.flush()
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """各标签组合的当前数据：[(标签值, 数据), ...]"""
+        return [(values, self._state(child)) for values, child in list(self._children.items())]
+
+    def _state(self, child):
+        return child.value
+
+    def merge(self, states):
+        """合并多个进程同一标签组合的数据，states 按写入时间从旧到新排列"""
+        return sum(states)
+
+    def render(self, samples):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        for values, state in samples:
+            lines.extend(self._render_sample(values, state))
+        return lines
+
+    def _render_sample(self, values, state):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(state)}']
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock):
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def merge(self, states):
+        return states[-1]
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets, lock):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets, self._lock)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _state(self, child):
+        with self._lock:
+            return {'counts': list(child.counts), 'sum': child.sum, 'count': child.count}
+
+    def merge(self, states):
+        return {
+            'counts': [sum(counts) for counts in zip(*(state['counts'] for state in states))],
+            'sum': sum(state['sum'] for state in states),
+            'count': sum(state['count'] for state in states)
+        }
+
+    def _render_sample(self, values, state):
+        counts, total, count = state['counts'], state['sum'], state['count']
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+# 各子系统共用的指标，app 标签区分子系统
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', '请求处理耗时', ('app', 'endpoint', 'method'))
+REQUESTS = Counter('http_requests_total', '请求次数', ('app', 'endpoint', 'method', 'status'))
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', '单个请求内的 SQL 总耗时', ('app', 'endpoint'))
+DB_QUERIES = Counter('db_queries_total', '请求内执行的 SQL 语句数', ('app', 'endpoint'))
+JOB_DURATION = Histogram('scheduler_job_duration_seconds', '定时任务执行耗时', ('job',),
+                         buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+JOB_RUNS = Counter('scheduler_job_runs_total', '定时任务执行次数', ('job', 'result'))
+EXPORT_SIZE = Histogram('export_size_bytes', '导出文件大小', ('export',), buckets=SIZE_BUCKETS)
+# 业务指标：积压类 Gauge 由各子系统注册抓取钩子计算
+ORDERS_CREATED = Counter('orders_created_total', '新建销售订单数', ('order_type',))
+RECEIPTS_GENERATED = Counter('receipts_generated_total', '生成小票数', ('source',))
+UNRECEIPTED_ORDERS = Gauge('orders_without_receipt', '已完成但未生成小票的订单数')
+SYNC_PENDING = Gauge('sync_outbox_pending', '待同步到销售系统的记录数', ('sync_type',))
+SYNC_ATTEMPTS = Counter('sync_attempts_total', '同步到销售系统的尝试次数', ('sync_type', 'status'))
+COLLECT_ERRORS = Counter('metrics_collect_errors_total', '抓取时计算指标失败的次数', ('hook',))
+# 数据库备份：耗时由 track_job 记录，这里记录大小、吞吐量和最近一次成功时间
+BACKUP_SIZE = Gauge('db_backup_size_bytes', '最近一次备份的大小', ('database', 'stage'))
+BACKUP_THROUGHPUT = Gauge('db_backup_throughput_bytes_per_second', '最近一次备份复制页面的速度', ('database',))
+BACKUP_LAST_SUCCESS = Gauge('db_backup_last_success_timestamp_seconds', '最近一次备份成功的时间', ('database',))
+
+
+def track_job(job_name):
+    """定时任务装饰器：记录耗时和成功/失败次数"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = 'success'
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                result = 'failure'
+                raise
+            finally:
+                JOB_DURATION.labels(job_name).observe(time.perf_counter() - started)
+                JOB_RUNS.labels(job_name, result).inc()
+        return wrapper
+    return decorator
+
+
+def observe_export(export_name, size):
+    EXPORT_SIZE.labels(export_name).observe(size)
+
+
+def observe_backup(report):
+    database = report['database']
+    BACKUP_SIZE.labels(database, 'raw').set(report['size_bytes'])
+    BACKUP_SIZE.labels(database, 'compressed').set(report['compressed_bytes'])
+    if report['copy_seconds']:
+        BACKUP_THROUGHPUT.labels(database).set(report['size_bytes'] / report['copy_seconds'])
+    BACKUP_LAST_SUCCESS.labels(database).set(time.time())
+
+
+def init_app(app, app_name, registry=REGISTRY):
+    """为子系统记录请求耗时与 SQL 耗时，并注册 /metrics"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        # 未匹配路由统一记为 unmatched，避免任意路径撑大标签数量
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.labels(app_name, endpoint, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(app_name, endpoint, request.method, str(response.status_code)).inc()
+        stats = sql_profiler.current_stats()
+        if stats is not None:
+            DB_QUERIES.labels(app_name, endpoint).inc(stats[0])
+            REQUEST_DB_TIME.labels(app_name, endpoint).observe(stats[1])
+        return response
+
+    def metrics_view():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,242 @@
+import time
+import sqlite3
+import hashlib
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 已应用的迁移记录表；多个子系统共用 restaurant.db，用 component 区分各自的迁移序列
+SCHEMA_VERSION_TABLE = 'schema_version'
+# 大表改写时每批处理的 rowid 数量；分批 UPDATE/DELETE 时每批单独提交，期间其他连接可以穿插写入
+DEFAULT_BATCH_SIZE = 5000
+# 分批处理时进度日志的最小间隔（秒）
+PROGRESS_INTERVAL = 2.0
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    """一个迁移步骤：version 在同一 component 内递增，apply(conn) 执行具体变更
+
+    checksum 默认取 apply 的源码摘要，已执行的步骤被修改后启动会报错，而不是静默跳过。
+    """
+
+    def __init__(self, version, name, apply, checksum=None):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.checksum = checksum or source_checksum(apply)
+
+
+def source_checksum(func):
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = getattr(func, '__qualname__', repr(func))
+    # 只比较有效代码行，缩进和空行的调整不算修改
+    lines = [line.strip() for line in source.splitlines() if line.strip()]
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+class BatchProgress:
+    """分批处理的进度日志，按时间间隔输出，避免每批一行"""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def advance(self, count):
+        self.done += count
+        now = time.perf_counter()
+        if self.done >= self.total or now - self._last_report >= PROGRESS_INTERVAL:
+            self._last_report = now
+            percent = 100.0 * self.done / self.total if self.total else 100.0
+            logger.info("%s: %s/%s (%.0f%%)，已用时 %.1f 秒",
+                        self.label, self.done, self.total, percent, now - self.started)
+
+
+def rowid_batches(conn, table, batch_size=DEFAULT_BATCH_SIZE, label=None, commit=True):
+    """按 rowid 区间把大表拆成多批，调用方处理完一批后自动提交（commit=True）并记录进度
+
+    每批是一个短事务，不会长时间持有写锁；中途中断时已提交的批次保留，
+    因此分批执行的迁移步骤必须可以重复执行。区间在开始时确定，之后新写入的行不在其中。
+    """
+    low, high = conn.execute(f'SELECT MIN(rowid), MAX(rowid) FROM {table}').fetchone()
+    if low is None:
+        return
+    progress = BatchProgress(label or table, high - low + 1)
+    start = low
+    while start <= high:
+        end = min(start + batch_size - 1, high)
+        yield start, end
+        if commit:
+            conn.commit()
+        progress.advance(end - start + 1)
+        start = end + 1
+
+
+def update_in_batches(conn, table, assignments, where='1', params=(), batch_size=DEFAULT_BATCH_SIZE, label=None):
+    """分批执行 UPDATE table SET assignments WHERE where，返回更新的行数"""
+    updated = 0
+    sql = f'UPDATE {table} SET {assignments} WHERE rowid BETWEEN ? AND ? AND ({where})'
+    for low, high in rowid_batches(conn, table, batch_size, label):
+        updated += conn.execute(sql, (low, high, *params)).rowcount
+    return updated
+
+
+def delete_in_batches(conn, table, where, params=(), batch_size=DEFAULT_BATCH_SIZE, label=None):
+    """分批执行 DELETE FROM table WHERE where，返回删除的行数"""
+    deleted = 0
+    sql = f'DELETE FROM {table} WHERE rowid BETWEEN ? AND ? AND ({where})'
+    for low, high in rowid_batches(conn, table, batch_size, label):
+        deleted += conn.execute(sql, (low, high, *params)).rowcount
+    return deleted
+
+
+def rebuild_table(conn, table, create_sql, columns, select, batch_size=DEFAULT_BATCH_SIZE):
+    """按新结构重建表：create_sql 中用 {table} 表示新表名，数据复制到新表后再替换旧表
+
+    columns 为新表的列，select 为从旧表取值的表达式，两者一一对应。
+    整个重建在一个 BEGIN IMMEDIATE 事务里完成，期间持有写锁，其他连接的写入要等重建结束，
+    复制过程中不会有写入丢失；分批复制只用于输出进度。失败时整体回滚，旧表保持不变。
+    """
+    new_table = f'{table}__rebuild'
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'DROP TABLE IF EXISTS {new_table}')
+        conn.execute(create_sql.format(table=new_table))
+        insert = f'INSERT INTO {new_table} ({columns}) SELECT {select} FROM {table} WHERE rowid BETWEEN ? AND ?'
+        for low, high in rowid_batches(conn, table, batch_size, f'重建 {table}', commit=False):
+            conn.execute(insert, (low, high))
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {new_table} RENAME TO {table}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def add_columns(conn, table, columns):
+    """补齐缺失的列（columns 为 列名 -> 类型定义），返回实际添加的列名
+
+    SQLite 不能追加没有默认值的 NOT NULL 列，类型定义里不要带 NOT NULL。
+    """
+    existing = table_columns(conn, table)
+    added = []
+    for column, type_def in columns.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {type_def}')
+            added.append(column)
+    if added:
+        logger.info("%s 表添加字段: %s", table, ', '.join(added))
+    return added
+
+
+class MigrationRunner:
+    """按版本顺序执行未应用的迁移，每个步骤成功后写入 schema_version，之后启动不再执行"""
+
+    def __init__(self, db_path, component, migrations):
+        self.db_path = db_path
+        self.component = component
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        versions = [m.version for m in self.migrations]
+        if len(set(versions)) != len(versions):
+            raise ValueError(f'{component} 迁移版本号重复: {versions}')
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_version_table(self, conn):
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+                component TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                checksum TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                duration_ms INTEGER,
+                PRIMARY KEY (component, version)
+            )
+        ''')
+        conn.commit()
+
+    def applied_checksums(self, conn):
+        sql = f'SELECT version, checksum FROM {SCHEMA_VERSION_TABLE} WHERE component = ?'
+        try:
+            rows = conn.execute(sql, (self.component,)).fetchall()
+        except sqlite3.OperationalError:
+            # 早期的版本表没有 checksum 列，补上后由 verify 回填
+            conn.execute(f'ALTER TABLE {SCHEMA_VERSION_TABLE} ADD COLUMN checksum TEXT')
+            conn.commit()
+            rows = conn.execute(sql, (self.component,)).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def applied_versions(self, conn):
+        return set(self.applied_checksums(conn))
+
+    def pending(self, conn):
+        applied = self.applied_versions(conn)
+        return [m for m in self.migrations if m.version not in applied]
+
+    def current_version(self, conn):
+        return max(self.applied_versions(conn), default=0)
+
+    def verify(self, conn, applied):
+        """已执行步骤的代码不能再修改，发现不一致时拒绝启动；没有记录校验和的旧记录直接回填"""
+        changed = []
+        for migration in self.migrations:
+            if migration.version not in applied:
+                continue
+            recorded = applied[migration.version]
+            if recorded is None:
+                conn.execute(f'UPDATE {SCHEMA_VERSION_TABLE} SET checksum = ? WHERE component = ? AND version = ?',
+                             (migration.checksum, self.component, migration.version))
+            elif recorded != migration.checksum:
+                changed.append(migration.version)
+        conn.commit()
+        if changed:
+            raise MigrationError(f'{self.component} 已执行的迁移被修改: {changed}，请新增迁移步骤而不是修改旧步骤')
+
+    def run(self):
+        """执行所有未应用的迁移，返回本次应用的版本号列表；已是最新时只有一次查询"""
+        conn = self.connect()
+        try:
+            self.ensure_version_table(conn)
+            applied_checksums = self.applied_checksums(conn)
+            self.verify(conn, applied_checksums)
+            applied = []
+            for migration in self.migrations:
+                if migration.version in applied_checksums:
+                    continue
+                started = time.perf_counter()
+                logger.info("执行迁移 %s v%s: %s", self.component, migration.version, migration.name)
+                try:
+                    migration.apply(conn)
+                    duration_ms = int((time.perf_counter() - started) * 1000)
+                    conn.execute(f'''
+                        INSERT INTO {SCHEMA_VERSION_TABLE} (component, version, name, checksum, duration_ms)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (self.component, migration.version, migration.name, migration.checksum, duration_ms))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logger.exception("迁移 %s v%s 失败", self.component, migration.version)
+                    raise
+                logger.info("迁移 %s v%s 完成，耗时 %s ms", self.component, migration.version, duration_ms)
+                applied.append(migration.version)
+            return applied
+        finally:
+            conn.close()
@@ -0,0 +1,199 @@
+import os
+import re
+import glob
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 冷数据按年份存放：data/archive/sales_2023.db、sales_2024.db ...
+ARCHIVE_DIR = os.path.join('data', 'archive')
+ARCHIVE_FILE_PATTERN = 'sales_{year}.db'
+# 归档早于 N 个月的订单；销售分析的“最近12个月”统计只查热库，不能小于 12
+ARCHIVE_AFTER_MONTHS = 13
+# 每批迁移的订单数，每批一个短事务，不会长时间锁住收银
+DEFAULT_BATCH_SIZE = 500
+# 只有已结束的订单才归档
+CLOSED_STATUSES = ('已完成', '已取消')
+# 归档的表及其与本批订单（temp.archive_batch）的关联条件，别名 t 为被归档的表
+ARCHIVE_TABLES = [
+    ('orders', 't.order_number IN (SELECT order_number FROM temp.archive_batch)'),
+    ('order_items', 't.order_number IN (SELECT order_number FROM temp.archive_batch)'),
+    ('receipts', 't.order_number IN (SELECT order_number FROM temp.archive_batch)'),
+    ('receipt_items', '''t.receipt_id IN (
+        SELECT id FROM main.receipts WHERE order_number IN (SELECT order_number FROM temp.archive_batch))'''),
+]
+# SQLite 默认最多同时 ATTACH 10 个数据库
+MAX_ATTACHED = 10
+# 订单编号：DD + 年月日 + 4位序号，归档年份与下单年份一致
+ORDER_NUMBER_PATTERN = re.compile(r'^DD(\d{4})\d{4}\d{4}$')
+
+
+def archive_path(year, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, ARCHIVE_FILE_PATTERN.format(year=year))
+
+
+def archive_years(archive_dir=ARCHIVE_DIR):
+    """已有的归档年份，按年份升序"""
+    years = []
+    for path in glob.glob(os.path.join(archive_dir, ARCHIVE_FILE_PATTERN.format(year='*'))):
+        match = re.search(r'(\d{4})\.db$', path)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def order_years(order_numbers):
+    """从订单编号中取出下单年份；有无法识别的编号时返回 None，由调用方挂载全部年份"""
+    years = set()
+    for order_number in order_numbers:
+        match = ORDER_NUMBER_PATTERN.match(order_number or '')
+        if not match:
+            return None
+        years.add(int(match.group(1)))
+    return sorted(years)
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+class OrderArchiver:
+    """把已结束且早于保留期的订单连同明细、小票按年份移到冷库文件"""
+
+    def __init__(self, conn, archive_dir=ARCHIVE_DIR, batch_size=DEFAULT_BATCH_SIZE):
+        self.conn = conn
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self._prepared = set()
+
+    def cutoff(self, months=ARCHIVE_AFTER_MONTHS):
+        """归档截止时间：按整月计算，早于该时间的订单属于已关账的期间"""
+        return self.conn.execute("SELECT datetime('now', 'localtime', 'start of month', ?)",
+                                 (f'-{months} months',)).fetchone()[0]
+
+    def run(self, months=ARCHIVE_AFTER_MONTHS, max_batches=None):
+        """按批次归档，直到没有符合条件的订单（或达到 max_batches），返回各年份归档的订单数"""
+        started = time.perf_counter()
+        cutoff = self.cutoff(months)
+        moved = {}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            rows = self.conn.execute(f'''
+                SELECT order_number, strftime('%Y', created_at)
+                FROM orders
+                WHERE created_at < ? AND order_status IN ({','.join('?' * len(CLOSED_STATUSES))})
+                ORDER BY created_at
+                LIMIT ?
+            ''', (cutoff, *CLOSED_STATUSES, self.batch_size)).fetchall()
+            if not rows:
+                break
+            by_year = {}
+            for order_number, year in rows:
+                by_year.setdefault(int(year), []).append(order_number)
+            for year, order_numbers in by_year.items():
+                self._move(year, order_numbers)
+                moved[year] = moved.get(year, 0) + len(order_numbers)
+            batches += 1
+        if moved:
+            logger.info("订单归档完成：%s，截止 %s，耗时 %.1f 秒",
+                        moved, cutoff, time.perf_counter() - started)
+        return moved
+
+    def _prepare_archive(self, year):
+        """创建冷库文件和表结构；热库后来新增的列同步补到冷库"""
+        if year in self._prepared:
+            return
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archive = sqlite3.connect(archive_path(year, self.archive_dir))
+        try:
+            for table, _ in ARCHIVE_TABLES:
+                create_sql = self.conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                               (table,)).fetchone()[0]
+                archive.execute(re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?', 'CREATE TABLE IF NOT EXISTS ',
+                                       create_sql.strip(), flags=re.IGNORECASE))
+                existing = {row[1] for row in archive.execute(f'PRAGMA table_info({table})')}
+                for row in self.conn.execute(f'PRAGMA main.table_info({table})'):
+                    if row[1] not in existing:
+                        archive.execute(f'ALTER TABLE {table} ADD COLUMN {row[1]} {row[2]}')
+            archive.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)')
+            archive.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order_number ON order_items (order_number)')
+            archive.execute('CREATE INDEX IF NOT EXISTS idx_receipts_order_number ON receipts (order_number)')
+            archive.execute('CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt_id ON receipt_items (receipt_id)')
+            archive.commit()
+        finally:
+            archive.close()
+        self._prepared.add(year)
+
+    def _move(self, year, order_numbers):
+        self._prepare_archive(year)
+        cursor = self.conn.cursor()
+        # 冷库与热库在同一个事务中提交，订单不会同时出现在两边或丢失（ATTACH 必须在事务开始前执行）
+        cursor.execute('ATTACH DATABASE ? AS archive', (archive_path(year, self.archive_dir),))
+        try:
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (order_number TEXT PRIMARY KEY)')
+            cursor.execute('DELETE FROM temp.archive_batch')
+            cursor.executemany('INSERT INTO temp.archive_batch VALUES (?)', [(n,) for n in order_numbers])
+            for table, condition in ARCHIVE_TABLES:
+                columns = ', '.join(_columns(self.conn, 'main', table))
+                # 中断后重试时冷库里可能已有同一行，以热库为准覆盖
+                cursor.execute(f'''
+                    INSERT OR REPLACE INTO archive.{table} ({columns})
+                    SELECT {columns} FROM main.{table} t WHERE {condition}
+                ''')
+            # 先删明细再删主表：receipt_items 的条件依赖 receipts
+            for table, condition in reversed(ARCHIVE_TABLES):
+                cursor.execute(f'DELETE FROM main.{table} AS t WHERE {condition}')
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.execute('DETACH DATABASE archive')
+
+
+def attach_archives(conn, archive_dir=ARCHIVE_DIR, years=None):
+    """ATTACH 各年份冷库，并创建 orders_all 等临时视图（热库 UNION ALL 冷库），查询历史时用视图名代替表名
+
+    只读历史时使用；视图是连接级的临时对象，连接关闭后自动消失。
+    years 为 None 时挂载全部年份，指定年份时跳过没有冷库文件的年份；years=[] 时视图只包含热库。
+    """
+    existing = archive_years(archive_dir)
+    years = existing if years is None else sorted(set(years) & set(existing))
+    # 超出 ATTACH 上限时只挂载最近的年份，更早年份的订单查不到
+    if len(years) > MAX_ATTACHED - 1:
+        logger.warning("归档年份 %s 超出 ATTACH 上限，只挂载最近的 %s 个年份，未挂载: %s",
+                       years, MAX_ATTACHED - 1, years[:-(MAX_ATTACHED - 1)])
+        years = years[-(MAX_ATTACHED - 1):]
+    schemas = []
+    for year in years:
+        schema = f'archive_{year}'
+        conn.execute('ATTACH DATABASE ? AS ' + schema, (archive_path(year, archive_dir),))
+        schemas.append(schema)
+    for table, _ in ARCHIVE_TABLES:
+        columns = ', '.join(_columns(conn, 'main', table))
+        selects = [f'SELECT {columns} FROM main.{table}']
+        for schema in schemas:
+            # 冷库缺少热库后来新增的列时用 NULL 补齐
+            archived = set(_columns(conn, schema, table))
+            if not archived:
+                continue
+            select_list = ', '.join(c if c in archived else f'NULL AS {c}' for c in _columns(conn, 'main', table))
+            selects.append(f'SELECT {select_list} FROM {schema}.{table}')
+        conn.execute(f'DROP VIEW IF EXISTS temp.{table}_all')
+        conn.execute(f'CREATE TEMP VIEW {table}_all AS ' + ' UNION ALL '.join(selects))
+    return years
+
+
+def attach_order_history(conn, order_numbers, archive_dir=ARCHIVE_DIR):
+    """按订单号查询历史前调用：订单都在热库时视图只包含热库，否则只挂载这些订单下单年份的冷库"""
+    order_numbers = list(order_numbers)
+    found = set()
+    # 分批查询，避免超出 SQLite 的参数个数上限
+    for start in range(0, len(order_numbers), DEFAULT_BATCH_SIZE):
+        batch = order_numbers[start:start + DEFAULT_BATCH_SIZE]
+        found.update(row[0] for row in conn.execute(
+            f"SELECT order_number FROM main.orders WHERE order_number IN ({','.join('?' * len(batch))})", batch))
+    missing = [order_number for order_number in order_numbers if order_number not in found]
+    return attach_archives(conn, archive_dir, order_years(missing) if missing else [])
@@ -0,0 +1,243 @@
+# 订单状态推送：后厨和前台屏幕通过 Server-Sent Events 订阅订单状态变化，不必反复刷新订单列表。
+#
+# 状态变更与订单更新在同一事务里写入 order_events 表（record_event），事件 ID 即表的自增主键。
+# 每个工作进程有一个 EventHub：有订阅者时启动一个后台线程轮询 id > 已读位置 的新事件，分发给本进程的订阅队列；
+# 本进程提交后调用 notify() 立即唤醒轮询，其他进程写入的事件最迟 POLL_INTERVAL 秒后送达。
+# 之所以用表轮询而不是本机 socket：多进程、多机器共用同一个数据库文件时都能工作，也不需要额外的进程和端口，
+# 同时事件表本身就是断线重连时补发事件的来源。
+#
+# 客户端断线重连时浏览器自动带上 Last-Event-ID（也可用 ?last_event_id=），服务端从该 ID 之后补发；
+# 缺口过大或事件已被清理时发送 reset 事件，客户端应重新加载完整列表。
+# 注意：每个 SSE 连接在连接期间占用一个工作线程。
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+EVENTS_TABLE = 'order_events'
+# 后台线程轮询事件表的间隔（秒），也是跨进程推送的最大延迟
+POLL_INTERVAL = float(os.environ.get('ORDER_EVENTS_POLL_INTERVAL', '0.5'))
+# 每次轮询最多读取的事件数
+POLL_BATCH_SIZE = 1000
+# 没有事件时发送注释行的间隔（秒），防止代理断开空闲连接，同时及时发现客户端已断开
+HEARTBEAT_INTERVAL = 15
+# 浏览器断线后的重连等待（毫秒）
+RETRY_MS = 3000
+# 重连时最多补发的事件数，超过则发送 reset
+REPLAY_LIMIT = 500
+# 每个订阅者最多积压的批次数；客户端读得太慢时断开它，由它重连后从事件表补发
+SUBSCRIBER_QUEUE_SIZE = 256
+# 事件保留时长（秒）和清理间隔（秒）
+RETENTION_SECONDS = 24 * 3600
+PRUNE_INTERVAL = 600
+SSE_MIMETYPE = 'text/event-stream'
+
+
+def create_table(conn):
+    """创建事件表（迁移中调用）"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {EVENTS_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            order_number TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def record_event(conn, order_number, status, source='sales'):
+    """在调用方的事务中记录一次状态变化；提交后再调用 hub.notify()"""
+    conn.execute(f'INSERT INTO {EVENTS_TABLE} (source, order_number, status) VALUES (?, ?, ?)',
+                 (source, str(order_number), status))
+
+
+def record_events(conn, order_numbers, status, source='sales'):
+    conn.executemany(f'INSERT INTO {EVENTS_TABLE} (source, order_number, status) VALUES (?, ?, ?)',
+                     [(source, str(order_number), status) for order_number in order_numbers])
+
+
+def _event(row):
+    return {'id': row[0], 'source': row[1], 'order_number': row[2], 'status': row[3], 'at': row[4]}
+
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+
+class EventHub:
+    """进程内发布/订阅：一个轮询线程读取事件表，按批次放入各订阅者的队列"""
+
+    def __init__(self, db_path, poll_interval=POLL_INTERVAL):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.last_id = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_prune = 0
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _max_id(self, conn):
+        return conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {EVENTS_TABLE}').fetchone()[0]
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            if self._thread is None:
+                # 同步确定起始位置：订阅之后提交的事件一定会经队列送达，之前的由 replay 补发
+                conn = self._connect()
+                try:
+                    self.last_id = self._max_id(conn)
+                finally:
+                    conn.close()
+                self._thread = threading.Thread(target=self._run, name='order-events', daemon=True)
+                self._thread.start()
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def notify(self):
+        """本进程写入事件并提交后调用，立即唤醒轮询线程"""
+        self._wakeup.set()
+
+    def replay(self, after_id, limit=REPLAY_LIMIT):
+        """读取 after_id 之后的事件，返回 (事件列表, 最新事件 ID)；
+        事件已被清理、积压超过 limit 或 ID 无效时事件列表为 None，客户端需要重新加载"""
+        conn = self._connect()
+        try:
+            oldest, latest = conn.execute(f'SELECT MIN(id), COALESCE(MAX(id), 0) FROM {EVENTS_TABLE}').fetchone()
+            rows = conn.execute(f'''
+                SELECT id, source, order_number, status, created_at FROM {EVENTS_TABLE}
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (after_id, limit + 1)).fetchall()
+        finally:
+            conn.close()
+        pruned = oldest is not None and oldest > after_id + 1
+        if pruned or after_id > latest or len(rows) > limit:
+            return None, latest
+        return [_event(row) for row in rows], latest
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+                try:
+                    self._poll(conn)
+                    self._maybe_prune(conn)
+                except sqlite3.Error as e:
+                    logger.warning("读取订单事件失败: %s", e)
+        finally:
+            conn.close()
+
+    def _poll(self, conn):
+        while True:
+            rows = conn.execute(f'''
+                SELECT id, source, order_number, status, created_at FROM {EVENTS_TABLE}
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (self.last_id, POLL_BATCH_SIZE)).fetchall()
+            if not rows:
+                return
+            self.last_id = rows[-1][0]
+            self.publish([_event(row) for row in rows])
+            if len(rows) < POLL_BATCH_SIZE:
+                return
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(events)
+            except queue.Full:
+                logger.warning("订单事件订阅者积压过多，断开连接")
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+
+    def _maybe_prune(self, conn):
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        # 始终保留最新一条，重连时据此判断客户端的 ID 是否已被清理
+        deleted = conn.execute(f'''
+            DELETE FROM {EVENTS_TABLE}
+            WHERE created_at < datetime('now', ?) AND id < (SELECT MAX(id) FROM {EVENTS_TABLE})
+        ''', (f'-{RETENTION_SECONDS} seconds',)).rowcount
+        conn.commit()
+        if deleted:
+            logger.info("清理过期订单事件 %s 条", deleted)
+
+
+def last_event_id():
+    """浏览器重连时的 Last-Event-ID 请求头，或首次连接时的 ?last_event_id= 参数"""
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def _format(event_id, name, data):
+    return f'id: {event_id}\nevent: {name}\ndata: {data}\n\n'
+
+
+def event_stream(hub):
+    """SSE 响应：先订阅再补发 Last-Event-ID 之后的事件，然后持续推送新事件"""
+    after_id = last_event_id()
+    dumps = current_app.json.dumps
+    subscription = hub.subscribe()
+
+    def generate():
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            sent_id = 0
+            if after_id is not None:
+                events, latest = hub.replay(after_id)
+                if events is None:
+                    sent_id = latest
+                    yield _format(sent_id, 'reset', dumps({'last_event_id': latest}))
+                else:
+                    sent_id = after_id
+                    for event in events:
+                        sent_id = event['id']
+                        yield _format(sent_id, 'status', dumps(event))
+            while not subscription.dropped:
+                try:
+                    events = subscription.queue.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                for event in events:
+                    # 补发时已经发过的事件跳过
+                    if event['id'] > sent_id:
+                        sent_id = event['id']
+                        yield _format(sent_id, 'status', dumps(event))
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = current_app.response_class(generate(), mimetype=SSE_MIMETYPE)
+    response.headers['Cache-Control'] = 'no-cache'
+    # 让 nginx 等反向代理不要缓冲事件流
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,172 @@
+import json
+import time
+import random
+from datetime import datetime
+
+# 仓储数据库（入库、出库记录所在的库），通过 ATTACH 与销售库在同一事务中更新
+INVENTORY_DB_PATH = 'data/restaurant.db'
+# 每个微批次最多处理的已完成订单数
+DEFAULT_BATCH_SIZE = 200
+# 自动扣减出库记录的用途，便于在出库列表中区分
+CONSUMPTION_PURPOSE = '销售自动扣减'
+
+
+def init_recipe_tables(conn):
+    """创建菜品配方（BOM）表和订单扣减记录表"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS recipe_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_code TEXT NOT NULL,
+        inventory_item_name TEXT NOT NULL,
+        quantity REAL NOT NULL,
+        unit TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(item_code, inventory_item_name),
+        FOREIGN KEY (item_code) REFERENCES menu_items (item_code)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS inventory_consumption_log (
+        order_number TEXT PRIMARY KEY,
+        outbound_no TEXT,
+        shortage TEXT,
+        posted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+
+def get_recipe(conn, item_code):
+    rows = conn.execute('''
+        SELECT inventory_item_name, quantity, unit
+        FROM recipe_items
+        WHERE item_code = ?
+        ORDER BY id
+    ''', (item_code,)).fetchall()
+    return [{'inventory_item_name': row[0], 'quantity': row[1], 'unit': row[2]} for row in rows]
+
+
+def save_recipe(conn, item_code, ingredients):
+    """整体替换菜品配方，ingredients 为 [{inventory_item_name, quantity, unit}]"""
+    rows = []
+    for ingredient in ingredients:
+        name = (ingredient.get('inventory_item_name') or '').strip()
+        quantity = float(ingredient.get('quantity') or 0)
+        if not name or quantity <= 0:
+            raise ValueError('配方原料名称不能为空，用量必须大于0')
+        rows.append((item_code, name, quantity, ingredient.get('unit')))
+
+    conn.execute('DELETE FROM recipe_items WHERE item_code = ?', (item_code,))
+    conn.executemany('''
+        INSERT INTO recipe_items (item_code, inventory_item_name, quantity, unit)
+        VALUES (?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+
+
+# 原料消耗过账
+class ConsumptionPoster:
+    """按配方汇总已完成订单的原料用量，以一张出库单批量扣减库存（先进先出）"""
+
+    def __init__(self, conn, inventory_db_path=INVENTORY_DB_PATH):
+        self.conn = conn
+        self.inventory_db_path = inventory_db_path
+
+    def post_pending(self, batch_size=DEFAULT_BATCH_SIZE):
+        """处理一个微批次，返回处理结果；没有待处理订单时 orders 为 0"""
+        started = time.perf_counter()
+        pending = [row[0] for row in self.conn.execute('''
+            SELECT o.order_number
+            FROM orders o
+            LEFT JOIN inventory_consumption_log l ON l.order_number = o.order_number
+            WHERE o.order_status = '已完成' AND l.order_number IS NULL
+            ORDER BY o.updated_at
+            LIMIT ?
+        ''', (batch_size,)).fetchall()]
+        if not pending:
+            return {'orders': 0, 'items': 0, 'outbound_no': None, 'shortage': {}}
+
+        cursor = self.conn.cursor()
+        # 仓储库与销售库在同一事务中提交，避免重复扣减或漏记（ATTACH 必须在事务开始前执行）
+        cursor.execute('ATTACH DATABASE ? AS inventory', (self.inventory_db_path,))
+        try:
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS consumption_orders (order_number TEXT PRIMARY KEY)')
+            cursor.execute('DELETE FROM temp.consumption_orders')
+            cursor.executemany('INSERT INTO temp.consumption_orders VALUES (?)', [(n,) for n in pending])
+
+            # 一次聚合查询得到本批次全部原料用量
+            requirements = cursor.execute('''
+                SELECT r.inventory_item_name, MIN(r.unit), SUM(oi.quantity * r.quantity)
+                FROM temp.consumption_orders c
+                JOIN order_items oi ON oi.order_number = c.order_number
+                JOIN recipe_items r ON r.item_code = oi.item_code
+                GROUP BY r.inventory_item_name
+            ''').fetchall()
+
+            outbound_no, outbound_rows, shortage = self._allocate(cursor, requirements)
+            cursor.executemany('''
+                INSERT INTO inventory_consumption_log (order_number, outbound_no, shortage)
+                VALUES (?, ?, ?)
+            ''', [(n, outbound_no, json.dumps(shortage, ensure_ascii=False) if shortage else None) for n in pending])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.execute('DETACH DATABASE inventory')
+
+        return {
+            'orders': len(pending),
+            'items': outbound_rows,
+            'outbound_no': outbound_no,
+            'shortage': shortage,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def _allocate(self, cursor, requirements):
+        """按入库时间先进先出分配库存，生成出库记录并扣减入库数量"""
+        needed = {name: float(total) for name, _, total in requirements if total and total > 0}
+        if not needed:
+            return None, 0, {}
+        units = {name: unit for name, unit, _ in requirements}
+        placeholders = ','.join('?' * len(needed))
+        lots = cursor.execute(f'''
+            SELECT inbound_no, item_name, quantity, unit
+            FROM inventory.inbound_records
+            WHERE quality_check = 1 AND quantity > 0 AND item_name IN ({placeholders})
+            ORDER BY item_name, inbound_time, id
+        ''', list(needed)).fetchall()
+
+        # 与手工出库相同的单号格式：OUT + 时间戳 + 4位随机数
+        outbound_no = f"OUT{int(time.time())}{random.randint(1000, 9999)}"
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        remaining = dict(needed)
+        outbound_rows = []
+        stock_updates = []
+        for inbound_no, item_name, quantity, unit in lots:
+            if remaining[item_name] <= 0:
+                continue
+            take = min(float(quantity), remaining[item_name])
+            remaining[item_name] -= take
+            outbound_rows.append((
+                outbound_no, inbound_no, item_name, round(take, 3), unit or units[item_name],
+                '已出库', current_time, '系统', '系统', CONSUMPTION_PURPOSE, '按菜品配方自动扣减'
+            ))
+            # 确保不会出现负库存，保留2位小数
+            stock_updates.append((round(max(float(quantity) - take, 0), 2), inbound_no, item_name))
+
+        cursor.executemany('''
+            INSERT INTO inventory.outbound_records (
+                outbound_no, inbound_no, item_name, quantity, unit, status,
+                outbound_time, receiver, approver, purpose, remarks
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', outbound_rows)
+        cursor.executemany('''
+            UPDATE inventory.inbound_records
+            SET quantity = ?
+            WHERE inbound_no = ? AND item_name = ?
+        ''', stock_updates)
+
+        # 库存不足的部分记录下来，不产生负库存
+        shortage = {name: round(qty, 3) for name, qty in remaining.items() if qty > 1e-9}
+        return (outbound_no if outbound_rows else None), len(outbound_rows), shortage
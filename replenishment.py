@@ -0,0 +1,224 @@
+import math
+import time
+from datetime import datetime
+
+# 移动平均窗口（天）：短窗口反映近期趋势，长窗口平滑波动
+SHORT_WINDOW_DAYS = 7
+LONG_WINDOW_DAYS = 28
+# 没有历史到货记录的供应商使用默认提前期（天）
+DEFAULT_LEAD_TIME_DAYS = 3
+# 两次补货检查之间的间隔（天），订货量需覆盖提前期加检查周期
+REVIEW_PERIOD_DAYS = 7
+# 安全库存系数，约等于 95% 服务水平
+SAFETY_FACTOR = 1.65
+
+# 这些状态的采购单视为在途，避免重复下单（包括尚未提交的草稿）
+OPEN_ORDER_STATUSES = ('草稿', '待审核', '已提交', '已审核', '已收货')
+
+
+# 补货引擎
+class ReplenishmentEngine:
+    """按出库消耗的移动平均和供应商历史提前期计算再订货点，库存低于再订货点时按供应商生成草稿采购单"""
+
+    def __init__(self, conn, now=None):
+        self.conn = conn
+        self.now = now or datetime.now()
+
+    def _load_consumption(self):
+        """一次聚合查询算出全部物料的短/长窗口日均消耗和日消耗方差"""
+        today = self.now.strftime('%Y-%m-%d')
+        rows = self.conn.execute('''
+            WITH daily AS (
+                SELECT item_name,
+                       julianday(?) - julianday(date(outbound_time)) AS age,
+                       SUM(quantity) AS qty
+                FROM outbound_records
+                WHERE status = '已出库'
+                AND outbound_time >= date(?, ?)
+                GROUP BY item_name, date(outbound_time)
+            )
+            SELECT item_name,
+                   SUM(CASE WHEN age < ? THEN qty ELSE 0 END) AS short_total,
+                   SUM(qty) AS long_total,
+                   SUM(qty * qty) AS long_square_total
+            FROM daily
+            GROUP BY item_name
+        ''', (today, today, f'-{LONG_WINDOW_DAYS - 1} days', SHORT_WINDOW_DAYS)).fetchall()
+
+        consumption = {}
+        for item_name, short_total, long_total, long_square_total in rows:
+            long_avg = long_total / LONG_WINDOW_DAYS
+            # 没有出库的日子按 0 计入，方差 = E[x²] - E[x]²
+            variance = max(long_square_total / LONG_WINDOW_DAYS - long_avg * long_avg, 0.0)
+            consumption[item_name] = {
+                'short_avg': short_total / SHORT_WINDOW_DAYS,
+                'long_avg': long_avg,
+                'std_dev': math.sqrt(variance)
+            }
+        return consumption
+
+    def _load_stock(self):
+        rows = self.conn.execute('''
+            SELECT item_name, SUM(quantity) AS quantity, MIN(unit) AS unit
+            FROM inbound_records
+            WHERE quality_check = 1
+            GROUP BY item_name
+        ''').fetchall()
+        return {row[0]: {'quantity': float(row[1] or 0), 'unit': row[2]} for row in rows}
+
+    def _load_item_sources(self):
+        """每个物料最近一次采购的供应商和单价"""
+        rows = self.conn.execute('''
+            SELECT item_name, supplier_id, unit, unit_price
+            FROM (
+                SELECT poi.item_name, po.supplier_id, poi.unit, poi.unit_price,
+                       ROW_NUMBER() OVER (PARTITION BY poi.item_name ORDER BY po.order_date DESC, po.created_at DESC) AS rn
+                FROM purchase_order_items poi
+                JOIN purchase_orders po ON po.order_id = poi.order_id
+                JOIN suppliers s ON s.code = po.supplier_id AND s.status = '活跃'
+                WHERE po.status != '已取消'
+            )
+            WHERE rn = 1
+        ''').fetchall()
+        return {row[0]: {'supplier_id': row[1], 'unit': row[2], 'unit_price': float(row[3] or 0)} for row in rows}
+
+    def _load_lead_times(self):
+        """供应商平均提前期：采购日期到首次合格入库的天数"""
+        rows = self.conn.execute('''
+            SELECT po.supplier_id,
+                   AVG(julianday(date(first_inbound.inbound_time)) - julianday(po.order_date)) AS lead_days
+            FROM purchase_orders po
+            JOIN (
+                SELECT purchase_no, MIN(inbound_time) AS inbound_time
+                FROM inbound_records
+                WHERE quality_check = 1
+                GROUP BY purchase_no
+            ) first_inbound ON first_inbound.purchase_no = po.order_id
+            GROUP BY po.supplier_id
+        ''').fetchall()
+        return {row[0]: max(float(row[1]), 1.0) for row in rows if row[1] is not None}
+
+    def _load_on_order(self):
+        placeholders = ','.join('?' * len(OPEN_ORDER_STATUSES))
+        rows = self.conn.execute(f'''
+            SELECT poi.item_name, SUM(poi.quantity)
+            FROM purchase_order_items poi
+            JOIN purchase_orders po ON po.order_id = poi.order_id
+            WHERE po.status IN ({placeholders})
+            AND po.order_id NOT IN (SELECT purchase_no FROM inbound_records WHERE quality_check = 1)
+            GROUP BY poi.item_name
+        ''', OPEN_ORDER_STATUSES).fetchall()
+        return {row[0]: float(row[1] or 0) for row in rows}
+
+    def _load_thresholds(self):
+        # inventory_settings 的红色预警阈值作为再订货点下限
+        rows = self.conn.execute('''
+            SELECT item_name, MAX(warning_threshold_red) FROM inventory_settings GROUP BY item_name
+        ''').fetchall()
+        return {row[0]: float(row[1] or 0) for row in rows}
+
+    def suggestions(self):
+        """计算全部物料的补货建议，只返回需要补货的物料"""
+        consumption = self._load_consumption()
+        stock = self._load_stock()
+        sources = self._load_item_sources()
+        lead_times = self._load_lead_times()
+        on_order = self._load_on_order()
+        thresholds = self._load_thresholds()
+
+        result = []
+        for item_name in set(consumption) | set(thresholds):
+            source = sources.get(item_name)
+            if not source:
+                # 没有采购历史的物料无法确定供应商
+                continue
+
+            rates = consumption.get(item_name, {'short_avg': 0.0, 'long_avg': 0.0, 'std_dev': 0.0})
+            # 近期消耗上升时按短窗口计算，避免缺货
+            daily_usage = max(rates['short_avg'], rates['long_avg'])
+            lead_time = lead_times.get(source['supplier_id'], DEFAULT_LEAD_TIME_DAYS)
+            safety_stock = SAFETY_FACTOR * rates['std_dev'] * math.sqrt(lead_time)
+            reorder_point = max(daily_usage * lead_time + safety_stock, thresholds.get(item_name, 0.0))
+
+            on_hand = stock.get(item_name, {}).get('quantity', 0.0)
+            position = on_hand + on_order.get(item_name, 0.0)
+            if position > reorder_point:
+                continue
+
+            target_level = daily_usage * (lead_time + REVIEW_PERIOD_DAYS) + safety_stock
+            order_quantity = math.ceil(max(target_level, reorder_point) - position)
+            if order_quantity <= 0:
+                continue
+
+            result.append({
+                'item_name': item_name,
+                'supplier_id': source['supplier_id'],
+                'unit': source['unit'] or stock.get(item_name, {}).get('unit'),
+                'unit_price': source['unit_price'],
+                'on_hand': round(on_hand, 2),
+                'on_order': round(on_order.get(item_name, 0.0), 2),
+                'daily_usage': round(daily_usage, 3),
+                'lead_time_days': round(lead_time, 1),
+                'safety_stock': round(safety_stock, 2),
+                'reorder_point': round(reorder_point, 2),
+                'order_quantity': order_quantity
+            })
+        return sorted(result, key=lambda s: (s['supplier_id'], s['item_name']))
+
+    def create_draft_orders(self, created_by='系统'):
+        """按供应商分组，在一个事务中批量生成草稿采购单"""
+        started = time.perf_counter()
+        suggestions = self.suggestions()
+
+        by_supplier = {}
+        for suggestion in suggestions:
+            by_supplier.setdefault(suggestion['supplier_id'], []).append(suggestion)
+
+        orders = []
+        items = []
+        if by_supplier:
+            # 与手工采购单相同的编号规则：PO + 日期 + 三位序号
+            current_date = self.now.strftime('%Y%m%d')
+            max_order_id = self.conn.execute(
+                'SELECT MAX(order_id) FROM purchase_orders WHERE order_id LIKE ?', (f'PO{current_date}%',)
+            ).fetchone()[0]
+            seq_num = int(max_order_id[-3:]) if max_order_id else 0
+
+            for supplier_id, supplier_items in by_supplier.items():
+                seq_num += 1
+                order_id = f'PO{current_date}{seq_num:03d}'
+                total_amount = 0.0
+                for s in supplier_items:
+                    total_price = round(s['order_quantity'] * s['unit_price'], 2)
+                    total_amount += total_price
+                    items.append((
+                        order_id, s['item_name'], s['unit'], s['order_quantity'], s['unit_price'], total_price,
+                        f"再订货点 {s['reorder_point']}，现有 {s['on_hand']}，在途 {s['on_order']}"
+                    ))
+                orders.append((
+                    order_id, supplier_id, self.now.strftime('%Y-%m-%d'), '草稿',
+                    round(total_amount, 2), '自动补货生成', created_by
+                ))
+
+            try:
+                self.conn.executemany('''
+                    INSERT INTO purchase_orders (
+                        order_id, supplier_id, order_date, status, total_amount, remarks, created_by
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', orders)
+                self.conn.executemany('''
+                    INSERT INTO purchase_order_items (
+                        order_id, item_name, unit, quantity, unit_price, total_price, remarks
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', items)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+        return {
+            'orders': [order[0] for order in orders],
+            'order_count': len(orders),
+            'item_count': len(items),
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
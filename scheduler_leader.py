@@ -0,0 +1,100 @@
+import os
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# 锁文件目录，与数据库放在同一数据目录下
+DEFAULT_LOCK_DIR = os.path.join('data', 'locks')
+# 未当选的进程每隔多久重试一次，主节点退出后由其他进程接管
+DEFAULT_RETRY_SECONDS = 30
+
+
+class SchedulerLeader:
+    """基于文件锁的定时任务主节点选举
+
+    多个工作进程同时运行时，只有持有锁的进程启动定时任务；锁随进程退出由操作系统释放，
+    其余进程定期重试，因此主节点崩溃或平滑重启时会有新的进程接管。
+    """
+
+    def __init__(self, name, start_scheduler, lock_dir=DEFAULT_LOCK_DIR, retry_seconds=DEFAULT_RETRY_SECONDS):
+        self.name = name
+        self.start_scheduler = start_scheduler
+        self.lock_path = os.path.join(lock_dir, f'{name}.scheduler.lock')
+        self.retry_seconds = retry_seconds
+        self.scheduler = None
+        self._fd = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """尝试以非阻塞方式获取锁，成功后在锁文件中写入当前进程号"""
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def start(self):
+        """在后台线程中参与选举，当选后启动定时任务；立即返回"""
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-leader', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self.try_acquire():
+                logger.info("进程 %s 当选 %s 定时任务主节点", os.getpid(), self.name)
+                try:
+                    self.scheduler = self.start_scheduler()
+                except Exception as e:
+                    logger.exception("启动 %s 定时任务失败: %s", self.name, e)
+                    self.release()
+                else:
+                    return
+            self._stopped.wait(self.retry_seconds)
+
+    def stop(self):
+        """停止选举并关闭定时任务（不等待正在执行的任务），释放锁以便其他进程尽快接管"""
+        self._stopped.set()
+        if self.scheduler is not None:
+            try:
+                self.scheduler.shutdown(wait=False)
+            except Exception as e:
+                logger.warning("关闭 %s 定时任务时出错: %s", self.name, e)
+            self.scheduler = None
+        self.release()
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,195 @@
+# 会话：静态资源、API 和指标接口不读写会话，其余请求只在会话内容真正变化时才写回。
+# 默认仍是 Flask 的签名 Cookie 会话；设置环境变量 SESSION_TYPE=sqlite 后改为服务端存储，
+# Cookie 里只保存签名后的会话 ID，内容存在 data/sessions.db，过期记录在写入时顺带清理。
+import os
+import time
+import secrets
+import sqlite3
+import logging
+import threading
+
+from flask import current_app, request
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+from itsdangerous import BadSignature, Signer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_DB = os.path.join('data', 'sessions.db')
+# 不需要会话的请求：静态资源、JSON 接口、Prometheus 抓取
+SESSIONLESS_ENDPOINTS = {'static', 'metrics'}
+SESSIONLESS_PREFIXES = ('/api/',)
+SESSIONLESS_PATHS = {'/metrics'}
+# 清理过期会话的最小间隔（秒），每个进程各自计时
+SWEEP_INTERVAL = 600
+# 每次最多删除的过期记录数，避免一次清理占用写锁太久
+SWEEP_BATCH_SIZE = 1000
+SESSION_ID_BYTES = 32
+
+
+def is_sessionless(path=None):
+    """当前请求（或给定路径）是否跳过会话处理；before_request 钩子里先判断，避免访问 session 触发加载和 Vary: Cookie
+
+    open_session 在路由匹配之前调用，此时还没有 endpoint，只能按路径判断。
+    """
+    if path is None:
+        if request.endpoint in SESSIONLESS_ENDPOINTS:
+            return True
+        path = request.path
+    prefixes = SESSIONLESS_PREFIXES
+    if current_app.static_url_path is not None:
+        prefixes += (current_app.static_url_path.rstrip('/') + '/',)
+    return path in SESSIONLESS_PATHS or path.startswith(prefixes)
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, expires_at=None, persistent=True):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = expires_at is None
+        # 跳过会话处理的请求使用不落库的空会话
+        self.persistent = persistent
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """会话内容保存在 SQLite；只有内容变化（或长期会话的有效期过半）时才写库和下发 Cookie"""
+
+    serializer = session_json_serializer
+    salt = 'session-id'
+
+    def __init__(self, db_path=DEFAULT_SESSION_DB):
+        self.db_path = db_path
+        self._ready = False
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS sessions (
+                            sid TEXT PRIMARY KEY,
+                            data TEXT NOT NULL,
+                            expires_at REAL NOT NULL
+                        )
+                    ''')
+                    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+                    conn.commit()
+                    self._ready = True
+        return conn
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        if is_sessionless(request.path):
+            return ServerSideSession(persistent=False)
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('ascii')
+            except BadSignature:
+                sid = None
+            if sid:
+                conn = self._connect()
+                try:
+                    row = conn.execute('SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?',
+                                       (sid, time.time())).fetchone()
+                finally:
+                    conn.close()
+                if row is not None:
+                    return ServerSideSession(self.serializer.loads(row[0]), sid, row[1])
+        return ServerSideSession(sid=secrets.token_urlsafe(SESSION_ID_BYTES))
+
+    def save_session(self, app, session, response):
+        if not session.persistent:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app))
+            return
+
+        now = time.time()
+        lifetime = self._lifetime(app)
+        # 长期会话在有效期过半后顺延，而不是每个请求都写一次
+        refresh = session.permanent and session.expires_at is not None and session.expires_at - now < lifetime / 2
+        if not session.modified and not refresh:
+            return
+
+        expires_at = now + lifetime
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                         (session.sid, self.serializer.dumps(dict(session)), expires_at))
+            conn.commit()
+        finally:
+            conn.close()
+        self._maybe_sweep(now)
+
+        response.set_cookie(
+            name, self._signer(app).sign(session.sid).decode('ascii'),
+            expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path, secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+        )
+
+    def _delete(self, sid):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        self.sweep(now)
+
+    def sweep(self, now=None):
+        """删除过期会话，返回删除的条数"""
+        now = time.time() if now is None else now
+        deleted = 0
+        conn = self._connect()
+        try:
+            while True:
+                count = conn.execute('''
+                    DELETE FROM sessions WHERE rowid IN (
+                        SELECT rowid FROM sessions WHERE expires_at <= ? LIMIT ?)
+                ''', (now, SWEEP_BATCH_SIZE)).rowcount
+                conn.commit()
+                deleted += count
+                if count < SWEEP_BATCH_SIZE:
+                    break
+        finally:
+            conn.close()
+        if deleted:
+            logger.info("清理过期会话 %s 条", deleted)
+        return deleted
+
+
+def init_app(app):
+    """按 SESSION_TYPE 选择会话存储：cookie（默认）或 sqlite"""
+    session_type = app.config.get('SESSION_TYPE') or os.environ.get('SESSION_TYPE', 'cookie')
+    if session_type == 'sqlite':
+        app.session_interface = SQLiteSessionInterface(app.config.get('SESSION_SQLITE_PATH', DEFAULT_SESSION_DB))
+    elif session_type != 'cookie':
+        raise ValueError(f'不支持的 SESSION_TYPE: {session_type}')
+    return app.session_interface
@@ -0,0 +1,320 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+from flask import abort, current_app, g, jsonify, request
+
+# 当前请求的语句统计；调度任务等请求之外的查询不统计，只做慢查询检查
+_current_collector = ContextVar('sql_profile_collector', default=None)
+# 请求之外（后台任务）使用最近一次 init_app 的配置记录慢查询
+_default_profiler = None
+
+slow_logger = logging.getLogger('sql_profiler.slow')
+
+DEFAULT_CONFIG = {
+    'SQL_PROFILE_ENABLED': True,
+    # 超过该耗时（毫秒，含取数时间）的语句写入慢查询日志，并附带 EXPLAIN QUERY PLAN
+    'SQL_SLOW_QUERY_MS': 200,
+    'SQL_SLOW_QUERY_LOG': os.path.join('logs', 'slow_queries.log'),
+    # /debug/queries 保留的最近请求数和慢查询数
+    'SQL_PROFILE_HISTORY': 200,
+    # 同一语句在一个请求内执行次数达到该值时视为疑似 N+1
+    'SQL_REPEAT_THRESHOLD': 10,
+    # /debug/queries 会暴露 SQL 和参数：None 只在调试模式（app.debug）下可访问，True 始终开放，False 不注册
+    'SQL_DEBUG_VIEW': None,
+}
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """压缩空白并合并 IN (?, ?, ...) 占位符，使同一条语句归为一类"""
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    return re.sub(r'\(\s*\?(\s*,\s*\?)+\s*\)', '(?...)', sql)
+
+
+class _LazyRotatingFileHandler(RotatingFileHandler):
+    """第一次写入慢查询时才创建日志目录和文件，导入模块不产生文件"""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class StatementRecord:
+    __slots__ = ('sql', 'parameters', 'elapsed', 'explained', 'many')
+
+    def __init__(self, sql, parameters, elapsed, many=False):
+        self.sql = sql
+        self.parameters = parameters
+        self.elapsed = elapsed
+        self.explained = False
+        self.many = many
+
+
+class QueryCollector:
+    """单个请求内的语句计数与耗时，按规范化后的语句汇总"""
+    __slots__ = ('profiler', 'count', 'elapsed', 'statements')
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.count = 0
+        self.elapsed = 0.0
+        self.statements = {}
+
+    def add(self, sql, elapsed, new_statement=True):
+        if new_statement:
+            self.count += 1
+        self.elapsed += elapsed
+        stats = self.statements.get(sql)
+        if stats is None:
+            self.statements[sql] = [1, elapsed]
+        else:
+            if new_statement:
+                stats[0] += 1
+            stats[1] += elapsed
+
+
+def _finish(cursor, record, elapsed, new_statement):
+    """把一段执行/取数耗时计入当前请求，并检查是否为慢查询"""
+    if not new_statement:
+        record.elapsed += elapsed
+    collector = _current_collector.get()
+    if collector is not None:
+        collector.add(record.sql, elapsed, new_statement)
+        profiler = collector.profiler
+    else:
+        profiler = _default_profiler
+    if profiler is not None and not record.explained and record.elapsed * 1000 >= profiler.slow_query_ms:
+        record.explained = True
+        profiler.log_slow_query(cursor.connection, record)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """记录每条语句的执行时间；fetch* 的耗时累加到最近一条语句上"""
+
+    _record = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record = StatementRecord(sql, parameters, elapsed)
+            _finish(self, self._record, elapsed, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record = StatementRecord(sql, None, elapsed, many=True)
+            _finish(self, self._record, elapsed, True)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record = StatementRecord(sql_script, None, elapsed, many=True)
+            _finish(self, self._record, elapsed, True)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._record is not None:
+                _finish(self, self._record, time.perf_counter() - started, False)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed_fetch(super().fetchmany)
+        return self._timed_fetch(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3.connect(factory=...) 使用的连接类，所有语句都经过 ProfiledCursor"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def current_stats():
+    """当前请求已执行的语句数和耗时（秒）；不在请求中时返回 None"""
+    collector = _current_collector.get()
+    if collector is None:
+        return None
+    return collector.count, collector.elapsed
+
+
+def connect(database, **kwargs):
+    """与 sqlite3.connect 相同，返回带语句统计的连接"""
+    kwargs.setdefault('factory', ProfiledConnection)
+    return sqlite3.connect(database, **kwargs)
+
+
+class SQLProfiler:
+    """按请求统计 SQL 次数与耗时，写入响应头，并提供 /debug/queries 查看最近的请求和慢查询"""
+
+    def __init__(self, app=None):
+        self.slow_query_ms = DEFAULT_CONFIG['SQL_SLOW_QUERY_MS']
+        self.repeat_threshold = DEFAULT_CONFIG['SQL_REPEAT_THRESHOLD']
+        self.recent_requests = deque(maxlen=DEFAULT_CONFIG['SQL_PROFILE_HISTORY'])
+        self.slow_queries = deque(maxlen=DEFAULT_CONFIG['SQL_PROFILE_HISTORY'])
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        global _default_profiler
+        for key, value in DEFAULT_CONFIG.items():
+            app.config.setdefault(key, value)
+        if not app.config['SQL_PROFILE_ENABLED']:
+            return
+
+        self.slow_query_ms = app.config['SQL_SLOW_QUERY_MS']
+        self.repeat_threshold = app.config['SQL_REPEAT_THRESHOLD']
+        self.recent_requests = deque(maxlen=app.config['SQL_PROFILE_HISTORY'])
+        self.slow_queries = deque(maxlen=app.config['SQL_PROFILE_HISTORY'])
+        self._setup_slow_log(app.config['SQL_SLOW_QUERY_LOG'])
+        _default_profiler = self
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        if app.config['SQL_DEBUG_VIEW'] is not False:
+            app.add_url_rule('/debug/queries', 'debug_queries', self.debug_view)
+
+    def _setup_slow_log(self, path):
+        if not path or any(getattr(h, 'baseFilename', None) == os.path.abspath(path) for h in slow_logger.handlers):
+            return
+        handler = _LazyRotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+
+    def _start_request(self):
+        g.sql_profile_token = _current_collector.set(QueryCollector(self))
+
+    def _finish_request(self, response):
+        collector = _current_collector.get()
+        if collector is None:
+            return response
+        sql_ms = round(collector.elapsed * 1000, 2)
+        response.headers['X-SQL-Query-Count'] = str(collector.count)
+        response.headers['X-SQL-Query-Time'] = f'{sql_ms:.2f}ms'
+        response.headers.add('Server-Timing', f'db;desc="{collector.count} queries";dur={sql_ms:.2f}')
+        if request.endpoint != 'debug_queries':
+            self._remember(collector, response.status_code, sql_ms)
+        return response
+
+    def _teardown_request(self, exc):
+        token = g.pop('sql_profile_token', None)
+        if token is not None:
+            _current_collector.reset(token)
+
+    def _remember(self, collector, status_code, sql_ms):
+        repeated = [
+            {'sql': normalize_sql(sql), 'count': count, 'ms': round(elapsed * 1000, 2)}
+            for sql, (count, elapsed) in collector.statements.items()
+            if count >= self.repeat_threshold
+        ]
+        slowest = sorted(collector.statements.items(), key=lambda item: item[1][1], reverse=True)[:5]
+        self.recent_requests.append({
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': status_code,
+            'queries': collector.count,
+            'sql_ms': sql_ms,
+            'repeated': sorted(repeated, key=lambda item: item['count'], reverse=True),
+            'slowest': [
+                {'sql': normalize_sql(sql), 'count': count, 'ms': round(elapsed * 1000, 2)}
+                for sql, (count, elapsed) in slowest
+            ],
+        })
+
+        with self._lock:
+            stats = self.endpoints.setdefault(request.endpoint or request.path, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'sql_ms': 0.0, 'max_sql_ms': 0.0
+            })
+            stats['requests'] += 1
+            stats['queries'] += collector.count
+            stats['max_queries'] = max(stats['max_queries'], collector.count)
+            stats['sql_ms'] += sql_ms
+            stats['max_sql_ms'] = max(stats['max_sql_ms'], sql_ms)
+
+    def log_slow_query(self, conn, record):
+        """记录慢查询及其执行计划（EXPLAIN 用原生游标执行，不计入统计）"""
+        plan = []
+        if not record.many:
+            try:
+                plan = [row[-1] for row in sqlite3.Cursor(conn).execute(
+                    'EXPLAIN QUERY PLAN ' + record.sql, record.parameters).fetchall()]
+            except sqlite3.Error:
+                plan = []
+        entry = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'ms': round(record.elapsed * 1000, 2),
+            'sql': normalize_sql(record.sql),
+            'plan': plan,
+            'path': request.path if _current_collector.get() is not None else None,
+        }
+        self.slow_queries.append(entry)
+        slow_logger.info('%.2fms %s %s | plan: %s', entry['ms'], entry['path'] or '-', entry['sql'],
+                         ' / '.join(plan) or '-')
+
+    def debug_view(self):
+        if current_app.config['SQL_DEBUG_VIEW'] is None and not current_app.debug:
+            abort(404)
+        limit = request.args.get('limit', 50, type=int)
+        path = request.args.get('path')
+        requests = [r for r in reversed(self.recent_requests) if not path or r['path'].startswith(path)]
+        with self._lock:
+            endpoints = [
+                {
+                    'endpoint': name,
+                    'requests': stats['requests'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 1),
+                    'max_queries': stats['max_queries'],
+                    'avg_sql_ms': round(stats['sql_ms'] / stats['requests'], 2),
+                    'max_sql_ms': stats['max_sql_ms'],
+                }
+                for name, stats in self.endpoints.items()
+            ]
+        endpoints.sort(key=lambda item: item['avg_queries'], reverse=True)
+        return jsonify({
+            'slow_query_ms': self.slow_query_ms,
+            'repeat_threshold': self.repeat_threshold,
+            'endpoints': endpoints,
+            'requests': requests[:limit],
+            'slow_queries': list(reversed(self.slow_queries))[:limit],
+        })
@@ -0,0 +1,168 @@
+# 静态资源构建与发布：构建时按内容摘要生成带指纹的文件名并预先压缩（gzip/brotli），
+# 运行时 url_for('static', ...) 自动换成带指纹的地址，带指纹的文件按一年不可变缓存发送。
+#
+# 部署前构建（生成 static/dist/ 和 static/manifest.json）：python -m static_assets build
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import mimetypes
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # 未安装时只生成 gzip 版本
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+DIST_DIR = 'dist'
+# 用户上传的文件不是构建产物，不参与指纹化
+SKIP_DIRS = {DIST_DIR, 'uploads'}
+# 只压缩文本类资源；图片、字体（woff/woff2）本身已压缩
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.html', '.txt', '.xml', '.ico', '.ttf', '.eot'}
+MIN_COMPRESS_SIZE = 1024
+HASH_LENGTH = 10
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 按优先级排列的预压缩格式：(Content-Encoding, 文件后缀)
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _write_variant(path, suffix, data):
+    """压缩后更小才保留，返回是否写入"""
+    if suffix == '.br':
+        compressed = brotli.compress(data, quality=11)
+    else:
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) >= len(data):
+        return False
+    with open(path + suffix, 'wb') as f:
+        f.write(compressed)
+    return True
+
+
+def build(static_dir='static'):
+    """为 static_dir 下的资源生成带指纹的副本和预压缩版本，写入 manifest 并返回
+
+    旧版本的指纹文件不会删除，滚动发布期间仍在使用旧页面的浏览器可以继续加载。
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.samefile(root, static_dir):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            if logical == MANIFEST_NAME:
+                continue
+            base, ext = os.path.splitext(logical)
+            hashed = f'{DIST_DIR}/{base}.{file_digest(source)}{ext}'
+            target = os.path.join(static_dir, *hashed.split('/'))
+            encodings = []
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+            if ext.lower() in COMPRESSIBLE_EXTENSIONS and os.path.getsize(source) >= MIN_COMPRESS_SIZE:
+                with open(source, 'rb') as f:
+                    data = f.read()
+                for encoding, suffix in ENCODINGS:
+                    if suffix == '.br' and brotli is None:
+                        continue
+                    if os.path.exists(target + suffix) or _write_variant(target, suffix, data):
+                        encodings.append(encoding)
+            manifest[logical] = {'path': hashed, 'encodings': encodings}
+
+    manifest_path = os.path.join(static_dir, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    logger.info("静态资源构建完成：%s 个文件，其中 %s 个有预压缩版本",
+                len(manifest), sum(1 for entry in manifest.values() if entry['encodings']))
+    return manifest
+
+
+class StaticAssets:
+    """接管 Flask 的 static 路由：指纹地址走预压缩 + 长缓存，其余文件按原方式发送
+
+    manifest 在第一次用到时读取，导入模块不读文件；重新构建后需要重启进程生效。
+    """
+
+    def __init__(self, app=None):
+        self._manifest = None
+        self._by_path = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.url_defaults(self._rewrite_static_url)
+        app.view_functions['static'] = self.send_static
+        app.add_template_global(self.asset_url, 'asset_url')
+
+    def _load(self):
+        path = os.path.join(current_app.static_folder, MANIFEST_NAME)
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            # 未构建时使用原始文件名，开发环境不需要先构建
+            manifest = {}
+        self._by_path = {entry['path']: entry for entry in manifest.values()}
+        self._manifest = manifest
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._load()
+        return self._manifest
+
+    @property
+    def hashed_paths(self):
+        if self._by_path is None:
+            self._load()
+        return self._by_path
+
+    def asset_url(self, filename, **values):
+        """模板中使用：{{ asset_url('css/style.css') }}，等价于 url_for('static', filename=...)"""
+        return url_for('static', filename=filename, **values)
+
+    def _rewrite_static_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            entry = self.manifest.get(values['filename'])
+            if entry is not None:
+                values['filename'] = entry['path']
+
+    def send_static(self, filename):
+        entry = self.hashed_paths.get(filename)
+        if entry is None:
+            return current_app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding, suffix = next(((e, s) for e, s in ENCODINGS
+                                 if e in entry['encodings'] and e in request.accept_encodings), (None, ''))
+        response = send_from_directory(current_app.static_folder, filename + suffix, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+if __name__ == '__main__':
+    import log_config
+    log_config.configure_logging()
+    if sys.argv[1:2] != ['build']:
+        sys.exit('用法: python -m static_assets build [static 目录]')
+    build(sys.argv[2] if len(sys.argv) > 2 else 'static')
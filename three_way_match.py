@@ -0,0 +1,358 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+
+# 数量、金额比较的容差
+QUANTITY_TOLERANCE = 0.001
+AMOUNT_TOLERANCE = 0.01
+
+# 不参与对账的采购单状态
+EXCLUDED_ORDER_STATUSES = ('草稿', '已取消')
+
+MATCHED = '已匹配'
+
+# 出库时直接扣减 inbound_records.quantity，该列是剩余库存；实收数量需加回已出库数量
+SHIPPED_OUTBOUND_STATUS = '已出库'
+
+
+def init_match_tables(conn):
+    """创建对账结果表和对账运行记录表"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS purchase_match_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL,
+        match_type TEXT NOT NULL,  -- 'line' 收货明细、'invoice' 发票、'payment' 收据付款
+        order_id TEXT,
+        item_name TEXT,
+        supplier_id TEXT,
+        document_no TEXT,
+        expected_quantity REAL,
+        actual_quantity REAL,
+        expected_amount REAL,
+        actual_amount REAL,
+        variance REAL,
+        status TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS purchase_match_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mode TEXT NOT NULL,  -- 'full' 或 'incremental'
+        date_from DATE,
+        date_to DATE,
+        watermark TIMESTAMP NOT NULL,
+        orders_checked INTEGER DEFAULT 0,
+        results INTEGER DEFAULT 0,
+        exceptions INTEGER DEFAULT 0,
+        elapsed_seconds REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_purchase_match_results_order_id ON purchase_match_results(order_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_purchase_match_results_document_no ON purchase_match_results(document_no)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_purchase_match_results_status ON purchase_match_results(status)')
+
+
+def split_related_orders(related_orders):
+    return [order_id.strip() for order_id in (related_orders or '').split(',') if order_id.strip()]
+
+
+# 三单匹配引擎
+class ThreeWayMatcher:
+    """采购单、入库单、发票/收据三单匹配：每类单据一次查询载入，在内存中按单号和物料做哈希连接"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def last_watermark(self):
+        row = self.conn.execute('SELECT MAX(watermark) FROM purchase_match_runs').fetchone()
+        return row[0] if row and row[0] else '1970-01-01 00:00:00'
+
+    def run(self, date_from=None, date_to=None, incremental=False):
+        """执行对账。incremental=True 时只重新匹配上次运行后有新单据的采购单"""
+        started = time.perf_counter()
+        # created_at 使用 CURRENT_TIMESTAMP（UTC），水位线保持一致
+        watermark = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        cursor = self.conn.cursor()
+        init_match_tables(self.conn)
+
+        # 本次需要匹配的采购单号放入临时表，三类单据的查询都与它连接
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS match_orders (order_id TEXT PRIMARY KEY)')
+        cursor.execute('DELETE FROM temp.match_orders')
+
+        if incremental:
+            since = self.last_watermark()
+            cursor.execute('''
+                INSERT OR IGNORE INTO temp.match_orders
+                SELECT order_id FROM purchase_orders WHERE created_at >= ?
+                UNION
+                SELECT purchase_no FROM inbound_records WHERE created_at >= ?
+            ''', (since, since))
+            new_invoices = cursor.execute(
+                'SELECT related_orders FROM purchase_invoices WHERE created_at >= ?', (since,)).fetchall()
+        else:
+            cursor.execute('''
+                INSERT OR IGNORE INTO temp.match_orders
+                SELECT order_id FROM purchase_orders WHERE order_date BETWEEN ? AND ?
+                UNION
+                SELECT purchase_no FROM inbound_records WHERE date(inbound_time) BETWEEN ? AND ?
+            ''', (date_from, date_to, date_from, date_to))
+            new_invoices = cursor.execute(
+                'SELECT related_orders FROM purchase_invoices WHERE invoice_date BETWEEN ? AND ?',
+                (date_from, date_to)).fetchall()
+
+        cursor.executemany('INSERT OR IGNORE INTO temp.match_orders VALUES (?)', [
+            (order_id,) for row in new_invoices for order_id in split_related_orders(row[0])
+        ])
+
+        order_lines, orders = self._load_order_lines(cursor)
+        received = self._load_inbound(cursor)
+        invoices, invoiced_by_supplier = self._load_invoices(cursor, orders, date_to)
+        receipts = self._load_receipts(cursor, orders, date_to)
+
+        results = []
+        results.extend(self._match_lines(order_lines, orders, received))
+        results.extend(self._match_invoices(orders, order_lines, received, invoices))
+        results.extend(self._match_payments(invoiced_by_supplier, receipts))
+
+        # 替换这些采购单及相关发票的旧结果，未涉及的历史结果保持不变
+        cursor.execute('INSERT INTO purchase_match_runs (mode, date_from, date_to, watermark) VALUES (?, ?, ?, ?)',
+                       ('incremental' if incremental else 'full', date_from, date_to, watermark))
+        run_id = cursor.lastrowid
+        cursor.execute('DELETE FROM purchase_match_results WHERE order_id IN (SELECT order_id FROM temp.match_orders)')
+        cursor.executemany('DELETE FROM purchase_match_results WHERE match_type = ? AND document_no = ?',
+                           [('invoice', invoice['invoice_id']) for invoice in invoices] +
+                           [('payment', result['document_no']) for result in results if result['match_type'] == 'payment'])
+        cursor.executemany('''
+            INSERT INTO purchase_match_results (
+                run_id, match_type, order_id, item_name, supplier_id, document_no,
+                expected_quantity, actual_quantity, expected_amount, actual_amount, variance, status
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            run_id, r['match_type'], r.get('order_id'), r.get('item_name'), r.get('supplier_id'), r.get('document_no'),
+            r.get('expected_quantity'), r.get('actual_quantity'), r.get('expected_amount'), r.get('actual_amount'),
+            r.get('variance'), r['status']
+        ) for r in results])
+
+        exceptions = sum(1 for r in results if r['status'] != MATCHED)
+        elapsed = round(time.perf_counter() - started, 3)
+        cursor.execute('''
+            UPDATE purchase_match_runs
+            SET orders_checked = ?, results = ?, exceptions = ?, elapsed_seconds = ?
+            WHERE id = ?
+        ''', (len(orders), len(results), exceptions, elapsed, run_id))
+        self.conn.commit()
+
+        return {
+            'run_id': run_id,
+            'mode': 'incremental' if incremental else 'full',
+            'orders_checked': len(orders),
+            'results': len(results),
+            'exceptions': exceptions,
+            'elapsed_seconds': elapsed
+        }
+
+    def _load_order_lines(self, cursor):
+        """一次查询载入采购单明细，返回 {(单号, 物料): 明细} 和 {单号: 采购单}"""
+        placeholders = ','.join('?' * len(EXCLUDED_ORDER_STATUSES))
+        rows = cursor.execute(f'''
+            SELECT po.order_id, po.supplier_id, po.order_date, po.status,
+                   poi.item_name, poi.quantity, poi.unit_price, poi.total_price
+            FROM temp.match_orders m
+            JOIN purchase_orders po ON po.order_id = m.order_id
+            LEFT JOIN purchase_order_items poi ON poi.order_id = po.order_id
+            WHERE po.status NOT IN ({placeholders})
+        ''', EXCLUDED_ORDER_STATUSES).fetchall()
+
+        order_lines = {}
+        orders = {}
+        for order_id, supplier_id, order_date, status, item_name, quantity, unit_price, total_price in rows:
+            order = orders.setdefault(order_id, {
+                'order_id': order_id, 'supplier_id': supplier_id, 'order_date': order_date,
+                'status': status, 'amount': 0.0
+            })
+            if item_name is None:
+                continue
+            line = order_lines.setdefault((order_id, item_name), {
+                'quantity': 0.0, 'amount': 0.0, 'unit_price': float(unit_price or 0)
+            })
+            line['quantity'] += float(quantity or 0)
+            amount = float(total_price) if total_price is not None else float(quantity or 0) * float(unit_price or 0)
+            line['amount'] += amount
+            order['amount'] += amount
+        return order_lines, orders
+
+    def _load_inbound(self, cursor):
+        """两次查询载入质检合格的入库记录和其已出库数量，按 (单号, 物料) 汇总实收数量"""
+        rows = cursor.execute('''
+            SELECT ir.purchase_no, ir.item_name, ir.inbound_no, ir.quantity
+            FROM inbound_records ir
+            JOIN temp.match_orders m ON m.order_id = ir.purchase_no
+            WHERE ir.quality_check = 1
+        ''').fetchall()
+        shipped = {(inbound_no, item_name): quantity for inbound_no, item_name, quantity in cursor.execute('''
+            SELECT o.inbound_no, o.item_name, SUM(o.quantity)
+            FROM outbound_records o
+            WHERE o.inbound_no IN (
+                SELECT ir.inbound_no FROM inbound_records ir
+                JOIN temp.match_orders m ON m.order_id = ir.purchase_no
+            ) AND +o.status = ?
+            GROUP BY o.inbound_no, o.item_name
+        ''', (SHIPPED_OUTBOUND_STATUS,))}
+
+        received = {}
+        for purchase_no, item_name, inbound_no, quantity in rows:
+            entry = received.setdefault((purchase_no, item_name), {'quantity': 0.0, 'inbound_nos': set()})
+            # 剩余库存加上该批次已出库的数量；同一批次同一物料的出库只计一次
+            entry['quantity'] += float(quantity or 0) + float(shipped.pop((inbound_no, item_name), None) or 0)
+            entry['inbound_nos'].add(inbound_no)
+        return received
+
+    def _earliest_order_date(self, orders):
+        # 发票和收据不会早于采购日期，以此限定载入范围
+        return min((order['order_date'] for order in orders.values() if order['order_date']), default='1970-01-01')
+
+    def _load_invoices(self, cursor, orders, date_to=None):
+        """一次查询载入本批最早采购日期到 date_to 之间的发票，返回关联本批采购单的发票和本批供应商的开票总额"""
+        if not orders:
+            return [], {}
+        supplier_ids = {order['supplier_id'] for order in orders.values()}
+        rows = cursor.execute('''
+            SELECT invoice_id, supplier_id, total_amount, related_orders
+            FROM purchase_invoices
+            WHERE status != '已作废' AND invoice_date >= ? AND (? IS NULL OR invoice_date <= ?)
+        ''', (self._earliest_order_date(orders), date_to, date_to)).fetchall()
+
+        invoices = []
+        invoiced_by_supplier = defaultdict(float)
+        for invoice_id, supplier_id, total_amount, related_orders in rows:
+            if supplier_id in supplier_ids:
+                invoiced_by_supplier[supplier_id] += float(total_amount or 0)
+            order_ids = split_related_orders(related_orders)
+            if any(order_id in orders for order_id in order_ids):
+                invoices.append({
+                    'invoice_id': invoice_id, 'supplier_id': supplier_id,
+                    'amount': float(total_amount or 0), 'order_ids': order_ids
+                })
+        return invoices, invoiced_by_supplier
+
+    def _load_receipts(self, cursor, orders, date_to=None):
+        """一次查询载入本批供应商开具的收据，按供应商汇总金额；与发票使用相同的日期范围"""
+        supplier_ids = {order['supplier_id'] for order in orders.values()}
+        if not supplier_ids:
+            return {}
+        earliest = self._earliest_order_date(orders)
+        rows = cursor.execute('''
+            SELECT issuing_party_id, receipt_number, amount
+            FROM purchase_receipts
+            WHERE issuing_party_type = 'supplier' AND status != '已作废'
+              AND receipt_date >= ? AND (? IS NULL OR receipt_date <= ?)
+        ''', (earliest, date_to, date_to)).fetchall()
+
+        receipts = {}
+        for supplier_id, receipt_number, amount in rows:
+            if supplier_id in supplier_ids:
+                entry = receipts.setdefault(supplier_id, {'amount': 0.0, 'receipt_numbers': []})
+                entry['amount'] += float(amount or 0)
+                entry['receipt_numbers'].append(receipt_number)
+        return receipts
+
+    def _match_lines(self, order_lines, orders, received):
+        """采购明细与入库记录：比较订货数量和合格入库数量"""
+        results = []
+        for (order_id, item_name), line in order_lines.items():
+            entry = received.get((order_id, item_name))
+            actual = entry['quantity'] if entry else 0.0
+            variance = round(actual - line['quantity'], 3)
+            if not entry:
+                status = '未入库'
+            elif abs(variance) <= QUANTITY_TOLERANCE:
+                status = MATCHED
+            else:
+                status = '数量差异'
+            results.append({
+                'match_type': 'line', 'order_id': order_id, 'item_name': item_name,
+                'supplier_id': orders[order_id]['supplier_id'],
+                'document_no': ','.join(sorted(entry['inbound_nos'])) if entry else None,
+                'expected_quantity': line['quantity'], 'actual_quantity': actual,
+                'expected_amount': round(line['amount'], 2),
+                'actual_amount': round(actual * line['unit_price'], 2),
+                'variance': variance, 'status': status
+            })
+
+        # 入库了采购单中没有的物料，或采购单不存在
+        for (order_id, item_name), entry in received.items():
+            if (order_id, item_name) in order_lines:
+                continue
+            results.append({
+                'match_type': 'line', 'order_id': order_id, 'item_name': item_name,
+                'supplier_id': orders[order_id]['supplier_id'] if order_id in orders else None,
+                'document_no': ','.join(sorted(entry['inbound_nos'])),
+                'expected_quantity': 0.0, 'actual_quantity': entry['quantity'],
+                'variance': entry['quantity'],
+                'status': '无采购明细' if order_id in orders else '无有效采购单'
+            })
+        return results
+
+    def _match_invoices(self, orders, order_lines, received, invoices):
+        """发票与收货金额：发票金额应等于合格入库数量乘以订单单价"""
+        received_value = defaultdict(float)
+        for (order_id, item_name), line in order_lines.items():
+            entry = received.get((order_id, item_name))
+            if entry:
+                received_value[order_id] += entry['quantity'] * line['unit_price']
+
+        results = []
+        invoiced_orders = set()
+        for invoice in invoices:
+            order_ids = [order_id for order_id in invoice['order_ids'] if order_id in orders]
+            invoiced_orders.update(order_ids)
+            expected = round(sum(received_value[order_id] for order_id in order_ids), 2)
+            ordered = round(sum(orders[order_id]['amount'] for order_id in order_ids), 2)
+            variance = round(invoice['amount'] - expected, 2)
+            if any(orders[order_id]['supplier_id'] != invoice['supplier_id'] for order_id in order_ids):
+                status = '供应商不一致'
+            elif abs(variance) <= AMOUNT_TOLERANCE:
+                status = MATCHED
+            elif abs(invoice['amount'] - ordered) <= AMOUNT_TOLERANCE:
+                status = '按订单开票未全部入库'
+            else:
+                status = '金额差异'
+            results.append({
+                'match_type': 'invoice', 'order_id': order_ids[0] if len(order_ids) == 1 else None,
+                'supplier_id': invoice['supplier_id'], 'document_no': invoice['invoice_id'],
+                'expected_amount': expected, 'actual_amount': invoice['amount'],
+                'variance': variance, 'status': status
+            })
+
+        # 已收货但没有发票的采购单
+        for order_id, order in orders.items():
+            if order_id in invoiced_orders or received_value[order_id] <= 0:
+                continue
+            results.append({
+                'match_type': 'invoice', 'order_id': order_id, 'supplier_id': order['supplier_id'],
+                'expected_amount': round(received_value[order_id], 2), 'actual_amount': 0.0,
+                'variance': -round(received_value[order_id], 2), 'status': '未开票'
+            })
+        return results
+
+    def _match_payments(self, invoiced, receipts):
+        """收据只记录开具供应商，按供应商比较同一时间范围内的收据金额与发票金额"""
+        results = []
+        for supplier_id in set(invoiced) | set(receipts):
+            paid = receipts.get(supplier_id, {'amount': 0.0, 'receipt_numbers': []})
+            variance = round(paid['amount'] - invoiced[supplier_id], 2)
+            if abs(variance) <= AMOUNT_TOLERANCE:
+                status = MATCHED
+            elif paid['amount'] == 0:
+                status = '未付款'
+            else:
+                status = '付款差异'
+            results.append({
+                'match_type': 'payment', 'supplier_id': supplier_id,
+                'document_no': f'SUPPLIER:{supplier_id}',
+                'expected_amount': round(invoiced[supplier_id], 2), 'actual_amount': round(paid['amount'], 2),
+                'variance': variance, 'status': status
+            })
+        return results
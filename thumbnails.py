@@ -0,0 +1,179 @@
+# 图片缩略图：上传后在进程池中生成多种宽度的 WebP/JPEG 缩略图，模板通过 responsive_image 输出 <picture>，
+# 平板等小屏设备按需下载合适尺寸。缩略图与原图同目录，放在 thumbs/ 子目录下：
+#   uploads/menu/abc.jpg -> uploads/menu/thumbs/abc-320.webp、uploads/menu/thumbs/abc-320.jpg
+#
+# 为已有图片补生成缩略图：python -m thumbnails backfill [目录 ...]（相对 static/，默认 uploads/menu 和 images）
+import os
+import sys
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = 'static'
+THUMB_DIR = 'thumbs'
+# 缩略图宽度（像素），不放大小于该宽度的原图
+SIZES = (160, 320, 640)
+# 默认展示的宽度，对应 <img> 的 src
+DEFAULT_SIZE = 320
+FORMATS = (('webp', '.webp', 'image/webp'), ('jpeg', '.jpg', 'image/jpeg'))
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+BACKFILL_DIRS = ('uploads/menu', 'images')
+# 缩略图是 CPU 密集任务，进程数不宜超过核数，避免挤占处理请求的工作进程
+MAX_WORKERS = max(1, min(2, os.cpu_count() or 1))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def thumbnail_path(image_path, size, ext):
+    """原图相对路径 -> 缩略图相对路径（均相对 static 目录，使用 / 分隔）"""
+    directory, filename = os.path.split(image_path)
+    base = os.path.splitext(filename)[0]
+    return '/'.join(part for part in (directory, THUMB_DIR, f'{base}-{size}{ext}') if part)
+
+
+def generate_thumbnails(image_path, static_dir=STATIC_DIR, sizes=SIZES):
+    """生成一张图片的全部缩略图，返回生成的相对路径；在进程池的子进程中执行"""
+    from PIL import Image, ImageOps
+
+    source = os.path.join(static_dir, image_path)
+    generated = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        os.makedirs(os.path.join(os.path.dirname(source), THUMB_DIR), exist_ok=True)
+        for size in sizes:
+            width = min(size, image.width)
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS) if width < image.width else image
+            for fmt, ext, _ in FORMATS:
+                relative = thumbnail_path(image_path, size, ext)
+                target = os.path.join(static_dir, relative)
+                if fmt == 'jpeg':
+                    # JPEG 不支持透明，透明区域铺白底
+                    flattened = resized
+                    if has_alpha:
+                        flattened = Image.new('RGB', resized.size, (255, 255, 255))
+                        flattened.paste(resized, mask=resized.getchannel('A'))
+                    flattened.save(target + '.tmp', 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                else:
+                    resized.save(target + '.tmp', 'WEBP', quality=WEBP_QUALITY, method=4)
+                os.replace(target + '.tmp', target)
+                generated.append(relative)
+    return generated
+
+
+def remove_thumbnails(image_path, static_dir=STATIC_DIR, sizes=SIZES):
+    for size in sizes:
+        for _, ext, _ in FORMATS:
+            path = os.path.join(static_dir, thumbnail_path(image_path, size, ext))
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def get_executor():
+    """按进程懒加载进程池：gunicorn 预加载后 fork 出的工作进程各自创建，不继承父进程的池"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _log_result(image_path):
+    def callback(future):
+        error = future.exception()
+        if error is not None:
+            logger.error("生成缩略图失败 %s: %s", image_path, error)
+        else:
+            logger.debug("已生成缩略图 %s: %s 个文件", image_path, len(future.result()))
+    return callback
+
+
+def submit(image_path, static_dir=STATIC_DIR):
+    """上传后调用：在后台进程生成缩略图，不阻塞请求；生成完成前页面使用原图"""
+    future = get_executor().submit(generate_thumbnails, image_path, static_dir)
+    future.add_done_callback(_log_result(image_path))
+    return future
+
+
+def _is_up_to_date(image_path, static_dir):
+    source = os.path.join(static_dir, image_path)
+    newest = os.path.join(static_dir, thumbnail_path(image_path, SIZES[-1], FORMATS[-1][1]))
+    return os.path.exists(newest) and os.path.getmtime(newest) >= os.path.getmtime(source)
+
+
+def backfill(directories=BACKFILL_DIRS, static_dir=STATIC_DIR, force=False):
+    """为目录下已有的图片生成缩略图（跳过已是最新的），返回 (处理数, 失败数)"""
+    images = []
+    for directory in directories:
+        root = os.path.join(static_dir, directory)
+        if not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            relative = f'{directory}/{name}'
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS or not os.path.getsize(os.path.join(root, name)):
+                continue
+            if force or not _is_up_to_date(relative, static_dir):
+                images.append(relative)
+
+    failed = 0
+    futures = {get_executor().submit(generate_thumbnails, image, static_dir): image for image in images}
+    for future, image in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            failed += 1
+            logger.error("生成缩略图失败 %s: %s", image, e)
+    logger.info("缩略图补生成完成：%s 张图片，失败 %s 张", len(images), failed)
+    return len(images), failed
+
+
+def responsive_image(image_path, alt='', sizes=f'{DEFAULT_SIZE}px', css_class='', static_dir=STATIC_DIR):
+    """模板中使用：{{ responsive_image(item.image_path, item.item_name, sizes='(max-width: 768px) 50vw, 320px') }}
+
+    缩略图还没生成（或原图不是图片）时输出普通的 <img>。
+    """
+    if not image_path:
+        return Markup('')
+    attributes = f'alt="{escape(alt)}" loading="lazy" decoding="async"'
+    if css_class:
+        attributes += f' class="{escape(css_class)}"'
+    if not os.path.exists(os.path.join(static_dir, thumbnail_path(image_path, SIZES[0], FORMATS[-1][1]))):
+        return Markup(f'<img src="{escape(url_for("static", filename=image_path))}" {attributes}>')
+
+    sources = []
+    for fmt, ext, mimetype in FORMATS:
+        srcset = ', '.join(f'{url_for("static", filename=thumbnail_path(image_path, size, ext))} {size}w'
+                           for size in SIZES)
+        sources.append((mimetype, srcset))
+    fallback = url_for('static', filename=thumbnail_path(image_path, DEFAULT_SIZE, FORMATS[-1][1]))
+    webp_type, webp_srcset = sources[0]
+    return Markup(
+        f'<picture><source type="{webp_type}" srcset="{escape(webp_srcset)}" sizes="{escape(sizes)}">'
+        f'<img src="{escape(fallback)}" srcset="{escape(sources[-1][1])}" sizes="{escape(sizes)}" {attributes}>'
+        f'</picture>'
+    )
+
+
+def init_app(app):
+    app.add_template_global(responsive_image, 'responsive_image')
+
+
+if __name__ == '__main__':
+    import log_config
+    log_config.configure_logging()
+    if sys.argv[1:2] != ['backfill']:
+        sys.exit('用法: python -m thumbnails backfill [目录 ...]')
+    _, failed_count = backfill(sys.argv[2:] or BACKFILL_DIRS)
+    sys.exit(1 if failed_count else 0)